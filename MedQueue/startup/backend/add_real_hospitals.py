@@ -13,6 +13,7 @@ sys.path.insert(0, BASE_DIR)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medqueue_project.settings')
 django.setup()
 
+from appointments import seeding
 from appointments.models import Hospital, Doctor
 
 # ── Данные больниц ────────────────────────────────────────────────────────────
@@ -349,32 +350,20 @@ def run():
         cursor.execute("DELETE FROM sqlite_sequence WHERE name='appointments_doctor'")
 
     print('🏥  Создаём больницы и врачей...\n')
-    for h_data in HOSPITALS:
-        hospital = Hospital.objects.create(
-            name=h_data['name'],
-            type=h_data['type'],
-            address=h_data['address'],
-            phone=h_data.get('phone', ''),
-            description=h_data.get('description', ''),
-            latitude=h_data.get('latitude'),
-            longitude=h_data.get('longitude'),
-            waiting_time=h_data.get('waiting_time', 10),
-            is_active=True,
-        )
-
-        doctors_data = DOCTORS_BY_HOSPITAL.get(h_data['name'], [])
-        for (full_name, specialty, cabinet, work_days, work_hours) in doctors_data:
-            Doctor.objects.create(
-                hospital=hospital,
-                full_name=full_name,
-                specialty=specialty,
-                cabinet=cabinet,
-                work_days=work_days,
-                work_hours=work_hours,
-                is_active=True,
-            )
+    # Пачками через appointments.seeding: INSERT на сотни строк вместо
+    # отдельного запроса (и транзакции) на каждую больницу и врача
+    hospitals = seeding.load_hospitals([{**h_data, 'is_active': True} for h_data in HOSPITALS])
+    doctors = seeding.load_doctors([
+        dict(hospital=hospital_name, full_name=full_name, specialty=specialty,
+             cabinet=cabinet, work_days=work_days, work_hours=work_hours, is_active=True)
+        for hospital_name, doctors_data in DOCTORS_BY_HOSPITAL.items()
+        for (full_name, specialty, cabinet, work_days, work_hours) in doctors_data
+    ])
 
-        print(f'  ✅  {hospital.name} ({hospital.type}) — врачей: {len(doctors_data)}')
+    for h_data in HOSPITALS:
+        doctors_count = len(DOCTORS_BY_HOSPITAL.get(h_data['name'], []))
+        print(f'  ✅  {h_data["name"]} ({h_data["type"]}) — врачей: {doctors_count}')
+    print(f'\n⏱   {hospitals}\n⏱   {doctors}')
 
     total_h = Hospital.objects.count()
     total_d = Doctor.objects.count()
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Hospital, Appointment, VerificationCode, PasswordResetCode, Doctor, DoctorInviteCode, UserProfile
+from .models import (
+    Hospital, Appointment, VerificationCode, PasswordResetCode, Doctor, DoctorInviteCode, UserProfile,
+    OutboundEmail, DoctorSchedule, SlotHold,
+)
 
 
 @admin.register(DoctorInviteCode)
@@ -51,6 +54,9 @@ class HospitalAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_queue_counts()
+
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -112,16 +118,16 @@ class AppointmentAdmin(admin.ModelAdmin):
 @admin.register(VerificationCode)
 class VerificationCodeAdmin(admin.ModelAdmin):
     """Админка для кодов верификации"""
-    list_display = ['email', 'code', 'name', 'created_at']
-    readonly_fields = ['created_at']
+    list_display = ['email', 'code', 'name', 'created_at', 'expires_at']
+    readonly_fields = ['created_at', 'expires_at']
     search_fields = ['email', 'name']
 
 
 @admin.register(PasswordResetCode)
 class PasswordResetCodeAdmin(admin.ModelAdmin):
     """Коды сброса пароля"""
-    list_display = ['email', 'code', 'created_at', 'is_expired_display']
-    readonly_fields = ['created_at']
+    list_display = ['email', 'code', 'created_at', 'expires_at', 'is_expired_display']
+    readonly_fields = ['created_at', 'expires_at']
     search_fields = ['email']
     ordering = ['-created_at']
 
@@ -131,9 +137,16 @@ class PasswordResetCodeAdmin(admin.ModelAdmin):
     is_expired_display.boolean = True
 
 
+class DoctorScheduleInline(admin.TabularInline):
+    """Структурное расписание; пересобирается при изменении текстовых полей"""
+    model = DoctorSchedule
+    extra = 0
+
+
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     """Админка для врачей"""
+    inlines = [DoctorScheduleInline]
     list_display = ['full_name', 'specialty', 'hospital', 'cabinet', 'work_days', 'work_hours', 'current_queue', 'is_active']
     list_filter = ['specialty', 'hospital', 'is_active']
     search_fields = ['full_name', 'hospital__name']
@@ -145,4 +158,33 @@ class DoctorAdmin(admin.ModelAdmin):
         ('Расписание', {
             'fields': ('work_days', 'work_hours', 'is_active')
         }),
-    )
\ No newline at end of file
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('hospital').with_queue_counts()
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """Очередь исходящих писем (отправляет appointments/mailer.py)"""
+    list_display  = ['to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter   = ['status']
+    search_fields = ['to_email', 'subject']
+    readonly_fields = ['created_at', 'sent_at', 'claim', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Отправить повторно')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'Писем в очереди: {updated}')
+
+
+@admin.register(SlotHold)
+class SlotHoldAdmin(admin.ModelAdmin):
+    """Занятое время врачей: записи и временные брони"""
+    list_display  = ['doctor', 'slot', 'appointment', 'expires_at', 'client', 'created_at']
+    list_filter   = ['doctor__hospital']
+    search_fields = ['doctor__full_name', 'appointment__code']
+    raw_id_fields = ['doctor', 'appointment']
+    readonly_fields = ['token', 'created_at']
@@ -0,0 +1,275 @@
+"""
+ИИ-ассистент МедAi для /api/ai/chat/.
+
+Провайдеры (settings.AI_PROVIDERS) — OpenAI-совместимые API: Kimi-K2 через
+HuggingFace Router и Gemini через его OpenAI-совместимый эндпоинт. Клиент
+каждого провайдера создаётся один раз на процесс и держит пул соединений.
+
+Ответ стримится по токенам. Первый провайдер стартует сразу; если он не
+прислал ни одного токена за AI_HEDGE_DELAY, параллельно стартует следующий,
+и ответ берётся у того, кто заговорит первым (остальные останавливаются).
+Если никто не ответил за AI_FIRST_TOKEN_DEADLINE — правило-ориентированный
+fallback. Весь ответ ограничен AI_STREAM_DEADLINE.
+
+Ответы на вопросы без истории диалога кэшируются по нормализованному тексту.
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .fallback import fallback_reply
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT_AI = (
+    'Ты — МедAi, дружелюбный ИИ-ассистент медицинского портала MedQueue (г. Алматы). '
+    'Помогаешь пациентам: разбираться с записью к врачу, подсказываешь к какому '
+    'специалисту обратиться, отвечаешь на общие медицинские вопросы. '
+    'Отвечай коротко (2-4 предложения), по-русски, дружелюбно. '
+    'Всегда заканчивай советом обратиться к врачу для точного диагноза. '
+    'Не ставь диагнозы и не выписывай рецепты.'
+)
+
+CACHE_PREFIX = 'medqueue:ai:answer'
+HISTORY_LIMIT = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_executor():
+    """
+    Потоки для запросов к провайдерам (view только читает очередь токенов).
+    Пул создаётся при первом запросе, размер — AI_EXECUTOR_WORKERS.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_setting('AI_EXECUTOR_WORKERS', 16),
+                                               thread_name_prefix='medqueue-ai')
+    return _executor
+
+
+def provider_timeout(provider):
+    """
+    Таймаут запроса к провайдеру: ключ 'timeout' в AI_PROVIDERS или
+    AI_PROVIDER_TIMEOUT. Отмена проверяется только между строками стрима,
+    поэтому зависший провайдер держит поток пула не дольше этого времени.
+    """
+    return provider.get('timeout', _setting('AI_PROVIDER_TIMEOUT', 10))
+
+
+def get_client(provider):
+    """OpenAI-клиент провайдера, один на процесс (keep-alive пул внутри)"""
+    key = (provider['base_url'], provider['api_key'])
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(
+                    base_url=provider['base_url'],
+                    api_key=provider['api_key'],
+                    timeout=_setting('AI_STREAM_DEADLINE', 30),
+                    max_retries=0,  # повтор заменяет хеджирование на другого провайдера
+                )
+                _clients[key] = client
+    return client
+
+
+def active_providers():
+    return [p for p in _setting('AI_PROVIDERS', []) if p.get('api_key')]
+
+
+def normalize(text):
+    """Ключ кэша: регистр, пунктуация и лишние пробелы не важны"""
+    text = text.lower().replace('ё', 'е')
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def cache_key(message):
+    return f'{CACHE_PREFIX}:{hashlib.sha256(normalize(message).encode()).hexdigest()}'
+
+
+def build_messages(message, history):
+    """
+    История из браузера уже содержит текущий вопрос последним элементом —
+    убираем его, чтобы не отправлять дважды.
+    """
+    turns = []
+    for item in history or []:
+        if not isinstance(item, dict):
+            continue
+        role = item.get('role', 'user')
+        if role not in ('user', 'assistant'):
+            role = 'user'
+        content = item.get('content') or item.get('text', '')
+        if content:
+            turns.append({'role': role, 'content': content})
+    if turns and turns[-1] == {'role': 'user', 'content': message}:
+        turns.pop()
+    turns = turns[-HISTORY_LIMIT:]
+    return [{'role': 'system', 'content': SYSTEM_PROMPT_AI}, *turns, {'role': 'user', 'content': message}]
+
+
+def _run_provider(provider, messages, events, cancelled):
+    """Читает стрим провайдера и кладёт ('chunk'|'done'|'error', имя, данные) в events"""
+    name = provider['name']
+    try:
+        # Разбираем SSE сами и дочитываем тело до конца: так соединение
+        # возвращается в пул клиента, а не закрывается после [DONE]
+        with get_client(provider).chat.completions.with_streaming_response.create(
+            model=provider['model'],
+            messages=messages,
+            max_tokens=512,
+            temperature=0.7,
+            stream=True,
+            timeout=provider_timeout(provider),
+        ) as response:
+            for line in response.iter_lines():
+                if cancelled.is_set():
+                    return
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    continue
+                choices = json.loads(data).get('choices') or []
+                text = choices[0].get('delta', {}).get('content') if choices else None
+                if text:
+                    events.put(('chunk', name, text))
+        events.put(('done', name, None))
+    except Exception as e:
+        events.put(('error', name, e))
+
+
+class Answer:
+    """Итерируемый ответ: отдаёт куски текста, после окончания заполнены model и text"""
+
+    def __init__(self, message, history=None, fallback=fallback_reply):
+        self.message  = message
+        self.messages = build_messages(message, history)
+        self.fallback = fallback
+        self.model    = None
+        self.parts    = []
+        self.cacheable = len(self.messages) == 2  # только системный промпт и вопрос
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+    def __iter__(self):
+        for part in self._generate():
+            self.parts.append(part)
+            yield part
+
+    def _generate(self):
+        if self.cacheable:
+            cached = cache.get(cache_key(self.message))
+            if cached is not None:
+                self.model = cached['model']
+                metrics.ai_answers.inc(source='cache')
+                yield cached['reply']
+                return
+
+        providers = active_providers()
+        if providers:
+            yield from self._race(providers)
+        if self.model is None:
+            self.model = 'fallback'
+            yield self.fallback(self.message)['reply']
+        metrics.ai_answers.inc(source=self.model)
+
+    def _race(self, providers):
+        hedge_delay = _setting('AI_HEDGE_DELAY', 1.5)
+        started = time.monotonic()
+        first_token_deadline = started + _setting('AI_FIRST_TOKEN_DEADLINE', 8)
+        stream_deadline = started + _setting('AI_STREAM_DEADLINE', 30)
+
+        events = queue.Queue()
+        cancelled = {}
+        launched = {}  # провайдер → когда стартовал, для времени до первого токена
+        pending = list(providers)
+        running = set()
+        winner = None
+
+        def launch():
+            provider = pending.pop(0)
+            cancelled[provider['name']] = threading.Event()
+            launched[provider['name']] = time.monotonic()
+            running.add(provider['name'])
+            get_executor().submit(_run_provider, provider, self.messages, events, cancelled[provider['name']])
+            return time.monotonic() + hedge_delay
+
+        next_hedge = launch()
+        try:
+            while True:
+                now = time.monotonic()
+                if winner is None:
+                    if pending and (now >= next_hedge or not running):
+                        next_hedge = launch()
+                        continue
+                    if not running or now >= first_token_deadline:
+                        logger.warning('ИИ-провайдеры не ответили вовремя, используется fallback')
+                        return
+                    wait_until = min(first_token_deadline, next_hedge if pending else first_token_deadline)
+                else:
+                    if now >= stream_deadline:
+                        logger.warning('Ответ %s обрезан по таймауту', winner)
+                        self.cacheable = False
+                        return
+                    wait_until = stream_deadline
+
+                try:
+                    kind, name, data = events.get(timeout=max(0.0, wait_until - now))
+                except queue.Empty:
+                    continue
+
+                if winner is not None and name != winner:
+                    continue
+                if kind == 'error':
+                    running.discard(name)
+                    metrics.ai_provider_errors.inc(provider=name)
+                    logger.warning('ИИ-провайдер %s: %s', name, data)
+                    if winner is not None:
+                        self.cacheable = False  # оборвался посреди ответа
+                        return
+                elif kind == 'chunk':
+                    if winner is None:
+                        winner = self.model = name
+                        metrics.ai_first_token_seconds.observe(time.monotonic() - launched[name], provider=name)
+                        for other, event in cancelled.items():
+                            if other != name:
+                                event.set()
+                    yield data
+                elif kind == 'done':
+                    running.discard(name)
+                    if winner == name:
+                        if self.cacheable and self.parts:
+                            cache.set(cache_key(self.message),
+                                      {'reply': self.text, 'model': self.model},
+                                      _setting('AI_CACHE_TIMEOUT', 3600))
+                        return
+        finally:
+            for event in cancelled.values():
+                event.set()
@@ -0,0 +1,9 @@
+"""
+Нагрузочный бенчмарк API: python manage.py bench_api.
+
+data   — синтетические больницы, врачи, пациенты и записи нужного объёма;
+runner — параллельный прогон горячих эндпоинтов и отчёт (p50/p95/p99,
+         запросы к БД на ответ, пропускная способность) в JSON, который
+         можно сравнивать между коммитами;
+database — отдельная БД бенчмарка (её же использует bench_codes).
+"""
@@ -0,0 +1,189 @@
+"""
+Синтетические данные для бенчмарка: больницы, врачи, пациенты, записи.
+
+Объём задаёт Scale. Больницы, врачи и записи пишутся загрузчиками
+appointments.seeding, так что очереди, брони слотов и статистика такие же,
+как после записи через API. Случайность задаётся seed: два прогона на
+разных коммитах работают с одинаковыми данными.
+
+Пациенты — пользователи patient<N> с профилем patient, у первых
+DOCTOR_ACCOUNTS врачей есть аккаунт портала (doctor<N>, инвайт-код с
+used_by), плюс администратор ADMIN_USERNAME. Пароль у всех PASSWORD.
+"""
+
+import datetime as dt
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .. import doctor_context, schedule, seeding
+from ..codes import invite_codes
+from ..models import SPECIALTIES_CHOICES, Doctor, DoctorInviteCode, Hospital, UserProfile
+
+Scale = namedtuple('Scale', 'hospitals doctors patients appointments')
+
+SCALES = {
+    'tiny':   Scale(3, 12, 20, 200),
+    'small':  Scale(50, 500, 2_000, 20_000),
+    'medium': Scale(500, 10_000, 50_000, 1_000_000),
+    'large':  Scale(2_000, 100_000, 500_000, 10_000_000),
+}
+
+DOCTOR_ACCOUNTS = 20
+ADMIN_USERNAME  = 'bench-admin'
+PASSWORD        = 'bench-password'
+EMAIL_DOMAIN    = 'bench.medqueue.local'
+
+# Записи лежат в окне [сегодня - DAYS_BACK, сегодня + DAYS_AHEAD]
+DAYS_BACK, DAYS_AHEAD = 14, 14
+
+CENTER = (43.238, 76.945)  # Алматы
+NAME_PREFIXES = {
+    'Поликлиника':   'Городская поликлиника',
+    'Больница':      'Городская больница',
+    'Детская':       'Детская поликлиника',
+    'Спец. клиника': 'Медицинский центр',
+}
+STREETS = ['пр. Абая', 'пр. Достык', 'ул. Толе би', 'ул. Жандосова', 'пр. Райымбека',
+           'ул. Сатпаева', 'пр. Аль-Фараби', 'ул. Тимирязева', 'мкр. Самал-2', 'ул. Розыбакиева']
+LAST_NAMES = ['Иванов', 'Ахметов', 'Ким', 'Сейткали', 'Петров', 'Нурланов', 'Смагулов',
+              'Ли', 'Оспанов', 'Жумабаев', 'Кузнецов', 'Исаев', 'Омаров', 'Абенов', 'Сидоров']
+FIRST_NAMES = ['Алия', 'Ерлан', 'Мария', 'Данияр', 'Айгерим', 'Сергей', 'Асель', 'Тимур',
+               'Дина', 'Арман', 'Жанар', 'Олег', 'Мадина', 'Руслан', 'Гульнара']
+WORK_DAYS  = ['Пн-Пт', 'Пн-Пт', 'Пн-Сб', 'Вт-Сб', 'Пн-Ср-Пт']
+WORK_HOURS = ['08:00-16:00', '09:00-17:00', '09:00-18:00', '14:00-20:00', '08:00-13:00']
+
+
+def resolve_scale(name, **overrides):
+    """Scale по имени пресета; ненулевые overrides заменяют отдельные объёмы"""
+    if name not in SCALES:
+        raise ValueError(f'Неизвестный масштаб {name!r}, есть: {", ".join(SCALES)}')
+    return SCALES[name]._replace(**{key: value for key, value in overrides.items() if value})
+
+
+def person_name(rng):
+    return f'{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}'
+
+
+def hospital_rows(count, rng):
+    types = [code for code, _ in Hospital.HOSPITAL_TYPES]
+    for number in range(1, count + 1):
+        kind = rng.choice(types)
+        yield {
+            'name': f'{NAME_PREFIXES[kind]} №{number}',
+            'type': kind,
+            'address': f'г. Алматы, {rng.choice(STREETS)}, {rng.randint(1, 300)}',
+            'phone': f'+7 727 {rng.randint(200, 399)} {rng.randint(10, 99)} {rng.randint(10, 99)}',
+            'latitude': round(rng.gauss(CENTER[0], 0.05), 6),
+            'longitude': round(rng.gauss(CENTER[1], 0.08), 6),
+            'waiting_time': rng.randint(5, 60),
+        }
+
+
+def doctor_rows(count, hospital_ids, rng):
+    """Врачи по больницам; номер в ФИО делает ключ (больница, ФИО, специальность) уникальным"""
+    specialties = [code for code, _ in SPECIALTIES_CHOICES]
+    for number in range(1, count + 1):
+        yield {
+            'hospital_id': rng.choice(hospital_ids),
+            'full_name': f'{person_name(rng)} ({number})',
+            'specialty': rng.choice(specialties),
+            'cabinet': str(rng.randint(100, 450)),
+            'work_days': rng.choice(WORK_DAYS),
+            'work_hours': rng.choice(WORK_HOURS),
+        }
+
+
+def shift(doctor):
+    """(рабочие дни, первый слот, число слотов) врача из текстового расписания"""
+    slot = schedule.default_slot_minutes()
+    days = schedule.parse_work_days(doctor.work_days)
+    start, end = schedule.parse_work_hours(doctor.work_hours)
+    first = -(-(start.hour * 60 + start.minute) // slot)
+    last = ((end.hour * 60 + end.minute) or schedule.DAY_MINUTES) // slot
+    return days, first, max(1, last - first)
+
+
+def appointment_rows(count, doctors, patients, rng, today=None):
+    """
+    Записи в окне DAYS_BACK/DAYS_AHEAD: прошедшие в основном завершены,
+    будущие подтверждены, часть отменена; ~80% к конкретному врачу в его
+    рабочий слот, ~60% от зарегистрированных пациентов.
+    """
+    today = today or timezone.localdate()
+    slot = dt.timedelta(minutes=schedule.default_slot_minutes())
+    shifts = [(doctor, shift(doctor)) for doctor in doctors]
+    for _ in range(count):
+        doctor, (days, first, slots) = rng.choice(shifts)
+        day = today + dt.timedelta(days=rng.randint(-DAYS_BACK, DAYS_AHEAD))
+        while day.weekday() not in days:
+            day += dt.timedelta(days=1)
+        when = timezone.make_aware(dt.datetime.combine(day, dt.time.min)) + slot * (first + rng.randrange(slots))
+        roll = rng.random()
+        if day < today:
+            status = 'completed' if roll < 0.8 else 'cancelled'
+        else:
+            status = 'confirmed' if roll < 0.9 else 'cancelled'
+        yield {
+            'hospital_id': doctor.hospital_id,
+            'doctor': doctor.full_name if rng.random() < 0.8 else '',
+            'specialty': doctor.specialty,
+            'patient_name': person_name(rng),
+            'datetime': when,
+            'status': status,
+            'user': rng.choice(patients) if patients and rng.random() < 0.6 else '',
+        }
+
+
+def _create_users(usernames, role, password, batch_size=seeding.BATCH_SIZE, **extra):
+    """Пользователи с профилем role; хэш пароля один на всех — PBKDF2 на каждого занял бы часы"""
+    users = []
+    for batch in seeding._batches(usernames, batch_size):
+        with transaction.atomic():
+            created = User.objects.bulk_create([
+                User(username=name, email=f'{name}@{EMAIL_DOMAIN}', password=password,
+                     first_name=name, **extra)
+                for name in batch
+            ])
+            UserProfile.objects.bulk_create([UserProfile(user=user, role=role) for user in created])
+        users.extend(created)
+    return users
+
+
+def _doctor_accounts(doctors, password):
+    """Аккаунты портала первым врачам: User, инвайт-код с used_by и Doctor.user"""
+    users = _create_users([f'doctor{doctor.pk}' for doctor in doctors], 'doctor', password)
+    with transaction.atomic():
+        for doctor, user in zip(doctors, users):
+            Doctor.objects.filter(pk=doctor.pk).update(user=user)
+        DoctorInviteCode.objects.bulk_create([
+            DoctorInviteCode(code=invite_codes.next_code(), hospital_id=doctor.hospital_id,
+                             specialty=doctor.specialty, is_used=True, used_by=user)
+            for doctor, user in zip(doctors, users)
+        ])
+    doctor_context.bump_generation()
+
+
+def generate(scale, seed=42, log=None):
+    """Заполняет пустую БД данными объёма scale; log(str) — прогресс по шагам"""
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    log(str(seeding.load_hospitals(hospital_rows(scale.hospitals, rng))))
+    hospital_ids = list(Hospital.objects.order_by('id').values_list('id', flat=True))
+    log(str(seeding.load_doctors(doctor_rows(scale.doctors, hospital_ids, rng))))
+
+    doctors = list(Doctor.objects.order_by('id').only('id', 'hospital_id', 'full_name', 'specialty',
+                                                     'work_days', 'work_hours'))
+    _doctor_accounts(doctors[:DOCTOR_ACCOUNTS], password)
+    _create_users([ADMIN_USERNAME], 'admin', password, is_staff=True)
+    patients = [f'patient{number}' for number in range(1, scale.patients + 1)]
+    _create_users(patients, 'patient', password)
+    log(f'users: {len(patients)} пациентов, {min(DOCTOR_ACCOUNTS, len(doctors))} врачей, 1 администратор')
+
+    log(str(seeding.load_appointments(appointment_rows(scale.appointments, doctors, patients, rng))))
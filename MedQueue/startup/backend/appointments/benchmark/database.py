@@ -0,0 +1,37 @@
+"""
+Отдельная БД для бенчмарков: bench_api и bench_codes пишут миллионы строк
+и не должны трогать рабочую базу и её слушателей.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def bench_database_name(name):
+    """Имя БД рядом с рабочей: файл name.sqlite3 для SQLite, иначе name_<рабочая>"""
+    current = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        return str(Path(current).with_name(f'{name}.sqlite3'))
+    return f'{name}_{current}'
+
+
+@contextmanager
+def bench_database(name='bench_db', keepdb=False):
+    """
+    Создаёт БД с миграциями, как тестовый раннер, и переключает на неё
+    соединение; по выходе удаляет (с keepdb — оставляет для следующего запуска).
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name, test_settings['NAME'] = test_settings.get('NAME'), bench_database_name(name)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        test_settings['NAME'] = old_test_name
+        teardown_test_environment()
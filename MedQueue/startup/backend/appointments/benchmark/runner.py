@@ -0,0 +1,296 @@
+"""
+Параллельный прогон горячих эндпоинтов API.
+
+Каждый сценарий (SCENARIOS) — одна операция клиента: список больниц,
+запись, проверка и отмена по коду, портал врача, статистика админки.
+Сценарий гоняется requests раз в concurrency потоках; у каждого потока
+свой django.test.Client и своё соединение с БД, запросы идут через весь
+стек middleware и DRF, но без сети и сервера приложений — меряется
+именно Django-часть. Перед замером warmup запросов прогревают кэши.
+
+На каждый ответ снимаются время (стриминговые ответы дочитываются) и число
+SQL-запросов (CaptureQueriesContext). summarize() сводит их в p50/p95/p99,
+среднее и максимум запросов и ответов в секунду; compare() сравнивает два
+таких отчёта.
+"""
+
+import datetime as dt
+import itertools
+import math
+import random
+import statistics
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .. import schedule
+from ..models import Appointment, Doctor
+from . import data
+
+Sample = namedtuple('Sample', 'seconds queries status')
+
+SAMPLE_DOCTORS = 500
+SAMPLE_CODES   = 2000
+SAMPLE_USERS   = 50
+
+
+def _token(user):
+    return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+
+class Workload:
+    """Что нужно сценариям: врачи с расписанием, коды записей, токены"""
+
+    def __init__(self, shifts, codes, cancellable, patient_tokens, doctor_tokens, admin_token):
+        self.shifts = shifts  # [(Doctor, (дни, первый слот, число слотов))]
+        self.codes = codes
+        self.cancellable = cancellable  # deque; новые записи дописываются справа
+        self.patient_tokens = patient_tokens
+        self.doctor_tokens = doctor_tokens
+        self.admin_token = admin_token
+
+    @classmethod
+    def load(cls, seed=42):
+        rng = random.Random(seed)
+        now = timezone.now()
+        shifts = []
+        for doctor in Doctor.objects.filter(is_active=True, hospital__is_active=True).order_by('id')[:SAMPLE_DOCTORS]:
+            try:
+                shifts.append((doctor, data.shift(doctor)))
+            except ValueError:
+                continue  # расписание не разбирается — запись к нему всё равно отклонят
+
+        # Коды — с случайного места таблицы, а не самые старые
+        last_id = Appointment.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        codes = list(Appointment.objects.filter(id__gte=rng.randint(0, max(0, last_id - SAMPLE_CODES)))
+                     .order_by('id').values_list('code', flat=True)[:SAMPLE_CODES])
+        cancellable = deque(Appointment.objects.filter(status='confirmed', datetime__gte=now)
+                            .order_by('id').values_list('code', flat=True)[:SAMPLE_CODES])
+
+        patients = User.objects.filter(profile__role='patient').order_by('id')[:SAMPLE_USERS]
+        doctors = User.objects.filter(doctor_invite__isnull=False, doctor_profile__isnull=False).order_by('id')
+        admin = (User.objects.filter(username=data.ADMIN_USERNAME).first()
+                 or User.objects.filter(is_staff=True).order_by('id').first())
+
+        missing = [name for name, value in [
+            ('врачей с расписанием', shifts), ('записей', codes),
+            ('аккаунтов врачей', doctors[:1]), ('администратора', admin),
+        ] if not value]
+        if missing:
+            raise ValueError(f'В БД нет {", ".join(missing)} — сначала сгенерируйте данные')
+        return cls(
+            shifts, codes, cancellable,
+            [_token(user) for user in patients],
+            [_token(user) for user in doctors[:SAMPLE_USERS]],
+            _token(admin),
+        )
+
+
+# ── Сценарии: (workload, client, rng) → response ──────────────────────────────
+
+def hospitals_list(workload, client, rng):
+    return client.get('/api/hospitals/')
+
+
+def appointment_create(workload, client, rng):
+    doctor, (days, first, slots) = rng.choice(workload.shifts)
+    day = timezone.localdate() + dt.timedelta(days=rng.randint(1, data.DAYS_AHEAD))
+    while day.weekday() not in days:
+        day += dt.timedelta(days=1)
+    minutes = (first + rng.randrange(slots)) * schedule.default_slot_minutes()
+    when = timezone.make_aware(dt.datetime.combine(day, dt.time.min)) + dt.timedelta(minutes=minutes)
+    headers = {}
+    if workload.patient_tokens and rng.random() < 0.5:
+        headers['HTTP_AUTHORIZATION'] = rng.choice(workload.patient_tokens)
+    response = client.post('/api/appointments/', {
+        'patient_name': data.person_name(rng),
+        'hospital': doctor.hospital_id,
+        'specialty': doctor.specialty,
+        'doctor': doctor.id,
+        'datetime': when.isoformat(),
+    }, content_type='application/json', **headers)
+    if response.status_code == 201:
+        workload.cancellable.append(response.json()['code'])
+    return response
+
+
+def appointment_check(workload, client, rng):
+    return client.get(f'/api/appointments/check/{rng.choice(workload.codes)}/')
+
+
+def appointment_cancel(workload, client, rng):
+    try:
+        code = workload.cancellable.pop()
+    except IndexError:
+        code = rng.choice(workload.codes)  # подтверждённые кончились — ответ будет 400
+    return client.post('/api/appointments/cancel/', {'code': code}, content_type='application/json')
+
+
+def doctor_me(workload, client, rng):
+    return client.get('/api/doctor/me/', HTTP_AUTHORIZATION=rng.choice(workload.doctor_tokens))
+
+
+def doctor_appointments(workload, client, rng):
+    return client.get('/api/doctor/appointments/?filter=week',
+                      HTTP_AUTHORIZATION=rng.choice(workload.doctor_tokens))
+
+
+def admin_stats(workload, client, rng):
+    return client.get('/api/admin/stats/', HTTP_AUTHORIZATION=workload.admin_token)
+
+
+# Порядок важен: отмена берёт коды записей, созданных сценарием записи
+SCENARIOS = {
+    'hospitals_list':      hospitals_list,
+    'appointment_create':  appointment_create,
+    'appointment_check':   appointment_check,
+    'appointment_cancel':  appointment_cancel,
+    'doctor_me':           doctor_me,
+    'doctor_appointments': doctor_appointments,
+    'admin_stats':         admin_stats,
+}
+
+
+# ── Прогон ────────────────────────────────────────────────────────────────────
+
+def _measure(scenario, workload, client, rng):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        try:
+            response = scenario(workload, client, rng)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            status = response.status_code
+        except Exception:
+            status = 'exception'
+        seconds = time.perf_counter() - started
+    return Sample(seconds, len(queries), status)
+
+
+def run_scenario(name, workload, requests, concurrency=4, warmup=10, seed=42):
+    """Отчёт summarize() по requests запросам сценария name в concurrency потоках"""
+    scenario = SCENARIOS[name]
+    counter, lock = itertools.count(), threading.Lock()
+
+    def take():
+        with lock:
+            return next(counter) < requests
+
+    def worker(number):
+        client = Client(raise_request_exception=False)
+        rng = random.Random(f'{seed}:{name}:{number}')
+        samples = []
+        try:
+            while take():
+                samples.append(_measure(scenario, workload, client, rng))
+        finally:
+            connection.close()
+        return samples
+
+    warm_client, warm_rng = Client(raise_request_exception=False), random.Random(f'{seed}:{name}:warmup')
+    for _ in range(warmup):
+        _measure(scenario, workload, warm_client, warm_rng)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = [sample for batch in pool.map(worker, range(concurrency)) for sample in batch]
+    return summarize(samples, time.perf_counter() - started, concurrency)
+
+
+def run(workload, scenarios=None, requests=200, concurrency=4, warmup=10, seed=42, log=None):
+    """{сценарий: отчёт} по сценариям в порядке SCENARIOS"""
+    log = log or (lambda name, report: None)
+    results = {}
+    for name in SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+        results[name] = run_scenario(name, workload, requests, concurrency, warmup, seed)
+        log(name, results[name])
+    return results
+
+
+def percentile(ordered, q):
+    """Перцентиль q (0–100) отсортированного списка методом ближайшего ранга"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, seconds, concurrency):
+    times = sorted(sample.seconds * 1000 for sample in samples)
+    queries = [sample.queries for sample in samples]
+    statuses = Counter(str(sample.status) for sample in samples)
+    return {
+        'requests': len(samples),
+        'concurrency': concurrency,
+        'errors': sum(1 for sample in samples if not isinstance(sample.status, int) or sample.status >= 500),
+        'status': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(samples) / seconds, 1) if seconds else None,
+        'latency_ms': {
+            'p50': _round(percentile(times, 50)),
+            'p95': _round(percentile(times, 95)),
+            'p99': _round(percentile(times, 99)),
+            'mean': _round(statistics.fmean(times)) if times else None,
+            'max': _round(times[-1]) if times else None,
+        },
+        'queries': {
+            'mean': round(statistics.fmean(queries), 2) if queries else None,
+            'max': max(queries, default=None),
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+# ── Сравнение отчётов ─────────────────────────────────────────────────────────
+
+# (путь в отчёте сценария, +1 — рост это ухудшение, -1 — падение)
+METRICS = [
+    ('latency_ms.p50', 1),
+    ('latency_ms.p95', 1),
+    ('latency_ms.p99', 1),
+    ('queries.mean', 1),
+    ('throughput_rps', -1),
+]
+
+Change = namedtuple('Change', 'scenario metric old new percent worse')
+
+
+def _get(report, path):
+    for key in path.split('.'):
+        report = (report or {}).get(key)
+    return report
+
+
+def compare(old, new, threshold=10.0):
+    """
+    [Change] по сценариям, которые есть в обоих отчётах. percent — изменение
+    в процентах (None, если старое значение нулевое), worse — ухудшение
+    больше threshold процентов.
+    """
+    changes = []
+    for scenario, report in new['scenarios'].items():
+        before = old.get('scenarios', {}).get(scenario)
+        if before is None:
+            continue
+        for metric, direction in METRICS:
+            a, b = _get(before, metric), _get(report, metric)
+            if a is None or b is None:
+                continue
+            percent = (b - a) / a * 100 if a else None
+            if percent is None:
+                worse = direction * (b - a) > 0
+            else:
+                worse = direction * percent > threshold
+            changes.append(Change(scenario, metric, a, b, percent, worse))
+    return changes
@@ -0,0 +1,94 @@
+"""
+Кэш публичных ответов API больниц (список, карточка, врачи).
+
+Ключ ответа включает «поколение» кэша. Сигналы на Hospital, Doctor и
+Appointment сдвигают поколение (см. signals.py), и все старые ответы
+становятся недостижимыми сразу, без перебора ключей. Работает на любом
+бэкенде Django (locmem, filebased, redis). Очередь зависит и от
+текущего времени, поэтому у ответов есть ещё и TTL.
+"""
+
+import hashlib
+import time
+from functools import partial, wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+KEY_PREFIX     = 'medqueue:hospitals'
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+
+
+def _cache():
+    return caches[getattr(settings, 'HOSPITAL_CACHE_ALIAS', 'default')]
+
+
+def current_generation():
+    generation = _cache().get(GENERATION_KEY)
+    if generation is None:
+        generation = bump_generation()
+    return generation
+
+
+def bump_generation():
+    """Инвалидирует все закэшированные ответы API больниц"""
+    generation = time.time_ns()
+    _cache().set(GENERATION_KEY, generation, None)
+    return generation
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def _response_key(request, params):
+    """
+    Ключ ответа: путь и только те параметры запроса, которые читает view,
+    в порядке params. Лишние ?x=1, ?x=2 не плодят записи в кэше.
+    """
+    query = urlencode([(name, request.GET[name]) for name in params if name in request.GET])
+    return f'{KEY_PREFIX}:{current_generation()}:{request.path}?{query}'
+
+
+def cached_response(view_method=None, *, params=()):
+    """
+    Кэширует успешный JSON-ответ метода ViewSet и отдаёт его с ETag.
+    На If-None-Match с тем же ETag отвечает 304 без тела.
+    params — параметры запроса, от которых зависит ответ:
+    @cached_response(params=('specialty',)).
+    """
+    if view_method is None:
+        return partial(cached_response, params=params)
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        cache = _cache()
+        key = _response_key(request, params)
+        entry = cache.get(key)
+
+        if entry is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            entry = (etag, body)
+            cache.set(key, entry, getattr(settings, 'HOSPITAL_CACHE_TIMEOUT', 60))
+
+        etag, body = entry
+        if _etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'  # браузер переспрашивает с If-None-Match
+        return response
+
+    return wrapper
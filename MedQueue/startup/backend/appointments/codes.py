@@ -0,0 +1,118 @@
+"""
+Выдача кодов записей и приглашений врачей без проверочных запросов к БД.
+
+Код — это номер из последовательности CodeSequence, пропущенный через
+шифр Фейстеля на 30 битах (32^6 = 2^30) и записанный алфавитом без
+I, O, 0, 1. Перестановка взаимно однозначна: разные номера всегда дают
+разные коды, поэтому цикл «сгенерировать → проверить exists()» не нужен.
+Функция раунда — blake2b с ключом раунда (PRF), ключи выводятся HMAC из
+секрета настроек: зная алгоритм и один код, соседние не угадать.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # без I, O, 0, 1
+CODE_LENGTH   = 6
+CODE_SPACE    = len(CODE_ALPHABET) ** CODE_LENGTH    # 2^30
+
+_HALF_BITS = 15
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS    = 4
+
+
+def round_keys(namespace):
+    """16-байтные ключи раундов для пространства кодов (HMAC-SHA512 от секрета проекта)"""
+    secret = getattr(settings, 'CODE_PERMUTATION_KEY', '') or settings.SECRET_KEY
+    digest = hmac.new(secret.encode('utf-8'), namespace.encode('utf-8'), hashlib.sha512).digest()
+    return [digest[i * 16:(i + 1) * 16] for i in range(_ROUNDS)]
+
+
+def _round(half, key):
+    """Функция раунда: keyed blake2b от 15-битной половины"""
+    digest = hashlib.blake2b(half.to_bytes(2, 'big'), key=key, digest_size=2).digest()
+    return int.from_bytes(digest, 'big') & _HALF_MASK
+
+
+def permute(value, keys):
+    """Биекция [0, 2^30) → [0, 2^30): сеть Фейстеля на двух 15-битных половинах"""
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in keys:
+        left, right = right, left ^ _round(right, key)
+    return (left << _HALF_BITS) | right
+
+
+def encode(number):
+    """Число из [0, 2^30) → 6 символов CODE_ALPHABET"""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class CodeAllocator:
+    """
+    Потокобезопасный выдатчик кодов одного пространства имён.
+
+    Вне транзакции номера резервируются блоками по block_size одним UPDATE
+    и раздаются из памяти. Внутри чужой транзакции блок мог бы откатиться
+    вместе с ней и достаться другому процессу, поэтому там берётся один
+    номер в той же транзакции.
+    """
+
+    def __init__(self, namespace, prefix='', block_size=100):
+        self.namespace  = namespace
+        self.prefix     = prefix
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._keys = None
+        self._pid  = None
+        self._next = self._end = 0
+
+    def next_code(self):
+        if self._keys is None:
+            self._keys = round_keys(self.namespace)
+        return self.prefix + encode(permute(self._next_value(), self._keys))
+
+    def take(self, count):
+        """
+        count кодов подряд одним UPDATE — для массовой загрузки записей.
+        Вызывать в транзакции, которая эти коды и вставит: при откате
+        номера вернутся в последовательность вместе с ней.
+        """
+        from .models import CodeSequence
+
+        if self._keys is None:
+            self._keys = round_keys(self.namespace)
+        start, end = CodeSequence.reserve(self.namespace, count)
+        if end > CODE_SPACE:
+            raise RuntimeError(f'Пространство кодов "{self.namespace}" исчерпано')
+        return [self.prefix + encode(permute(value, self._keys)) for value in range(start, end)]
+
+    def _next_value(self):
+        from .models import CodeSequence
+
+        if transaction.get_connection().in_atomic_block:
+            value, _ = CodeSequence.reserve(self.namespace, 1)
+        else:
+            with self._lock:
+                # После fork блок родителя общий для всех воркеров — берём новый
+                if self._next >= self._end or self._pid != os.getpid():
+                    self._next, self._end = CodeSequence.reserve(self.namespace, self.block_size)
+                    self._pid = os.getpid()
+                value = self._next
+                self._next += 1
+
+        if value >= CODE_SPACE:
+            raise RuntimeError(f'Пространство кодов "{self.namespace}" исчерпано')
+        return value
+
+
+appointment_codes = CodeAllocator('appointment')
+invite_codes      = CodeAllocator('invite', prefix='MEDQ-', block_size=10)
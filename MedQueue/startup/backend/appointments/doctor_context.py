@@ -0,0 +1,89 @@
+"""
+Контекст врача для портала /api/doctor/...: инвайт-код, больница и запись Doctor.
+
+Раньше каждый запрос портала читал request.user.doctor_invite, затем его
+больницу и отдельно Doctor.objects.filter(user=...). Теперь всё берётся
+одним запросом с JOIN и кэшируется на аккаунт врача (в пределах запроса —
+на самом request, между запросами — в кэше Django по id пользователя,
+то есть на все его токены). Сигналы на Hospital, Doctor и DoctorInviteCode
+сдвигают поколение кэша (см. signals.py), так что правки в админке видны
+сразу.
+
+В кэш кладутся только id и нужные порталу поля, а не экземпляры моделей:
+общий кэш не должен хранить User с хэшем пароля и прочие чужие данные.
+"""
+
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import DoctorInviteCode
+
+KEY_PREFIX     = 'medqueue:doctor-context'
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+
+# specialty — из инвайт-кода; hospital — None, если больница не привязана;
+# doctor — None для старых инвайт-кодов без привязанной записи Doctor
+DoctorContext = namedtuple('DoctorContext', 'invite_id specialty hospital doctor')
+HospitalInfo  = namedtuple('HospitalInfo', 'id name address type')
+DoctorInfo    = namedtuple('DoctorInfo', 'id specialty cabinet work_days work_hours')
+
+_DOCTOR = 'used_by__doctor_profile__'
+
+
+def _cache():
+    return caches[getattr(settings, 'DOCTOR_CONTEXT_CACHE_ALIAS', 'default')]
+
+
+def current_generation():
+    generation = _cache().get(GENERATION_KEY)
+    if generation is None:
+        generation = bump_generation()
+    return generation
+
+
+def bump_generation():
+    """Инвалидирует закэшированные контексты всех врачей"""
+    generation = time.time_ns()
+    _cache().set(GENERATION_KEY, generation, None)
+    return generation
+
+
+def load(user):
+    """Контекст из БД одним запросом; None, если аккаунт не врачебный"""
+    row = (
+        DoctorInviteCode.objects
+        .filter(used_by=user)
+        .values(
+            'id', 'specialty', 'hospital_id', 'hospital__name', 'hospital__address', 'hospital__type',
+            *(_DOCTOR + field for field in DoctorInfo._fields),
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    hospital = doctor = None
+    if row['hospital_id'] is not None:
+        hospital = HospitalInfo(row['hospital_id'], row['hospital__name'],
+                                row['hospital__address'], row['hospital__type'])
+    if row[_DOCTOR + 'id'] is not None:
+        doctor = DoctorInfo(*(row[_DOCTOR + field] for field in DoctorInfo._fields))
+    return DoctorContext(row['id'], row['specialty'], hospital, doctor)
+
+
+def get_context(request):
+    """Контекст врача текущего запроса; None, если аккаунт не врачебный"""
+    if hasattr(request, '_doctor_context'):
+        return request._doctor_context
+
+    cache = _cache()
+    key = f'{KEY_PREFIX}:{current_generation()}:{request.user.pk}'
+    context = cache.get(key)
+    if context is None:
+        context = load(request.user)
+        if context is not None:
+            cache.set(key, context, getattr(settings, 'DOCTOR_CONTEXT_CACHE_TIMEOUT', 300))
+    request._doctor_context = context
+    return context
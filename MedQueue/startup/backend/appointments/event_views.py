@@ -0,0 +1,120 @@
+"""
+Потоки событий очереди (Server-Sent Events): страница статуса записи и
+кабинет врача получают новые места сразу, без повторных запросов
+/api/appointments/check/{code}/ и /api/doctor/appointments/.
+
+GET /api/events/appointments/{code}/              — место и статус записи
+GET /api/events/hospitals/{id}/?day=YYYY-MM-DD    — очередь больницы за день
+GET /api/events/doctors/{id}/?day=YYYY-MM-DD      — очередь врача за день
+
+View асинхронные: держать тысячи соединений может только ASGI-сервер
+(uvicorn, см. medqueue_project/asgi.py). Под WSGI (runserver, gunicorn)
+Django прогоняет асинхронный поток через async_to_sync — ответ копится
+до закрытия потока и держит рабочий поток сервера все
+QUEUE_EVENTS_STREAM_TIMEOUT секунд. Поэтому потоки включаются только
+настройкой QUEUE_EVENTS_SSE и только для запросов, пришедших через ASGI;
+иначе эндпоинты отвечают 503, а фронтенд остаётся без живых обновлений.
+
+Поток закрывается через QUEUE_EVENTS_STREAM_TIMEOUT секунд, EventSource
+сам переподключается.
+"""
+
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+
+from . import events
+
+
+def _format_event(event):
+    return f'data: {json.dumps(event, ensure_ascii=False)}\n\n'
+
+
+async def _stream(channel):
+    keepalive = getattr(settings, 'QUEUE_EVENTS_KEEPALIVE', 15)
+    deadline = time.monotonic() + getattr(settings, 'QUEUE_EVENTS_STREAM_TIMEOUT', 300)
+    subscription = events.get_broker().subscribe(channel)
+
+    yield f'retry: 3000\n: subscribed {channel}\n\n'
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(subscription.get(), min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'  # комментарий SSE — не даёт прокси закрыть соединение
+                continue
+            yield _format_event(event)
+    finally:
+        subscription.close()
+
+
+def _event_stream_response(channel):
+    response = StreamingHttpResponse(_stream(channel), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: не буферизовать поток
+    return response
+
+
+def _unavailable(request):
+    """503 с объяснением, если потоки выключены или запрос пришёл не через ASGI"""
+    if not getattr(settings, 'QUEUE_EVENTS_SSE', False):
+        message = 'Поток событий отключён (QUEUE_EVENTS_SSE). Обновляйте статус запросом /api/appointments/check/{code}/'
+    elif not isinstance(request, ASGIRequest):
+        message = ('Поток событий работает только под ASGI-сервером '
+                   '(uvicorn medqueue_project.asgi:application), а не под WSGI')
+    else:
+        return None
+    return JsonResponse({'error': message}, status=503)
+
+
+def _requested_day(request):
+    raw = request.GET.get('day')
+    if not raw:
+        return timezone.localdate(), None
+    try:
+        day = parse_date(raw)
+    except ValueError:
+        day = None
+    if day is None:
+        return None, JsonResponse({'error': 'Параметр day должен быть в формате YYYY-MM-DD'}, status=400)
+    return day, None
+
+
+@require_GET
+async def appointment_events(request, code):
+    err = _unavailable(request)
+    if err:
+        return err
+    return _event_stream_response(events.appointment_channel(code.upper()))
+
+
+@require_GET
+async def hospital_events(request, hospital_id):
+    err = _unavailable(request)
+    if err:
+        return err
+    day, err = _requested_day(request)
+    if err:
+        return err
+    return _event_stream_response(events.hospital_channel(hospital_id, day))
+
+
+@require_GET
+async def doctor_events(request, doctor_id):
+    err = _unavailable(request)
+    if err:
+        return err
+    day, err = _requested_day(request)
+    if err:
+        return err
+    return _event_stream_response(events.doctor_channel(doctor_id, day))
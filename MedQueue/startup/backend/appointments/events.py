@@ -0,0 +1,153 @@
+"""
+События очереди для живых обновлений (SSE, см. event_views.py).
+
+Каналы:
+  appointment:<CODE>            — место и статус одной записи (знает только владелец кода)
+  hospital:<id>:<YYYY-MM-DD>    — изменения очереди больницы за день
+  doctor:<id>:<YYYY-MM-DD>      — изменения очереди врача за день
+
+Брокер подключается настройкой QUEUE_EVENTS_BROKER. InMemoryBroker
+работает внутри одного процесса (dev-сервер, один ASGI-воркер, тесты);
+для нескольких воркеров нужен брокер с тем же интерфейсом поверх общей
+шины (Redis pub/sub и т.п.).
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Appointment
+
+
+def hospital_channel(hospital_id, day):
+    return f'hospital:{hospital_id}:{day.isoformat()}'
+
+
+def doctor_channel(doctor_id, day):
+    return f'doctor:{doctor_id}:{day.isoformat()}'
+
+
+def appointment_channel(code):
+    return f'appointment:{code}'
+
+
+class Subscription:
+    """Подписка на канал: события копятся в asyncio.Queue своего event loop"""
+
+    def __init__(self, broker, channel, max_pending):
+        self.broker  = broker
+        self.channel = channel
+        self.loop    = asyncio.get_running_loop()
+        self.queue   = asyncio.Queue(maxsize=max_pending)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def deliver(self, event):
+        # Медленный клиент не должен копить события бесконечно: старые отбрасываем
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class InMemoryBroker:
+    """
+    Pub/sub внутри процесса. publish() можно вызывать из любого потока
+    (сигналы синхронных view), subscribe() — из работающего event loop.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.max_pending)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+        return len(targets)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'QUEUE_EVENTS_BROKER', 'appointments.events.InMemoryBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_appointment_change(appointment, event):
+    """Рассылает изменение записи в её канал и в каналы больницы/врача на день"""
+    day = appointment.queue_day
+    payload = {
+        'event': event,
+        'id': appointment.id,
+        'status': appointment.status,
+        'queue_position': appointment.queue_position,
+        'estimated_wait_time': appointment.estimated_wait_time,
+        'datetime': appointment.datetime.isoformat(),
+    }
+    broker = get_broker()
+    broker.publish(appointment_channel(appointment.code), payload)
+    broker.publish(hospital_channel(appointment.hospital_id, day), payload)
+    if appointment.doctor_id:
+        broker.publish(doctor_channel(appointment.doctor_id, day), payload)
+
+
+def publish_renumbered(hospital_id, day, changes):
+    """
+    После пересчёта очереди: каждой сдвинутой записи — её новое место,
+    больнице и врачам — сводка {id записи: место}.
+    changes — список (id, code, doctor_id, queue_position).
+    """
+    broker = get_broker()
+    by_doctor = defaultdict(dict)
+    for appointment_id, code, doctor_id, position in changes:
+        broker.publish(appointment_channel(code), {
+            'event': 'moved', 'id': appointment_id, 'queue_position': position,
+            'estimated_wait_time': position * Appointment.WAIT_MINUTES_PER_PLACE,
+        })
+        if doctor_id:
+            by_doctor[doctor_id][appointment_id] = position
+
+    broker.publish(hospital_channel(hospital_id, day), {
+        'event': 'renumbered',
+        'positions': {appointment_id: position for appointment_id, _, _, position in changes},
+    })
+    for doctor_id, positions in by_doctor.items():
+        broker.publish(doctor_channel(doctor_id, day), {'event': 'renumbered', 'positions': positions})
@@ -0,0 +1,98 @@
+"""
+Удаление истёкших кодов подтверждения email и сброса пароля,
+просроченных временных броней времени врача (SlotHold) и старых
+отправленных или брошенных писем (OutboundEmail).
+
+Срок кода — колонка expires_at, её ставит вставка (VerificationCode.TTL,
+PasswordResetCode.TTL). Проверка кода идёт через .alive(), поэтому истёкший
+код не виден сразу; строка удаляется, когда пройдёт ещё RETAIN_EXPIRED
+(заявка на регистрацию хранится сутки для повторной отправки кода).
+Просроченная бронь слот уже не занимает (SlotHold.occupied), но копилась
+бы, если на её слот никто не записался. Письмо после отправки теряет
+текст, а строка удаляется через OutboundEmail.RETAIN_DONE. Строки всех
+таблиц убирает sweep(): по индексу срока берёт пачку id и удаляет её
+отдельным коротким DELETE. Блокировка таблицы держится на одну пачку,
+между пачками могут пройти вставки новых строк.
+
+Режим задаётся CODE_SWEEPER:
+  'thread'  — фоновый поток внутри процесса Django, запускается при выдаче
+              первого кода или брони и чистит раз в CODE_SWEEP_INTERVAL секунд;
+  'command' — отдельный процесс или cron: python manage.py sweep_codes [--loop]
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboundEmail, PasswordResetCode, SlotHold, VerificationCode
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+MODELS = (VerificationCode, PasswordResetCode, SlotHold, OutboundEmail)  # у всех есть objects.expired()
+
+
+def sweep_model(model, batch_size=BATCH_SIZE, now=None, pause=0.0):
+    """Удаляет истёкшие строки model пачками по batch_size. Возвращает число удалённых"""
+    now = now or timezone.now()
+    total = 0
+    order = getattr(model, 'EXPIRY_FIELD', 'expires_at')
+    while True:
+        ids = list(model.objects.expired(now).order_by(order)
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        deleted, _ = model.objects.expired(now).filter(id__in=ids).delete()
+        total += deleted
+        metrics.expired_swept.inc(deleted, model=model._meta.model_name)
+        if len(ids) < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def sweep(batch_size=BATCH_SIZE, pause=0.0):
+    """{имя модели: удалено} по всем таблицам MODELS"""
+    now = timezone.now()
+    return {model._meta.model_name: sweep_model(model, batch_size, now, pause) for model in MODELS}
+
+
+class _SweeperThread(threading.Thread):
+    """Фоновый поток: раз в interval секунд удаляет истёкшие коды и брони"""
+
+    def __init__(self, interval):
+        super().__init__(name='medqueue-code-sweeper', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                close_old_connections()
+                deleted = sweep()
+                if any(deleted.values()):
+                    logger.info('Удалены истёкшие строки: %s', deleted)
+            except Exception:
+                logger.exception('Ошибка очистки истёкших кодов и броней')
+            finally:
+                close_old_connections()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper():
+    """Запускает фоновый поток очистки, если CODE_SWEEPER = 'thread' и он ещё не запущен"""
+    if getattr(settings, 'CODE_SWEEPER', 'thread') != 'thread':
+        return
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = _SweeperThread(getattr(settings, 'CODE_SWEEP_INTERVAL', 600))
+            _sweeper.start()
@@ -0,0 +1,137 @@
+"""
+Ответы МедAi по правилам — когда ИИ-провайдеры недоступны (см. assistant.py).
+
+Правила — таблица (ключевые слова, ответ) в порядке приоритета. При импорте
+все ключевые слова собираются в одну регулярку-дерево, поэтому сообщение
+просматривается один раз, а не 20 раз подряд. Ключевые слова ищутся как
+подстроки (как и раньше: «зуб» найдётся в «зубной»). Из всех
+найденных слов побеждает правило, стоящее в таблице выше.
+"""
+
+import re
+
+FALLBACK_RULES = [
+    # Запись к врачу
+    (['записаться', 'запись', 'записать', 'попасть на приём', 'записаться к врачу'],
+     '📅 Перейдите в раздел «Главная», выберите клинику → «Записаться». Укажите специалиста, дату и время — код записи придёт сразу.'),
+    # Температура
+    (['температура', 'жар', 'лихорадка', 'горю', 'высокая темп'],
+     '🌡️ При температуре выше 38.5°C обратитесь к терапевту или вызовите скорую (103). До снижения — пейте больше воды, при необходимости примите жаропонижающее (парацетамол). Для точного диагноза обратитесь к врачу.'),
+    # Головная боль
+    (['голова', 'головная боль', 'мигрень', 'голова боли'],
+     '🧠 Головная боль бывает при усталости, стрессе, давлении или неврологических причинах. Если боль сильная/частая — обратитесь к неврологу. Для точного диагноза обратитесь к врачу.'),
+    # Живот / ЖКТ
+    (['живот', 'желудок', 'тошнота', 'рвота', 'понос', 'диарея', 'запор', 'изжога'],
+     '🫁 Боли в животе, тошнота или расстройство ЖКТ — повод обратиться к гастроэнтерологу или терапевту. Если боль острая — вызовите скорую (103). Для точного диагноза обратитесь к врачу.'),
+    # Сердце
+    (['сердце', 'сердечное', 'давление', 'тахикардия', 'аритмия', 'инфаркт', 'боль в груди'],
+     '❤️ При болях в грудной клетке, учащённом сердцебиении или скачках давления — срочно к кардиологу. При острой боли вызовите 103. Для точного диагноза обратитесь к врачу.'),
+    # Кашель / ОРВИ
+    (['кашель', 'насморк', 'орви', 'простуда', 'грипп', 'чихаю', 'горло', 'ангина'],
+     '🤧 ОРВИ или грипп лечит терапевт. Пейте тёплые жидкости, больше отдыхайте. При высокой температуре и ухудшении — обратитесь к врачу очно. Для точного диагноза обратитесь к врачу.'),
+    # Спина, суставы
+    (['спина', 'позвоночник', 'суставы', 'колено', 'поясница', 'шея'],
+     '🦴 Боли в спине и суставах — к ортопеду или неврологу. При травме — к хирургу. Для точного диагноза обратитесь к врачу.'),
+    # Кожа
+    (['кожа', 'сыпь', 'зуд', 'акне', 'прыщи', 'дерматит', 'аллергия'],
+     '🧴 Кожные проблемы (сыпь, зуд, акне) — к дерматологу. Аллергическую реакцию также оценит аллерголог. Для точного диагноза обратитесь к врачу.'),
+    # Глаза
+    (['глаза', 'зрение', 'близорукость', 'дальнозоркость', 'линзы', 'очки'],
+     '👁️ Проблемы со зрением — к офтальмологу. Плановую проверку зрения рекомендуется проходить раз в год. Для точного диагноза обратитесь к врачу.'),
+    # Зубы
+    (['зубы', 'зуб', 'стоматолог', 'десна', 'боль в зубе'],
+     '🦷 Зубная боль — к стоматологу как можно скорее. Для снятия боли временно помогает ибупрофен. Для точного диагноза обратитесь к врачу.'),
+    # Дети
+    (['ребёнок', 'дети', 'ребенок', 'малыш', 'педиатр'],
+     '👶 Здоровье детей — к педиатру. В Алматы есть детские поликлиники и ДГКБ. Для точного диагноза обратитесь к врачу.'),
+    # Психическое здоровье
+    (['депрессия', 'тревога', 'психолог', 'психиатр', 'стресс', 'паника', 'бессонница'],
+     '🧘 Психологическое состояние важно. Обратитесь к психологу (без рецептов) или психиатру (с медикаментами). В кризисных ситуациях — телефон доверия: 150. Для точного диагноза обратитесь к врачу.'),
+    # Диабет / эндо
+    (['диабет', 'сахар', 'инсулин', 'щитовидка', 'гормоны', 'эндокринолог'],
+     '🩸 При симптомах диабета или гормональных нарушениях — к эндокринологу. Сдайте кровь на сахар натощак. Для точного диагноза обратитесь к врачу.'),
+    # Женское здоровье
+    (['гинеколог', 'женский врач', 'беременность', 'месячные', 'цикл'],
+     '🌸 Женское здоровье — к гинекологу. Плановый осмотр раз в год обязателен. Для точного диагноза обратитесь к врачу.'),
+    # Скорая
+    (['скорая', '103', 'вызвать врача', 'критическое', 'потерял сознание'],
+     '🚑 При критическом состоянии немедленно звоните 103 (скорая помощь). Не ждите и не занимайтесь самолечением!'),
+    # Больницы Алматы
+    (['больница', 'поликлиника', 'клиника', 'алматы', 'где лечиться'],
+     '🏥 В MedQueue представлены более 40 больниц и поликлиник Алматы. Откройте главную страницу, выберите клинику на карте или в списке и запишитесь онлайн.'),
+    # Анализы
+    (['анализы', 'кровь', 'моча', 'узи', 'мрт', 'рентген', 'обследование'],
+     '🔬 Для направления на анализы или инструментальную диагностику (УЗИ, МРТ, рентген) обратитесь к терапевту — он выдаст направление. Для точного диагноза обратитесь к врачу.'),
+    # Поиск специалиста
+    (['какой врач', 'к какому врачу', 'специалист', 'кому записаться'],
+     '🩺 Если не знаете к кому идти — начните с терапевта: он поставит предварительный диагноз и направит к нужному специалисту. Для записи используйте MedQueue.'),
+    # Приветствие
+    (['привет', 'здравствуй', 'хеллоу', 'hi', 'hello', 'даров', 'добрый'],
+     '👋 Привет! Я МедAi — ваш медицинский ассистент MedQueue. Задайте вопрос о симптомах, специалистах или записи к врачу в Алматы. 😊'),
+    # Спасибо
+    (['спасибо', 'благодар', 'thanks', 'thank'],
+     '😊 Пожалуйста! Если появятся ещё вопросы — спрашивайте. Берегите своё здоровье!'),
+]
+
+DEFAULT_REPLY = (
+    '🏥 Я МедAi — ассистент медпортала MedQueue (Алматы). '
+    'Могу помочь с выбором специалиста, записью к врачу или ответить на вопрос о симптомах. '
+    'Уточните свой вопрос, и я постараюсь помочь!'
+)
+
+
+def _trie_pattern(words):
+    """Альтернатива слов, свёрнутая в префиксное дерево: зуб(?:ы)?|живот|жар..."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:%s)' % '|'.join(branches)
+        return '(?:%s)?' % body if '' in node else body
+
+    return build(trie)
+
+
+def _compile(rules):
+    """
+    Регулярка ищет внутри lookahead, поэтому finditer находит слово в каждой
+    позиции, даже если слова перекрываются. В одной позиции дерево берёт самое
+    длинное слово, а оно сработало бы вместе со всеми своими префиксами —
+    поэтому слову сразу приписан самый приоритетный из них.
+    """
+    rule_of = {}
+    for index, (keywords, _) in enumerate(rules):
+        for keyword in keywords:
+            rule_of.setdefault(keyword, index)
+    effective = {
+        keyword: min(index for prefix, index in rule_of.items() if keyword.startswith(prefix))
+        for keyword in rule_of
+    }
+    return re.compile('(?=(%s))' % _trie_pattern(rule_of)), effective
+
+
+_PATTERN, _RULE_OF = _compile(FALLBACK_RULES)
+
+
+def match_rule(message):
+    """Индекс сработавшего правила или None"""
+    best = None
+    for match in _PATTERN.finditer(message.lower()):
+        index = _RULE_OF[match.group(1)]
+        if best is None or index < best:
+            best = index
+            if best == 0:
+                break
+    return best
+
+
+def fallback_reply(message):
+    index = match_rule(message)
+    return {'reply': DEFAULT_REPLY if index is None else FALLBACK_RULES[index][1]}
@@ -0,0 +1,145 @@
+"""
+Поиск ближайших больниц: /api/hospitals/nearby/.
+
+Раньше карта скачивала все больницы и сортировала их по расстоянию в
+браузере. Здесь координаты активных больниц и специальности их активных
+врачей лежат в памяти процесса в равномерной сетке по широте/долготе
+(GridIndex). Поиск обходит клетки кольцами от точки запроса и
+останавливается, как только следующее кольцо заведомо дальше k-го
+найденного или радиуса, — просматривается горстка клеток, а не весь список.
+
+Индекс строится двумя запросами и перестраивается лениво: сигналы на
+Hospital и Doctor сдвигают поколение в кэше Django (см. signals.py), и
+каждый воркер при следующем поиске видит, что его копия устарела.
+"""
+
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Doctor, Hospital
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE   = math.pi * EARTH_RADIUS_KM / 180
+
+GENERATION_KEY = 'medqueue:geo:generation'
+
+Place = namedtuple('Place', 'id lat lng specialties')
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Точки в клетках cell_deg × cell_deg градусов"""
+
+    def __init__(self, places, cell_deg=0.05):
+        self.cell = cell_deg
+        self.cells = defaultdict(list)
+        self.size = 0
+        for place in places:
+            self.cells[self._key(place.lat, place.lng)].append(place)
+            self.size += 1
+
+    def _key(self, lat, lng):
+        return math.floor(lat / self.cell), math.floor(lng / self.cell)
+
+    def _ring(self, ci, cj, r):
+        """Клетки на чебышёвском расстоянии r от (ci, cj)"""
+        if r == 0:
+            yield ci, cj
+            return
+        for dj in range(-r, r + 1):
+            yield ci - r, cj + dj
+            yield ci + r, cj + dj
+        for di in range(-r + 1, r):
+            yield ci + di, cj - r
+            yield ci + di, cj + r
+
+    def nearest(self, lat, lng, k=10, radius_km=10.0, specialty=None):
+        """[(расстояние_км, Place)] — до k ближайших в радиусе, по возрастанию"""
+        ci, cj = self._key(lat, lng)
+        # Нижняя граница расстояния до кольца r: (r - 1) клеток по короткой
+        # стороне; долгота сжимается к полюсам — берём худшую широту в радиусе
+        far_lat = min(89.9, abs(lat) + radius_km / KM_PER_DEGREE + self.cell)
+        cell_km = self.cell * KM_PER_DEGREE * math.cos(math.radians(far_lat))
+
+        best = []  # max-куча по расстоянию: (-расстояние, id, Place)
+        r = 0
+        while True:
+            for key in self._ring(ci, cj, r):
+                for place in self.cells.get(key, ()):
+                    if specialty and specialty not in place.specialties:
+                        continue
+                    distance = haversine_km(lat, lng, place.lat, place.lng)
+                    if distance > radius_km:
+                        continue
+                    item = (-distance, place.id, place)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, item)
+            bound = r * cell_km  # ближе этого в кольце r + 1 точек нет
+            if bound > radius_km or (len(best) == k and -best[0][0] <= bound):
+                break
+            r += 1
+        return sorted((-d, place) for d, _, place in best)
+
+
+def build_index():
+    """Активные больницы с координатами и специальности их активных врачей"""
+    specialties = defaultdict(set)
+    for hospital_id, specialty in (Doctor.objects.filter(is_active=True).order_by()
+                                   .values_list('hospital_id', 'specialty').distinct()):
+        specialties[hospital_id].add(specialty)
+    places = (
+        Place(pk, lat, lng, frozenset(specialties[pk]))
+        for pk, lat, lng in Hospital.objects.filter(
+            is_active=True, latitude__isnull=False, longitude__isnull=False,
+        ).order_by().values_list('id', 'latitude', 'longitude').iterator()
+    )
+    return GridIndex(places, getattr(settings, 'GEO_CELL_DEGREES', 0.05))
+
+
+def _cache():
+    return caches[getattr(settings, 'HOSPITAL_CACHE_ALIAS', 'default')]
+
+
+def current_generation():
+    generation = _cache().get(GENERATION_KEY)
+    if generation is None:
+        generation = bump_generation()
+    return generation
+
+
+def bump_generation():
+    """Индексы всех воркеров устарели — перестроятся при следующем поиске"""
+    generation = time.time_ns()
+    _cache().set(GENERATION_KEY, generation, None)
+    return generation
+
+
+_index = None
+_index_generation = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index, _index_generation
+    generation = current_generation()
+    if _index is None or _index_generation != generation:
+        with _index_lock:
+            if _index is None or _index_generation != generation:
+                _index = build_index()
+                _index_generation = generation
+    return _index
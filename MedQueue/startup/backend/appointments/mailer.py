@@ -0,0 +1,179 @@
+"""
+Исходящая почта через таблицу OutboundEmail.
+
+enqueue() сохраняет письмо в той же транзакции, что и код подтверждения,
+и после коммита будит диспетчер, поэтому запрос не ждёт SMTP. Диспетчер
+забирает пачку писем, отправляет их через одно SMTP-соединение и при
+ошибке откладывает письмо с экспоненциальной задержкой.
+
+Режим задаётся EMAIL_OUTBOX_WORKER:
+  'thread'  — фоновый поток внутри процесса Django (по умолчанию);
+  'command' — отдельный процесс: python manage.py send_outbox --loop
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE    = 50
+MAX_ATTEMPTS  = 5
+RETRY_BASE    = timedelta(seconds=30)   # 30 с, 1 мин, 2 мин, 4 мин...
+SENDING_LEASE = timedelta(minutes=5)    # после этого «зависшее» письмо берёт другой воркер
+
+
+def enqueue(to_email, subject, body, from_email=None):
+    """Ставит письмо в очередь; отправка начнётся после коммита транзакции"""
+    message = OutboundEmail.objects.create(
+        to_email=to_email,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        body=body,
+    )
+    transaction.on_commit(wake_dispatcher)
+    return message
+
+
+def _ready(now):
+    """Письма, которые можно брать: ждущие своей попытки и «зависшие» дольше аренды"""
+    return (Q(status='pending', next_attempt_at__lte=now)
+            | Q(status='sending', next_attempt_at__lte=now - SENDING_LEASE))
+
+
+def _claim_batch(batch_size):
+    """
+    Помечает пачку готовых писем своим claim — работает без SELECT FOR UPDATE
+    SKIP LOCKED. UPDATE повторяет условие готовности: если другой диспетчер
+    успел забрать письмо между SELECT и UPDATE, его next_attempt_at = now
+    уже не проходит условие аренды, и письмо не уходит дважды.
+    """
+    now = timezone.now()
+    ready = (OutboundEmail.objects.filter(_ready(now))
+             .order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+
+    token = uuid.uuid4().hex
+    OutboundEmail.objects.filter(_ready(now), id__in=list(ready)).update(
+        status='sending', claim=token, next_attempt_at=now,
+    )
+    return list(OutboundEmail.objects.filter(claim=token, status='sending'))
+
+
+def _mark_failed(message, error):
+    message.attempts += 1
+    message.last_error = str(error)[:1000]
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = 'failed'
+        metrics.emails.inc(outcome='failed')
+    else:
+        message.status = 'pending'
+        metrics.emails.inc(outcome='retry')
+        message.next_attempt_at = timezone.now() + RETRY_BASE * 2 ** (message.attempts - 1)
+    message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    logger.warning('Письмо %s для %s не отправлено (попытка %s): %s',
+                   message.id, message.to_email, message.attempts, error)
+
+
+def dispatch_pending(batch_size=BATCH_SIZE):
+    """Отправляет одну пачку писем через одно SMTP-соединение. Возвращает число отправленных"""
+    batch = _claim_batch(batch_size)
+    if not batch:
+        return 0
+
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        with metrics.smtp_seconds.time(operation='connect', outcome='error') as labels:
+            connection.open()
+            labels['outcome'] = 'ok'
+    except Exception as e:
+        for message in batch:
+            _mark_failed(message, e)
+        return 0
+
+    try:
+        for message in batch:
+            email = EmailMessage(
+                subject=message.subject, body=message.body,
+                from_email=message.from_email, to=[message.to_email],
+                connection=connection,
+            )
+            try:
+                with metrics.smtp_seconds.time(operation='send', outcome='error') as labels:
+                    email.send()
+                    labels['outcome'] = 'ok'
+            except Exception as e:
+                _mark_failed(message, e)
+                # Соединение могло оборваться — следующее письмо откроет новое
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+                continue
+            # В тексте код подтверждения — после отправки он не нужен
+            message.status = 'sent'
+            message.sent_at = timezone.now()
+            message.body = ''
+            message.save(update_fields=['status', 'sent_at', 'body'])
+            metrics.emails.inc(outcome='sent')
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def dispatch_all(batch_size=BATCH_SIZE):
+    """Отправляет пачки, пока есть готовые письма"""
+    total = 0
+    while True:
+        sent = dispatch_pending(batch_size)
+        total += sent
+        if not sent:
+            return total
+
+
+class _DispatcherThread(threading.Thread):
+    """Фоновый поток: ждёт сигнала или таймаута и разбирает очередь"""
+
+    def __init__(self, poll_interval):
+        super().__init__(name='medqueue-mailer', daemon=True)
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                dispatch_all()
+            except Exception:
+                logger.exception('Ошибка диспетчера почты')
+            finally:
+                close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def wake_dispatcher():
+    if getattr(settings, 'EMAIL_OUTBOX_WORKER', 'thread') != 'thread':
+        return
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = _DispatcherThread(getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 30))
+            _dispatcher.start()
+    _dispatcher.wakeup.set()
@@ -0,0 +1,168 @@
+"""
+Management command: python manage.py bench_ai_fallback [--repeat 2000]
+
+Сравнивает ответы по правилам (fallback.py, одна скомпилированная
+регулярка) с прежней цепочкой из 20 проверок any(w in m ...) на корпусе
+типичных сообщений на русском и казахском. Заодно проверяет, что оба
+варианта дают одинаковые ответы.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.fallback import fallback_reply
+
+CORPUS = [
+    'Здравствуйте! Как записаться к терапевту на завтра?',
+    'У ребенка температура 39 уже второй день, что делать?',
+    'Болит голова третий день, таблетки не помогают',
+    'тошнота и рвота после еды, к кому обратиться',
+    'давление 160 на 100, колет в груди',
+    'кашель и насморк уже неделю, горло красное',
+    'сильно болит поясница, не могу наклониться',
+    'появилась сыпь и зуд на руках после нового крема',
+    'зрение упало, нужны ли очки?',
+    'Зуб болит ночью, какой стоматолог работает в выходные',
+    'Какая поликлиника ближе к Алмалинскому району?',
+    'где сдать анализы крови и сделать УЗИ',
+    'к какому врачу идти если постоянно устаю?',
+    'спасибо большое за помощь!',
+    'Привет',
+    'Сәлеметсіз бе! Дәрігерге қалай жазылуға болады?',
+    'Басым ауырып тұр, қай дәрігерге бару керек?',
+    'Баланың қызуы көтерілді, не істеу керек?',
+    'Тісім ауырады, стоматологқа жазылғым келеді',
+    'Рахмет, көмектескеніңізге!',
+    'Ішім ауырады және жүрегім айнып тұр',
+    'Қан тапсыру үшін қайда бару керек?',
+    'Мен тұмау болып қалдым, жөтел бар',
+    'Маған психолог керек, ұйқым жоқ, стресс',
+    'Қант диабеті бар, эндокринолог қабылдай ма?',
+    'What time does the clinic open?',
+    'Можно ли перенести запись на другое время?',
+    'Беременность 12 недель, нужен гинеколог',
+    'Потерял сознание на улице, вызвать скорую?',
+    'Мне нужна справка для работы',
+]
+
+
+def legacy_fallback(message):
+    """Прежняя цепочка из auth_views._fallback_ai_response — для сравнения"""
+    m = message.lower()
+
+    # --- Запись к врачу ---
+    if any(w in m for w in ['записаться', 'запись', 'записать', 'попасть на приём', 'записаться к врачу']):
+        return {'reply': '📅 Перейдите в раздел «Главная», выберите клинику → «Записаться». Укажите специалиста, дату и время — код записи придёт сразу.'}
+
+    # --- Температура ---
+    if any(w in m for w in ['температура', 'жар', 'лихорадка', 'горю', 'высокая темп']):
+        return {'reply': '🌡️ При температуре выше 38.5°C обратитесь к терапевту или вызовите скорую (103). До снижения — пейте больше воды, при необходимости примите жаропонижающее (парацетамол). Для точного диагноза обратитесь к врачу.'}
+
+    # --- Головная боль ---
+    if any(w in m for w in ['голова', 'головная боль', 'мигрень', 'голова боли']):
+        return {'reply': '🧠 Головная боль бывает при усталости, стрессе, давлении или неврологических причинах. Если боль сильная/частая — обратитесь к неврологу. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Живот / ЖКТ ---
+    if any(w in m for w in ['живот', 'желудок', 'тошнота', 'рвота', 'понос', 'диарея', 'запор', 'изжога']):
+        return {'reply': '🫁 Боли в животе, тошнота или расстройство ЖКТ — повод обратиться к гастроэнтерологу или терапевту. Если боль острая — вызовите скорую (103). Для точного диагноза обратитесь к врачу.'}
+
+    # --- Сердце ---
+    if any(w in m for w in ['сердце', 'сердечное', 'давление', 'тахикардия', 'аритмия', 'инфаркт', 'боль в груди']):
+        return {'reply': '❤️ При болях в грудной клетке, учащённом сердцебиении или скачках давления — срочно к кардиологу. При острой боли вызовите 103. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Кашель / ОРВИ ---
+    if any(w in m for w in ['кашель', 'насморк', 'орви', 'простуда', 'грипп', 'чихаю', 'горло', 'ангина']):
+        return {'reply': '🤧 ОРВИ или грипп лечит терапевт. Пейте тёплые жидкости, больше отдыхайте. При высокой температуре и ухудшении — обратитесь к врачу очно. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Спина, суставы ---
+    if any(w in m for w in ['спина', 'позвоночник', 'суставы', 'колено', 'поясница', 'шея']):
+        return {'reply': '🦴 Боли в спине и суставах — к ортопеду или неврологу. При травме — к хирургу. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Кожа ---
+    if any(w in m for w in ['кожа', 'сыпь', 'зуд', 'акне', 'прыщи', 'дерматит', 'аллергия']):
+        return {'reply': '🧴 Кожные проблемы (сыпь, зуд, акне) — к дерматологу. Аллергическую реакцию также оценит аллерголог. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Глаза ---
+    if any(w in m for w in ['глаза', 'зрение', 'близорукость', 'дальнозоркость', 'линзы', 'очки']):
+        return {'reply': '👁️ Проблемы со зрением — к офтальмологу. Плановую проверку зрения рекомендуется проходить раз в год. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Зубы ---
+    if any(w in m for w in ['зубы', 'зуб', 'стоматолог', 'десна', 'боль в зубе']):
+        return {'reply': '🦷 Зубная боль — к стоматологу как можно скорее. Для снятия боли временно помогает ибупрофен. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Дети ---
+    if any(w in m for w in ['ребёнок', 'дети', 'ребенок', 'малыш', 'педиатр']):
+        return {'reply': '👶 Здоровье детей — к педиатру. В Алматы есть детские поликлиники и ДГКБ. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Психическое здоровье ---
+    if any(w in m for w in ['депрессия', 'тревога', 'психолог', 'психиатр', 'стресс', 'паника', 'бессонница']):
+        return {'reply': '🧘 Психологическое состояние важно. Обратитесь к психологу (без рецептов) или психиатру (с медикаментами). В кризисных ситуациях — телефон доверия: 150. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Диабет / эндо ---
+    if any(w in m for w in ['диабет', 'сахар', 'инсулин', 'щитовидка', 'гормоны', 'эндокринолог']):
+        return {'reply': '🩸 При симптомах диабета или гормональных нарушениях — к эндокринологу. Сдайте кровь на сахар натощак. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Женское здоровье ---
+    if any(w in m for w in ['гинеколог', 'женский врач', 'беременность', 'месячные', 'цикл']):
+        return {'reply': '🌸 Женское здоровье — к гинекологу. Плановый осмотр раз в год обязателен. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Скорая ---
+    if any(w in m for w in ['скорая', '103', 'вызвать врача', 'критическое', 'потерял сознание']):
+        return {'reply': '🚑 При критическом состоянии немедленно звоните 103 (скорая помощь). Не ждите и не занимайтесь самолечением!'}
+
+    # --- Больницы Алматы ---
+    if any(w in m for w in ['больница', 'поликлиника', 'клиника', 'алматы', 'где лечиться']):
+        return {'reply': '🏥 В MedQueue представлены более 40 больниц и поликлиник Алматы. Откройте главную страницу, выберите клинику на карте или в списке и запишитесь онлайн.'}
+
+    # --- Анализы ---
+    if any(w in m for w in ['анализы', 'кровь', 'моча', 'узи', 'мрт', 'рентген', 'обследование']):
+        return {'reply': '🔬 Для направления на анализы или инструментальную диагностику (УЗИ, МРТ, рентген) обратитесь к терапевту — он выдаст направление. Для точного диагноза обратитесь к врачу.'}
+
+    # --- Поиск специалиста ---
+    if any(w in m for w in ['какой врач', 'к какому врачу', 'специалист', 'кому записаться']):
+        return {'reply': '🩺 Если не знаете к кому идти — начните с терапевта: он поставит предварительный диагноз и направит к нужному специалисту. Для записи используйте MedQueue.'}
+
+    # --- Приветствие ---
+    if any(w in m for w in ['привет', 'здравствуй', 'хеллоу', 'hi', 'hello', 'даров', 'добрый']):
+        return {'reply': '👋 Привет! Я МедAi — ваш медицинский ассистент MedQueue. Задайте вопрос о симптомах, специалистах или записи к врачу в Алматы. 😊'}
+
+    # --- Спасибо ---
+    if any(w in m for w in ['спасибо', 'благодар', 'thanks', 'thank']):
+        return {'reply': '😊 Пожалуйста! Если появятся ещё вопросы — спрашивайте. Берегите своё здоровье!'}
+
+    # --- По умолчанию ---
+    return {
+        'reply': (
+            '🏥 Я МедAi — ассистент медпортала MedQueue (Алматы). '
+            'Могу помочь с выбором специалиста, записью к врачу или ответить на вопрос о симптомах. '
+            'Уточните свой вопрос, и я постараюсь помочь!'
+        )
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compiled fallback matcher against the legacy any() chain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=2000, help='Passes over the corpus')
+
+    def handle(self, *args, **options):
+        mismatched = [m for m in CORPUS if fallback_reply(m) != legacy_fallback(m)]
+        if mismatched:
+            raise CommandError(f'Ответы расходятся: {mismatched}')
+
+        messages = CORPUS * options['repeat']
+        results = {}
+        for name, func in (('цепочка any()', legacy_fallback), ('регулярка', fallback_reply)):
+            started = time.perf_counter()
+            for message in messages:
+                func(message)
+            elapsed = time.perf_counter() - started
+            results[name] = elapsed
+            self.stdout.write(f'{name:>14}: {elapsed * 1e6 / len(messages):7.2f} мкс/сообщение')
+
+        speedup = results['цепочка any()'] / results['регулярка']
+        self.stdout.write(self.style.SUCCESS(
+            f'Сообщений: {len(messages)}, ответы совпадают, ускорение ×{speedup:.1f}'
+        ))
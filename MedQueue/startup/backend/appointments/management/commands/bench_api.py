@@ -0,0 +1,148 @@
+"""
+Management command: python manage.py bench_api [--scale small] [--requests 300] [--concurrency 8]
+
+Нагрузочный прогон горячих эндпоинтов (см. appointments.benchmark): в
+отдельной БД bench_db генерирует больницы, врачей, пациентов и записи
+нужного масштаба, затем гоняет каждый сценарий в несколько потоков и
+печатает p50/p95/p99, SQL-запросы на ответ и ответы в секунду.
+
+Рабочая БД не трогается. С --keepdb бенчмарковая БД остаётся после прогона
+и при следующем запуске используется без повторной генерации. Отчёт в JSON
+(--output) можно сравнить с прошлым (--compare): изменения печатаются в
+процентах, с --fail-over N команда падает, если что-то ухудшилось больше
+чем на N%.
+
+  python manage.py bench_api --scale medium --keepdb --output bench/base.json
+  git checkout feature && python manage.py bench_api --scale medium --keepdb --compare bench/base.json
+"""
+
+import json
+import logging
+import platform
+import subprocess
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from appointments.benchmark import data, runner
+from appointments.benchmark.database import bench_database
+from appointments.models import Appointment, Doctor, Hospital
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic data and benchmark the hot API endpoints concurrently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', choices=list(data.SCALES))
+        parser.add_argument('--hospitals', type=int, help='Override the scale preset')
+        parser.add_argument('--doctors', type=int, help='Override the scale preset')
+        parser.add_argument('--patients', type=int, help='Override the scale preset')
+        parser.add_argument('--appointments', type=int, help='Override the scale preset')
+        parser.add_argument('--requests', type=int, default=300, help='Measured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument('--only', nargs='+', choices=list(runner.SCENARIOS), help='Scenarios to run')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database and reuse its data next time')
+        parser.add_argument('--output', help='Write the JSON report here')
+        parser.add_argument('--compare', help='Previous JSON report to diff against')
+        parser.add_argument('--fail-over', type=float,
+                            help='Exit with an error if a metric regressed by more than this many percent')
+
+    def handle(self, *args, **options):
+        scale = data.resolve_scale(
+            options['scale'], hospitals=options['hospitals'], doctors=options['doctors'],
+            patients=options['patients'], appointments=options['appointments'],
+        )
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        with bench_database('bench_db', keepdb=options['keepdb']):
+            if Hospital.objects.exists():
+                self.stdout.write('Данные уже есть в бенчмарковой БД — генерацию пропускаем')
+            else:
+                data.generate(scale, options['seed'], log=self.stdout.write)
+            try:
+                workload = runner.Workload.load(options['seed'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            report = self._report(scale, options)
+            # 409 и 400 — ожидаемая часть нагрузки, не засоряем вывод предупреждениями
+            request_logger = logging.getLogger('django.request')
+            level, request_logger.level = request_logger.level, logging.ERROR
+            try:
+                report['scenarios'] = runner.run(
+                    workload, options['only'], options['requests'], max(1, options['concurrency']),
+                    options['warmup'], options['seed'], log=self._print,
+                )
+            finally:
+                request_logger.setLevel(level)
+
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+            self.stdout.write(f'Отчёт: {path}')
+        if baseline is not None:
+            self._compare(baseline, report, options['fail_over'])
+
+    def _report(self, scale, options):
+        return {
+            'meta': {
+                'commit': _git_commit(),
+                'created_at': timezone.now().isoformat(timespec='seconds'),
+                'scale': options['scale'],
+                'requested': scale._asdict(),
+                'data': {
+                    'hospitals': Hospital.objects.count(),
+                    'doctors': Doctor.objects.count(),
+                    'appointments': Appointment.objects.count(),
+                },
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'database': f'{connection.vendor} {connection.Database.sqlite_version}'
+                            if connection.vendor == 'sqlite' else connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+        }
+
+    def _print(self, name, report):
+        latency, queries = report['latency_ms'], report['queries']
+        line = (f'{name:<20} p50 {latency["p50"]:8.2f}  p95 {latency["p95"]:8.2f}  '
+                f'p99 {latency["p99"]:8.2f} мс  запросов {queries["mean"]:5.1f}  '
+                f'{report["throughput_rps"]:7.1f} rps  {report["status"]}')
+        style = self.style.ERROR if report['errors'] else self.style.SUCCESS
+        self.stdout.write(style(line))
+
+    def _compare(self, baseline, report, fail_over):
+        changes = runner.compare(baseline, report, threshold=fail_over or 10.0)
+        self.stdout.write(f'Сравнение с {baseline.get("meta", {}).get("commit") or "прошлым отчётом"}:')
+        for change in changes:
+            percent = '—' if change.percent is None else f'{change.percent:+.1f}%'
+            line = f'  {change.scenario:<20} {change.metric:<16} {change.old:>10} → {change.new:<10} {percent}'
+            self.stdout.write(self.style.ERROR(line) if change.worse else line)
+        worse = [change for change in changes if change.worse]
+        if fail_over is not None and worse:
+            raise CommandError(f'Ухудшений больше {fail_over}%: {len(worse)}')
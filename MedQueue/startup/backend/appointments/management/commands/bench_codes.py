@@ -0,0 +1,99 @@
+"""
+Management command: python manage.py bench_codes [--rows 1000000] [--codes 5000]
+
+Сравнивает старую генерацию кодов (random.choices + exists() до промаха)
+с аллокатором appointments.codes на таблице с --rows существующих записей.
+Всё происходит в отдельной БД bench_codes (как у bench_api), рабочая не
+трогается. Строки бенчмарка пишутся и удаляются мимо save()/delete() и
+сигналов, чтобы статистика, кэши и SSE-слушатели ничего о них не узнали.
+"""
+
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from appointments.benchmark.database import bench_database
+from appointments.codes import CODE_SPACE, CodeAllocator, encode
+from appointments.models import Hospital, Appointment, CodeSequence
+
+SEQUENCE = 'bench'
+
+
+def legacy_generate_code():
+    """Генерация кодов до появления appointments.codes"""
+    chars = string.ascii_uppercase + string.digits
+    chars = chars.replace('O', '').replace('0', '').replace('I', '').replace('1', '')
+    while True:
+        code = ''.join(random.choices(chars, k=6))
+        if not Appointment.objects.filter(code=code).exists():
+            return code
+
+
+class Command(BaseCommand):
+    help = 'Benchmark appointment code generation against a large appointments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Existing appointments to create before measuring')
+        parser.add_argument('--codes', type=int, default=5_000,
+                            help='Codes to generate with each method')
+        parser.add_argument('--batch', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        with bench_database('bench_codes'):
+            self._run(options['rows'], options['codes'], options['batch'])
+
+    def _run(self, rows, codes, batch):
+        # bulk_create — без post_save, который сдвинул бы поколение кэша больниц
+        hospital, = Hospital.objects.bulk_create([Hospital(
+            name='BENCH bench_codes', type='Поликлиника', address='—', is_active=False,
+        )])
+        try:
+            self._fill(hospital, rows, batch)
+            self._measure('legacy random+exists', legacy_generate_code, codes)
+            allocator = CodeAllocator(SEQUENCE, block_size=100)
+            self._measure('CodeAllocator', allocator.next_code, codes)
+        finally:
+            # Одним DELETE без сборщика каскадов и post_delete на каждую строку
+            for queryset in (Appointment.objects.filter(hospital=hospital),
+                             Hospital.objects.filter(pk=hospital.pk),
+                             CodeSequence.objects.filter(name=SEQUENCE)):
+                queryset._raw_delete(queryset.db)
+
+    def _fill(self, hospital, rows, batch):
+        self.stdout.write(f'Создаём {rows} записей...')
+        started = time.perf_counter()
+        when = timezone.now()
+        numbers = random.sample(range(CODE_SPACE), rows)
+        for start in range(0, rows, batch):
+            Appointment.objects.bulk_create([
+                Appointment(
+                    code=encode(n), hospital=hospital, patient_name='bench',
+                    specialty='Терапевт', datetime=when, status='completed',
+                )
+                for n in numbers[start:start + batch]
+            ])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'  {rows} строк за {elapsed:.1f} с ({rows / elapsed:,.0f} строк/с)')
+
+    def _measure(self, label, generate, count):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            produced = {generate() for _ in range(count)}
+            elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{label:>22}: {elapsed / count * 1e6:8.1f} мкс/код, '
+            f'{queries / count:.3f} запросов/код, '
+            f'{count - len(produced)} повторов'
+        ))
@@ -0,0 +1,108 @@
+"""
+Management command: python manage.py bench_nearby [--facilities 50000] [--queries 2000]
+
+Сравнивает поиск ближайших больниц по сетке (geo.GridIndex) с полным
+перебором и сортировкой — тем, что делала карта в браузере. Данные
+синтетические, в памяти: точки сгущаются вокруг городов Казахстана,
+у каждой 3–8 специальностей. Заодно проверяет, что ответы совпадают.
+"""
+
+import heapq
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointments.geo import GridIndex, Place, haversine_km
+from appointments.models import SPECIALTIES_CHOICES
+
+# (широта, долгота, вес) — крупные города; остальное — равномерно по стране
+CITIES = [
+    (43.238, 76.945, 30), (51.169, 71.449, 20), (42.341, 69.590, 15), (49.806, 73.085, 8),
+    (50.283, 57.167, 6), (47.094, 51.923, 5), (52.287, 76.967, 5), (49.948, 82.628, 5),
+    (44.848, 65.482, 4), (42.900, 71.367, 4),
+]
+BOUNDS = (40.6, 55.4, 46.5, 87.3)
+
+
+def synthetic_places(count, rng):
+    specialties = [code for code, _ in SPECIALTIES_CHOICES]
+    places = []
+    for pk in range(count):
+        if rng.random() < 0.85:
+            lat, lng, _ = rng.choices(CITIES, weights=[w for *_, w in CITIES])[0]
+            lat, lng = rng.gauss(lat, 0.12), rng.gauss(lng, 0.16)
+        else:
+            lat, lng = rng.uniform(*BOUNDS[:2]), rng.uniform(*BOUNDS[2:])
+        places.append(Place(pk, lat, lng, frozenset(rng.sample(specialties, rng.randint(3, 8)))))
+    return places
+
+
+def brute_force(places, lat, lng, k, radius_km, specialty):
+    candidates = (
+        (haversine_km(lat, lng, p.lat, p.lng), p) for p in places
+        if not specialty or specialty in p.specialties
+    )
+    return heapq.nsmallest(k, ((d, p) for d, p in candidates if d <= radius_km), key=lambda item: item[0])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the nearby-hospital grid index against a brute-force scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facilities', type=int, default=50_000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--brute-queries', type=int, default=200,
+                            help='Brute force is slow; it runs on a prefix of the queries')
+        parser.add_argument('--radius', type=float, default=10.0)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--cell', type=float, default=0.05)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        places = synthetic_places(options['facilities'], rng)
+        specialties = [code for code, _ in SPECIALTIES_CHOICES]
+
+        started = time.perf_counter()
+        index = GridIndex(places, options['cell'])
+        build_ms = (time.perf_counter() - started) * 1000
+
+        queries = []
+        for _ in range(options['queries']):
+            lat, lng, _ = rng.choice(CITIES)
+            queries.append((rng.gauss(lat, 0.1), rng.gauss(lng, 0.1),
+                            rng.choice(specialties) if rng.random() < 0.7 else None))
+
+        k, radius = options['limit'], options['radius']
+        grid_times, results = [], []
+        for lat, lng, specialty in queries:
+            started = time.perf_counter()
+            results.append(index.nearest(lat, lng, k, radius, specialty))
+            grid_times.append(time.perf_counter() - started)
+
+        brute_times = []
+        for i, (lat, lng, specialty) in enumerate(queries[:options['brute_queries']]):
+            started = time.perf_counter()
+            expected = brute_force(places, lat, lng, k, radius, specialty)
+            brute_times.append(time.perf_counter() - started)
+            if [p.id for _, p in expected] != [p.id for _, p in results[i]]:
+                self.stderr.write(self.style.ERROR(f'Расхождение с перебором на запросе {i}'))
+                return
+
+        def report(name, times):
+            ordered = sorted(times)
+            p50 = statistics.median(ordered) * 1000
+            p99 = ordered[max(0, int(len(ordered) * 0.99) - 1)] * 1000
+            self.stdout.write(f'{name:<12} p50 {p50:8.3f} мс   p99 {p99:8.3f} мс   ({len(times)} запросов)')
+            return p50
+
+        self.stdout.write(f'Больниц: {len(places)}, клеток: {len(index.cells)}, '
+                          f'построение индекса: {build_ms:.0f} мс')
+        grid_p50 = report('Сетка', grid_times)
+        brute_p50 = report('Перебор', brute_times)
+        found = statistics.mean(len(r) for r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответы совпадают; в среднем найдено {found:.1f}, ускорение по p50 ×{brute_p50 / grid_p50:.0f}'
+        ))
@@ -0,0 +1,88 @@
+"""
+Management command: python manage.py bench_queue_events [--clients 2000] [--duration 10]
+
+Нагрузочный тест живых обновлений очереди. --clients подписчиков слушают
+канал одной больницы, пока из другого потока (как из синхронных view)
+публикуются изменения очереди. Отчёт сравнивает число HTTP-запросов в час,
+которое сделали бы те же клиенты при опросе check/ каждые --poll-interval
+секунд, с числом переподключений SSE, и показывает задержку доставки событий.
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from appointments.events import InMemoryBroker
+
+
+class Command(BaseCommand):
+    help = 'Load-test queue event fan-out and compare it with polling traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds to run the simulation')
+        parser.add_argument('--bookings-per-minute', type=float, default=120.0)
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Polling interval the SSE stream replaces')
+
+    def handle(self, *args, **options):
+        clients  = options['clients']
+        duration = options['duration']
+        interval = 60.0 / options['bookings_per_minute']
+        result = asyncio.run(self._run(clients, duration, interval))
+
+        # Трафик в пересчёте на час: опрос против переподключений SSE
+        stream_timeout = getattr(settings, 'QUEUE_EVENTS_STREAM_TIMEOUT', 300)
+        polls = clients * 3600 / options['poll_interval']
+        connections = clients * 3600 / stream_timeout
+        latencies = sorted(result['latencies'])
+
+        self.stdout.write(f'Клиентов: {clients}, событий: {result["published"]}, '
+                          f'доставлено: {len(latencies)} из {result["published"] * clients}')
+        if latencies:
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            self.stdout.write(f'Задержка доставки: p50 {p50:.2f} мс, p99 {p99:.2f} мс')
+        self.stdout.write(self.style.SUCCESS(
+            f'В час: опрос каждые {options["poll_interval"]:g} с — {polls:,.0f} HTTP-запросов; '
+            f'SSE — {connections:,.0f} соединений, '
+            f'убрано {max(0.0, 1 - connections / polls) * 100:.1f}% запросов'
+        ))
+
+    async def _run(self, clients, duration, interval):
+        broker = InMemoryBroker(max_pending=1000)
+        channel = 'hospital:bench:day'
+        subscriptions = [broker.subscribe(channel) for _ in range(clients)]
+        latencies = []
+        published = 0
+        stop = threading.Event()
+
+        def publisher():
+            nonlocal published
+            while not stop.is_set():
+                broker.publish(channel, {'event': 'created', 'sent_at': time.perf_counter()})
+                published += 1
+                stop.wait(interval)
+
+        async def listen(subscription):
+            while True:
+                event = await subscription.get()
+                latencies.append(time.perf_counter() - event['sent_at'])
+
+        listeners = [asyncio.create_task(listen(s)) for s in subscriptions]
+        thread = threading.Thread(target=publisher, daemon=True)
+        thread.start()
+        await asyncio.sleep(duration)
+        stop.set()
+        thread.join()
+        await asyncio.sleep(0.2)  # дать доставить последние события
+        for task in listeners:
+            task.cancel()
+        for subscription in subscriptions:
+            subscription.close()
+        return {'published': published, 'latencies': latencies}
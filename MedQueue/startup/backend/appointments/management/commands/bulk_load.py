@@ -0,0 +1,40 @@
+"""
+Management command: python manage.py bulk_load FILE [FILE ...] [--batch 2000]
+
+Загружает больницы, врачей и записи из JSON/CSV (см. appointments.seeding):
+сверяет с таблицами в памяти и пишет пачками bulk_create/bulk_update.
+Порядок файлов не важен — сначала больницы, потом врачи, потом записи.
+По каждому файлу печатает, сколько строк в секунду получилось.
+
+  python manage.py bulk_load hospitals.json doctors.csv
+  python manage.py bulk_load appointments-2026.csv --batch 5000
+"""
+
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import seeding
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load hospitals, doctors and appointments from JSON/CSV fixtures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='hospitals*, doctors*, appointments* (.json/.csv)')
+        parser.add_argument('--batch', type=int, default=seeding.BATCH_SIZE,
+                            help='Rows per bulk statement and transaction')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch'])
+        try:
+            fixtures = defaultdict(list)
+            for path in options['files']:
+                for kind, rows in seeding.read_fixture(path):
+                    fixtures[kind].append(rows)
+            for kind in seeding.KINDS:
+                for rows in fixtures[kind]:
+                    report = seeding.LOADERS[kind](rows, batch_size)
+                    self.stdout.write(self.style.SUCCESS(str(report)))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
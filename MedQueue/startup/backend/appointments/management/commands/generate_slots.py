@@ -0,0 +1,43 @@
+"""
+Management command: python manage.py generate_slots [--days 28] [--from 2026-01-01]
+
+Предрасчитывает сетку слотов (DoctorSlotDay) активных врачей на --days дней
+вперёд. Запросы свободных слотов досчитывают недостающие дни сами, команда
+нужна, чтобы первый запрос после смены расписания не платил за расчёт.
+"""
+
+import datetime as dt
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import schedule
+from appointments.models import Doctor
+
+
+class Command(BaseCommand):
+    help = 'Precompute bookable slot bitmaps for active doctors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'SCHEDULE_HORIZON_DAYS', 28))
+        parser.add_argument('--from', dest='first', help='First day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--batch', type=int, default=200, help='Doctors per batch')
+
+    def handle(self, *args, **options):
+        try:
+            first = dt.date.fromisoformat(options['first']) if options['first'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--from должен быть в формате YYYY-MM-DD')
+        last = first + dt.timedelta(days=max(1, options['days']) - 1)
+
+        started = time.perf_counter()
+        doctor_ids = list(Doctor.objects.filter(is_active=True).values_list('id', flat=True))
+        rows = 0
+        for i in range(0, len(doctor_ids), options['batch']):
+            rows += schedule.generate(doctor_ids[i:i + options['batch']], first, last)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Сетка слотов {first}–{last}: врачей {len(doctor_ids)}, дней {rows} за {elapsed:.2f} с'
+        ))
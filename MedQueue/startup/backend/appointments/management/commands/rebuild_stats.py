@@ -0,0 +1,18 @@
+"""
+Management command: python manage.py rebuild_stats
+
+Пересчитывает AppointmentStat по таблице записей. Нужен после массовых
+изменений в обход save() (queryset.update, loaddata, правки в SQL).
+"""
+
+from django.core.management.base import BaseCommand
+
+from appointments.models import AppointmentStat
+
+
+class Command(BaseCommand):
+    help = 'Recompute appointment statistics from the appointments table'
+
+    def handle(self, *args, **options):
+        cells = AppointmentStat.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Статистика пересчитана: {cells} ячеек'))
@@ -3,9 +3,14 @@ Management command: python manage.py seed_doctors
 
 Populates the Doctor table with realistic data for every hospital.
 Safe to re-run — skips hospitals that already have doctors.
+Doctors are written in bulk through appointments.seeding.
 """
 
+from collections import Counter
+
 from django.core.management.base import BaseCommand
+
+from appointments import seeding
 from appointments.models import Hospital, Doctor
 
 # ---------------------------------------------------------------------------
@@ -163,20 +168,21 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         force = options['force']
-        total_created = 0
 
-        hospitals = Hospital.objects.all().order_by('name')
+        hospitals = Hospital.objects.order_by('name').values_list('id', 'name')
+        staffed = Counter(Doctor.objects.order_by().values_list('hospital_id', flat=True))
 
         # Index pointers so we rotate through doctor name lists
         pointers = {spec: 0 for spec in DOCTORS_BY_SPECIALTY}
+        rows = []
 
-        for hospital in hospitals:
-            existing = Doctor.objects.filter(hospital=hospital).count()
+        for hospital_id, hospital_name in hospitals:
+            existing = staffed[hospital_id]
             if existing and not force:
-                self.stdout.write(f'  skip  {hospital.name} (уже {existing} врачей)')
+                self.stdout.write(f'  skip  {hospital_name} (уже {existing} врачей)')
                 continue
 
-            specs, count = get_profile(hospital.name)
+            specs, count = get_profile(hospital_name)
             created = 0
 
             for spec in specs:
@@ -189,24 +195,23 @@ class Command(BaseCommand):
                     name, cab, days, hours = pool[idx]
                     pointers[spec] += 1
 
-                    Doctor.objects.get_or_create(
-                        hospital=hospital,
+                    rows.append(dict(
+                        hospital_id=hospital_id,
                         full_name=name,
                         specialty=spec,
-                        defaults=dict(
-                            cabinet=cab,
-                            work_days=days,
-                            work_hours=hours,
-                            is_active=True,
-                        )
-                    )
+                        cabinet=cab,
+                        work_days=days,
+                        work_hours=hours,
+                        is_active=True,
+                    ))
                     created += 1
 
-            total_created += created
             self.stdout.write(self.style.SUCCESS(
-                f'  ✓  {hospital.name}  →  {created} врачей'
+                f'  ✓  {hospital_name}  →  {created} врачей'
             ))
 
+        # Одна сверка с таблицей и bulk_create вместо get_or_create на каждого врача
+        report = seeding.load_doctors(rows)
         self.stdout.write(self.style.SUCCESS(
-            f'\nГотово! Всего добавлено: {total_created} врачей.'
+            f'\nГотово! Всего добавлено: {report.created} врачей ({report}).'
         ))
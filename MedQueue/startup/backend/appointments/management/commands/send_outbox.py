@@ -0,0 +1,33 @@
+"""
+Management command: python manage.py send_outbox [--loop] [--interval 5]
+
+Отправляет письма из очереди OutboundEmail. Без --loop — одна полная
+разборка очереди (удобно для cron), с --loop — постоянный воркер.
+Для этого режима выставьте EMAIL_OUTBOX_WORKER=command.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from appointments import mailer
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails over a reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the outbox')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls in --loop mode')
+        parser.add_argument('--batch', type=int, default=mailer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = mailer.dispatch_all(options['batch'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Отправлено писем: {sent}'))
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
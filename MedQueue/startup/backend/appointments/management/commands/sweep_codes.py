@@ -0,0 +1,39 @@
+"""
+Management command: python manage.py sweep_codes [--loop] [--interval 600] [--batch 500]
+
+Удаляет истёкшие коды подтверждения email и сброса пароля, просроченные
+брони слотов и старые отправленные письма пачками (см. appointments.expiry). Без --loop — один проход
+(удобно для cron), с --loop — постоянный воркер; для него выставьте
+CODE_SWEEPER=command.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from appointments import expiry
+
+
+class Command(BaseCommand):
+    help = 'Delete expired verification/password reset codes, slot holds and old outbox emails in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and sweep periodically')
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'CODE_SWEEP_INTERVAL', 600),
+                            help='Seconds between sweeps in --loop mode')
+        parser.add_argument('--batch', type=int, default=expiry.BATCH_SIZE, help='Rows per DELETE')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches to let writers through')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = expiry.sweep(max(1, options['batch']), options['pause'])
+            if any(deleted.values()) or not options['loop']:
+                summary = ', '.join(f'{name}: {count}' for name, count in deleted.items())
+                self.stdout.write(self.style.SUCCESS(f'Удалено истёкших строк — {summary}'))
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
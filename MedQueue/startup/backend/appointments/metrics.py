@@ -0,0 +1,274 @@
+"""
+Метрики процесса в формате Prometheus: GET /metrics.
+
+Счётчики и гистограммы живут в памяти процесса. Чтобы инструментирование
+само не стало узким местом, каждый поток пишет в свою «шарду» (словарь в
+threading.local) без блокировок: писатель у шарды один, а чтение при
+выдаче /metrics собирает шарды всех потоков. Блокировка берётся только
+при появлении нового потока и при его завершении — шарда умершего потока
+сливается в общий итог, так что значения не теряются и шарды не копятся.
+
+Гейджи вроде глубины очереди не хранятся, а считаются при выдаче функцией
+collect. При нескольких воркерах у каждого свои числа — Prometheus
+суммирует их по instance.
+
+Если задан METRICS_TOKEN, /metrics требует заголовок
+Authorization: Bearer <токен>. Без токена эндпоинт открыт только при
+DEBUG, иначе отвечает 404: в метриках есть очередь каждой больницы.
+"""
+
+import bisect
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils import timezone
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Секунды: от быстрого ответа БД до таймаута LLM-провайдера
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Shard:
+    """Значения одного потока; когда поток умирает, finalize сливает их в итог"""
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self):
+        self.values = {}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._live = {}     # id(шарды) → values живых потоков
+        self._retired = {}  # итог завершившихся потоков
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name}: ожидались метки {self.labels}, получены {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _values(self):
+        """Словарь значений текущего потока"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._live[id(shard)] = shard.values
+            weakref.finalize(shard, self._retire, id(shard), shard.values)
+        return shard.values
+
+    def _retire(self, shard_id, values):
+        with self._lock:
+            self._live.pop(shard_id, None)
+            for key, value in values.items():
+                self._retired[key] = self._merge(self._retired.get(key), value)
+
+    def collect(self):
+        """{метки: значение} по всем потокам"""
+        with self._lock:
+            parts = [dict(self._retired)] + [dict(values) for values in self._live.values()]
+        total = {}
+        for part in parts:
+            for key, value in part.items():
+                total[key] = self._merge(total.get(key), value)
+        return total
+
+    def _merge(self, a, b):
+        raise NotImplementedError
+
+    def samples(self):
+        """[(имя, {метка: значение}, число)] для выдачи"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self._values()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def _merge(self, a, b):
+        return (a or 0) + b
+
+    def samples(self):
+        return [(self.name, dict(zip(self.labels, key)), value)
+                for key, value in sorted(self.collect().items())]
+
+
+class Histogram(_Metric):
+    """Состояние на метки: [по корзинам..., сумма, число] — без накопления, оно при выдаче"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = self._values()
+        key = self._key(labels)
+        state = values.get(key)
+        if state is None:
+            state = values[key] = [0] * (len(self.buckets) + 3)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет блок; метки можно дописать в словарь, который он отдаёт"""
+        labels = dict(labels)
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _merge(self, a, b):
+        return list(b) if a is None else [x + y for x, y in zip(a, b)]
+
+    def samples(self):
+        samples = []
+        for key, state in sorted(self.collect().items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f'{self.name}_sum', labels, state[-2]))
+            samples.append((f'{self.name}_count', labels, state[-1]))
+        return samples
+
+
+class Gauge:
+    """Значение считается при выдаче: collect() → {(значения меток): число}"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        return [(self.name, dict(zip(self.labels, map(str, key))), value)
+                for key, value in sorted(self.collect().items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, labels=(), collect=None):
+        return self.register(Gauge(name, documentation, labels, collect))
+
+    def expose(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                    name = f'{name}{{{pairs}}}'
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# ── Метрики MedQueue ──────────────────────────────────────────────────────────
+
+registry = Registry()
+
+bookings = registry.counter(
+    'medqueue_bookings_total', 'Попытки записи через API по исходу', ['outcome'])
+booking_seconds = registry.histogram(
+    'medqueue_booking_seconds', 'Время создания записи через API')
+cancellations = registry.counter(
+    'medqueue_cancellations_total', 'Отменённые записи: пациентом по коду или врачом', ['by'])
+emails = registry.counter(
+    'medqueue_emails_total', 'Письма из очереди OutboundEmail по исходу отправки', ['outcome'])
+smtp_seconds = registry.histogram(
+    'medqueue_smtp_seconds', 'SMTP: подключение к серверу и отправка одного письма', ['operation', 'outcome'])
+recaptcha_checks = registry.counter(
+    'medqueue_recaptcha_checks_total', 'Проверки reCAPTCHA по исходу', ['outcome'])
+recaptcha_seconds = registry.histogram(
+    'medqueue_recaptcha_seconds', 'Запрос к Google reCAPTCHA', ['outcome'])
+ai_answers = registry.counter(
+    'medqueue_ai_answers_total', 'Ответы ИИ-ассистента по источнику (провайдер, cache, fallback)', ['source'])
+ai_first_token_seconds = registry.histogram(
+    'medqueue_ai_first_token_seconds', 'Время до первого токена LLM-провайдера, ответ которого взят',
+    ['provider'])
+ai_provider_errors = registry.counter(
+    'medqueue_ai_provider_errors_total', 'Ошибки LLM-провайдеров', ['provider'])
+expired_swept = registry.counter(
+    'medqueue_expired_swept_total', 'Удалённые истёкшие коды подтверждения, сброса пароля и брони слотов',
+    ['model'])
+
+
+def _queue_depth():
+    """Подтверждённые записи с текущего момента до конца дня — по больницам"""
+    from .models import Appointment, day_bounds
+    now = timezone.now()
+    _, end = day_bounds(timezone.localdate())
+    rows = (Appointment.objects.filter(status='confirmed', datetime__gte=now, datetime__lt=end)
+            .order_by().values_list('hospital_id').annotate(count=Count('id')))
+    return {(hospital_id,): count for hospital_id, count in rows}
+
+
+queue_depth = registry.gauge(
+    'medqueue_queue_depth', 'Ожидающие сегодня подтверждённые записи по больницам', ['hospital'],
+    collect=_queue_depth)
+
+
+def metrics_view(request):
+    """GET /metrics"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        return HttpResponseNotFound()
+    if token and request.META.get('HTTP_AUTHORIZATION', '') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type=CONTENT_TYPE)
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_add_comment_to_appointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('last_position', models.PositiveIntegerField(default=0, verbose_name='Последнее место')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_counters', to='appointments.hospital', verbose_name='Больница')),
+            ],
+            options={
+                'verbose_name': 'Счётчик очереди',
+                'verbose_name_plural': 'Счётчики очереди',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='queuecounter',
+            constraint=models.UniqueConstraint(fields=('hospital', 'day'), name='unique_queue_counter_per_day'),
+        ),
+    ]
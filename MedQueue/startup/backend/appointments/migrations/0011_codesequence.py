@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True, verbose_name='Пространство кодов')),
+                ('last_value', models.BigIntegerField(default=0, verbose_name='Выдано номеров')),
+            ],
+            options={
+                'verbose_name': 'Последовательность кодов',
+                'verbose_name_plural': 'Последовательности кодов',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0 on 2026-10-18 15:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_codesequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['hospital', 'status', 'datetime'], name='appt_hospital_status_dt'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'datetime'], name='appt_doctor_status_dt'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', '-created_at'], name='appt_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresetcode',
+            index=models.Index(fields=['email', '-created_at'], name='reset_email_created'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(fields=['email', '-created_at'], name='verif_email_created'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 15:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_outboundemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorinvitecode',
+            index=models.Index(fields=['-created_at', '-id'], name='invite_created_id'),
+        ),
+        # Список пользователей в админке: keyset по (date_joined, id).
+        # auth_user принадлежит django.contrib.auth, поэтому индекс — через SQL
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_joined_id ON auth_user (date_joined DESC, id DESC)',
+            reverse_sql='DROP INDEX auth_user_joined_id',
+        ),
+    ]
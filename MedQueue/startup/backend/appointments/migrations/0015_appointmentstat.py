@@ -0,0 +1,49 @@
+# Generated by Django 5.0 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_stats(apps, schema_editor):
+    """Статистика по уже существующим записям (то же, что AppointmentStat.rebuild)"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentStat = apps.get_model('appointments', 'AppointmentStat')
+    counts = (
+        Appointment.objects.order_by()
+        .annotate(day=TruncDate('datetime'))
+        .values('day', 'hospital_id', 'specialty', 'status')
+        .annotate(count=Count('id'))
+    )
+    AppointmentStat.objects.bulk_create([AppointmentStat(**row) for row in counts], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День приёма')),
+                ('specialty', models.CharField(max_length=50, verbose_name='Специальность')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Записей')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to='appointments.hospital', verbose_name='Больница')),
+            ],
+            options={
+                'verbose_name': 'Статистика записей',
+                'verbose_name_plural': 'Статистика записей',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentstat',
+            constraint=models.UniqueConstraint(fields=('day', 'hospital', 'specialty', 'status'), name='unique_appointment_stat_bucket'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
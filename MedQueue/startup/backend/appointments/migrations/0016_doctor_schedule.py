@@ -0,0 +1,119 @@
+# Generated by Django 5.0 on 2026-10-18 15:28
+
+import datetime
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия разбора из appointments/schedule.py на момент миграции: миграция
+# не должна зависеть от того, как этот код изменится потом
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+_DASHES = re.compile(r'\s*[-‐‑‒–—―]\s*')
+_HOURS = re.compile(r'^(\d{1,2})[:.](\d{2})-(\d{1,2})[:.](\d{2})$')
+
+
+def parse_work_days(text):
+    text = _DASHES.sub('-', (text or '').strip().lower())
+    if text.startswith('ежедневно') or 'без выходных' in text:
+        return list(range(7))
+    days = set()
+    for part in re.split(r'[,;/\s]+', text):
+        if not part:
+            continue
+        names = part.split('-')
+        try:
+            numbers = [WEEKDAYS.index(name[:2]) for name in names]
+        except ValueError:
+            raise ValueError(text)
+        if len(numbers) == 2:
+            first, last = numbers
+            days.update((first + i) % 7 for i in range((last - first) % 7 + 1))
+        else:
+            days.update(numbers)
+    if not days:
+        raise ValueError(text)
+    return sorted(days)
+
+
+def parse_work_hours(text):
+    text = _DASHES.sub('-', (text or '').strip().lower())
+    if text.startswith('круглосуточно'):
+        return datetime.time(0), datetime.time(0)
+    match = _HOURS.match(text)
+    if not match:
+        raise ValueError(text)
+    h1, m1, h2, m2 = map(int, match.groups())
+    if h1 > 23 or h2 > 24 or m1 > 59 or m2 > 59 or (h2 == 24 and m2):
+        raise ValueError(text)
+    return datetime.time(h1, m1), datetime.time(h2 % 24, m2)
+
+
+def intervals_from_text(work_days, work_hours):
+    try:
+        days = parse_work_days(work_days)
+        start, end = parse_work_hours(work_hours)
+    except ValueError:
+        return []
+    return [(day, start, end) for day in days]
+
+
+def fill_schedule(apps, schema_editor):
+    """Структурное расписание из текстовых work_days/work_hours существующих врачей"""
+    Doctor = apps.get_model('appointments', 'Doctor')
+    DoctorSchedule = apps.get_model('appointments', 'DoctorSchedule')
+    rows = [
+        DoctorSchedule(doctor_id=pk, weekday=day, start=start, end=end, slot_minutes=30)
+        for pk, work_days, work_hours in Doctor.objects.values_list('id', 'work_days', 'work_hours')
+        for day, start, end in intervals_from_text(work_days, work_hours)
+    ]
+    DoctorSchedule.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0015_appointmentstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')], verbose_name='День недели')),
+                ('start', models.TimeField(verbose_name='Начало')),
+                ('end', models.TimeField(help_text='00:00 — до полуночи', verbose_name='Конец')),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30, verbose_name='Длина слота, мин')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='appointments.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Интервал расписания',
+                'verbose_name_plural': 'Расписание врачей',
+                'ordering': ['doctor_id', 'weekday', 'start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorSlotDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slot_minutes', models.PositiveSmallIntegerField()),
+                ('mask', models.BinaryField(null=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_days', to='appointments.doctor')),
+            ],
+            options={
+                'verbose_name': 'Сетка слотов на день',
+                'verbose_name_plural': 'Сетки слотов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctorschedule',
+            constraint=models.UniqueConstraint(fields=('doctor', 'weekday', 'start'), name='unique_doctor_schedule_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='doctorslotday',
+            constraint=models.UniqueConstraint(fields=('doctor', 'day'), name='unique_doctor_slot_day'),
+        ),
+        migrations.RunPython(fill_schedule, migrations.RunPython.noop),
+    ]
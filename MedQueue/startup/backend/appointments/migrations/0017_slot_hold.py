@@ -0,0 +1,54 @@
+# Generated by Django 5.0 on 2026-10-18 15:32
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def fill_slot_holds(apps, schema_editor):
+    """
+    Занятое время по уже подтверждённым записям к врачам. Если на один слот
+    уже записано несколько человек (старые двойные брони), слот занимает
+    первая запись, остальные остаются как есть.
+    """
+    Appointment = apps.get_model('appointments', 'Appointment')
+    SlotHold = apps.get_model('appointments', 'SlotHold')
+    seen = set()
+    rows = []
+    for pk, doctor_id, slot in (Appointment.objects.filter(status='confirmed', doctor__isnull=False)
+                                .order_by('id').values_list('id', 'doctor_id', 'datetime').iterator()):
+        if (doctor_id, slot) not in seen:
+            seen.add((doctor_id, slot))
+            rows.append(SlotHold(doctor_id=doctor_id, slot=slot, appointment_id=pk))
+    SlotHold.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0016_doctor_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.DateTimeField(verbose_name='Время приёма')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Пусто — слот занят записью', null=True, verbose_name='Бронь до')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='slot_hold', to='appointments.appointment', verbose_name='Запись')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='appointments.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Занятое время врача',
+                'verbose_name_plural': 'Занятое время врачей',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='slothold',
+            constraint=models.UniqueConstraint(fields=('doctor', 'slot'), name='unique_doctor_slot'),
+        ),
+        migrations.RunPython(fill_slot_holds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-18 16:10
+
+import datetime
+
+import appointments.models
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_expires_at(apps, schema_editor):
+    """Срок уже выданных кодов — от created_at, как раньше считал is_expired()"""
+    for name, ttl in (('VerificationCode', datetime.timedelta(minutes=10)),
+                      ('PasswordResetCode', datetime.timedelta(minutes=15))):
+        apps.get_model('appointments', name).objects.update(expires_at=F('created_at') + ttl)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0017_slot_hold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationcode',
+            name='expires_at',
+            field=models.DateTimeField(null=True, verbose_name='Действует до'),
+        ),
+        migrations.AddField(
+            model_name='passwordresetcode',
+            name='expires_at',
+            field=models.DateTimeField(null=True, verbose_name='Действует до'),
+        ),
+        migrations.RunPython(fill_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='verificationcode',
+            name='expires_at',
+            field=models.DateTimeField(default=appointments.models.verification_code_expiry, verbose_name='Действует до'),
+        ),
+        migrations.AlterField(
+            model_name='passwordresetcode',
+            name='expires_at',
+            field=models.DateTimeField(default=appointments.models.password_reset_code_expiry, verbose_name='Действует до'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(fields=['expires_at'], name='verif_expires'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresetcode',
+            index=models.Index(fields=['expires_at'], name='reset_expires'),
+        ),
+    ]
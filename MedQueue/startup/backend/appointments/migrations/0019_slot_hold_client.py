@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0018_code_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slothold',
+            name='client',
+            field=models.CharField(blank=True, default='', help_text='user:<id> или ip:<адрес> — кто взял временную бронь', max_length=64, verbose_name='Клиент'),
+        ),
+        migrations.AddIndex(
+            model_name='slothold',
+            index=models.Index(fields=['client', 'expires_at'], name='slothold_client_expires'),
+        ),
+        migrations.AddIndex(
+            model_name='slothold',
+            index=models.Index(fields=['expires_at'], name='slothold_expires'),
+        ),
+    ]
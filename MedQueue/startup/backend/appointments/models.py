@@ -1,8 +1,60 @@
-from django.db import models
+import datetime as dt
+import uuid
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.dispatch import Signal
 from django.contrib.auth.models import User
 from django.utils import timezone
-import random
-import string
+
+from .codes import appointment_codes, invite_codes
+
+
+class HospitalQuerySet(models.QuerySet):
+    """QuerySet больниц с готовыми агрегатами для API"""
+
+    def with_queue_counts(self):
+        """
+        Добавляет queue_count — число подтверждённых будущих записей.
+        Считается одним GROUP BY вместо COUNT(*) на каждую больницу.
+        """
+        return self.annotate(
+            queue_count=Count(
+                'appointments',
+                filter=Q(
+                    appointments__status='confirmed',
+                    appointments__datetime__gte=timezone.now(),
+                ),
+            )
+        )
+
+    def with_admin_stats(self):
+        """
+        Агрегаты для админ-панели одним запросом: активные врачи и покрытие
+        специальностей (JOIN врачей), очередь и число записей — подзапросами,
+        чтобы JOIN записей не размножал строки врачей. Записи считаются по
+        AppointmentStat, будущая очередь — по индексу appt_hospital_status_dt.
+        """
+        today = timezone.localdate()
+
+        def stat_sum(**filters):
+            cells = AppointmentStat.objects.filter(hospital=OuterRef('pk'), **filters).order_by()
+            return Coalesce(Subquery(
+                cells.values('hospital').annotate(total=Sum('count')).values('total')[:1]
+            ), 0)
+
+        queue = Appointment.objects.filter(
+            hospital=OuterRef('pk'), status='confirmed', datetime__gte=timezone.now(),
+        ).order_by().values('hospital').annotate(total=Count('id')).values('total')[:1]
+
+        return self.annotate(
+            doctor_count=Count('doctors', filter=Q(doctors__is_active=True), distinct=True),
+            specialty_count=Count('doctors__specialty', filter=Q(doctors__is_active=True), distinct=True),
+            queue_count=Coalesce(Subquery(queue), 0),
+            queue_today=stat_sum(day=today, status='confirmed'),
+            appointment_count=stat_sum(),
+        )
 
 
 class Hospital(models.Model):
@@ -26,6 +78,8 @@ class Hospital(models.Model):
     is_active    = models.BooleanField(default=True, verbose_name="Активна")
     created_at   = models.DateTimeField(auto_now_add=True)
 
+    objects = HospitalQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Больница"
         verbose_name_plural = "Больницы"
@@ -37,6 +91,9 @@ class Hospital(models.Model):
     @property
     def current_queue(self):
         """Количество людей в очереди прямо сейчас"""
+        # Если queryset собран через with_queue_counts() — берём готовое значение
+        if hasattr(self, 'queue_count'):
+            return self.queue_count
         return self.appointments.filter(
             status='confirmed',
             datetime__gte=timezone.now()
@@ -59,6 +116,22 @@ SPECIALTIES_CHOICES = [
 ]
 
 
+class DoctorQuerySet(models.QuerySet):
+    """QuerySet врачей с готовыми агрегатами для API"""
+
+    def with_queue_counts(self):
+        """Добавляет queue_count — очередь к врачу, одним агрегатом на весь список"""
+        return self.annotate(
+            queue_count=Count(
+                'appointments',
+                filter=Q(
+                    appointments__status='confirmed',
+                    appointments__datetime__gte=timezone.now(),
+                ),
+            )
+        )
+
+
 class Doctor(models.Model):
     """Модель врача"""
     hospital = models.ForeignKey(
@@ -79,6 +152,8 @@ class Doctor(models.Model):
     work_hours = models.CharField(max_length=50, default="08:00-18:00", verbose_name="Рабочие часы")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
 
+    objects = DoctorQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Врач"
         verbose_name_plural = "Врачи"
@@ -90,11 +165,113 @@ class Doctor(models.Model):
     @property
     def current_queue(self):
         """Количество человек в очереди к этому врачу сейчас"""
+        if hasattr(self, 'queue_count'):
+            return self.queue_count
         return self.appointments.filter(
             status='confirmed',
             datetime__gte=timezone.now()
         ).count()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Текст расписания при загрузке: если его поменяют, структурное
+        # расписание DoctorSchedule пересобирается (см. signals.py)
+        state = instance.__dict__
+        if 'work_days' in state and 'work_hours' in state:
+            instance._schedule_text = (state['work_days'], state['work_hours'])
+        return instance
+
+
+WEEKDAY_CHOICES = [
+    (0, 'Понедельник'),
+    (1, 'Вторник'),
+    (2, 'Среда'),
+    (3, 'Четверг'),
+    (4, 'Пятница'),
+    (5, 'Суббота'),
+    (6, 'Воскресенье'),
+]
+
+
+class DoctorSchedule(models.Model):
+    """
+    Рабочий интервал врача в день недели, нарезаемый на слоты приёма.
+    Заполняется из текстовых work_days/work_hours (appointments.schedule),
+    можно править вручную в админке врача.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='schedule',
+                               verbose_name="Врач")
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name="День недели")
+    start = models.TimeField(verbose_name="Начало")
+    end = models.TimeField(verbose_name="Конец", help_text="00:00 — до полуночи")
+    slot_minutes = models.PositiveSmallIntegerField(default=30, verbose_name="Длина слота, мин")
+
+    class Meta:
+        verbose_name = "Интервал расписания"
+        verbose_name_plural = "Расписание врачей"
+        ordering = ['doctor_id', 'weekday', 'start']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'weekday', 'start'], name='unique_doctor_schedule_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id}: {self.get_weekday_display()} {self.start:%H:%M}–{self.end:%H:%M}"
+
+
+class DoctorSlotDay(models.Model):
+    """
+    Предрасчитанная сетка приёма врача на день: бит i маски — слот,
+    начинающийся через i * slot_minutes минут после полуночи (местное время).
+    mask = NULL — расписание врача неизвестно (текст не разобран).
+    Строки создаются appointments.schedule.generate и удаляются при
+    изменении расписания; занятость берётся из записей, а не из маски.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_days')
+    day = models.DateField()
+    slot_minutes = models.PositiveSmallIntegerField()
+    mask = models.BinaryField(null=True)
+
+    class Meta:
+        verbose_name = "Сетка слотов на день"
+        verbose_name_plural = "Сетки слотов"
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day'], name='unique_doctor_slot_day'),
+        ]
+
+
+def day_bounds(first, last=None):
+    """
+    Полуинтервал [начало first, начало дня после last) в местном времени.
+    Фильтр datetime__gte/__lt по нему использует индексы по datetime,
+    в отличие от datetime__date=, который оборачивает столбец в функцию.
+    """
+    last = last or first
+    start = timezone.make_aware(dt.datetime.combine(first, dt.time.min))
+    end = timezone.make_aware(dt.datetime.combine(last + dt.timedelta(days=1), dt.time.min))
+    return start, end
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """QuerySet записей с фильтрами по дням, пригодными для индексов"""
+
+    def on_days(self, first, last=None):
+        """Записи с first по last включительно (по местному времени)"""
+        start, end = day_bounds(first, last)
+        return self.filter(datetime__gte=start, datetime__lt=end)
+
+    def for_status(self):
+        """
+        Ровно то, что показывает AppointmentStatusSerializer: больница и врач
+        одним JOIN вместо двух запросов на каждую запись, без лишних колонок.
+        """
+        return self.select_related('hospital', 'doctor').only(
+            'code', 'user', 'patient_name', 'specialty', 'datetime', 'queue_position',
+            'status', 'comment', 'created_at',
+            'hospital__name', 'hospital__address', 'hospital__type',
+            'doctor__full_name', 'doctor__cabinet',
+        )
+
 
 class Appointment(models.Model):
     """Модель записи на приём"""
@@ -141,46 +318,409 @@ class Appointment(models.Model):
     comment = models.TextField(blank=True, default='', verbose_name="Комментарий пациента")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AppointmentQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
         ordering = ['-created_at']
+        indexes = [
+            # Очередь больницы на день: next_position, renumber, current_queue
+            models.Index(fields=['hospital', 'status', 'datetime'], name='appt_hospital_status_dt'),
+            # Очередь врача и портал врача
+            models.Index(fields=['doctor', 'status', 'datetime'], name='appt_doctor_status_dt'),
+            # «Мои записи»
+            models.Index(fields=['user', '-created_at'], name='appt_user_created'),
+        ]
     
     def __str__(self):
         return f"{self.code} - {self.patient_name} ({self.hospital.name})"
     
     def save(self, *args, **kwargs):
-        # Генерируем уникальный код при создании
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        # Генерируем уникальный код при создании (до транзакции —
+        # так аллокатор раздаёт коды из блока в памяти без запросов)
         if not self.code:
             self.code = self.generate_unique_code()
-        
-        # Автоматически присваиваем место в очереди
-        if not self.queue_position or self.queue_position == 1:
-            same_day_appointments = Appointment.objects.filter(
-                hospital=self.hospital,
-                datetime__date=self.datetime.date(),
-                status='confirmed'
-            ).exclude(pk=self.pk).count()
-            self.queue_position = same_day_appointments + 1
-        
-        super().save(*args, **kwargs)
-    
+
+        # Новой записи выдаём место из счётчика больницы на этот день.
+        # Счётчик и запись меняются в одной транзакции: параллельные брони
+        # ждут блокировку строки счётчика и не получают одинаковых мест.
+        with transaction.atomic():
+            # Время врача занимаем первым: при конфликте бронь отваливается
+            # до блокировки счётчика очереди всей больницы
+            hold = SlotHold.take(self) if self.doctor_id else None
+            if not self.queue_position or self.queue_position == 1:
+                self.queue_position = QueueCounter.next_position(self.hospital_id, self.queue_day)
+            self._insert_with_unique_code(*args, **kwargs)
+            if hold:
+                SlotHold.objects.filter(pk=hold).update(appointment=self)
+
+    def _insert_with_unique_code(self, *args, **kwargs):
+        """Вставка записи; если код совпал со старым случайным кодом — берём следующий"""
+        while True:
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if not Appointment.objects.filter(code=self.code).exists():
+                    raise
+                self.code = self.generate_unique_code()
+
     @staticmethod
     def generate_unique_code():
-        """Генерирует уникальный 6-значный код"""
-        chars = string.ascii_uppercase + string.digits
-        chars = chars.replace('O', '').replace('0', '').replace('I', '').replace('1', '')
-        
-        while True:
-            code = ''.join(random.choices(chars, k=6))
-            if not Appointment.objects.filter(code=code).exists():
-                return code
+        """Выдаёт уникальный 6-значный код (см. appointments.codes)"""
+        return appointment_codes.next_code()
     
+    WAIT_MINUTES_PER_PLACE = 5
+
     @property
     def estimated_wait_time(self):
         """Примерное время ожидания в минутах"""
-        return self.queue_position * 5
+        return self.queue_position * self.WAIT_MINUTES_PER_PLACE
+
+    @property
+    def queue_day(self):
+        """День очереди — дата приёма по местному времени"""
+        if timezone.is_naive(self.datetime):
+            return self.datetime.date()
+        return timezone.localdate(self.datetime)
+
+    STAT_FIELDS = ('datetime', 'hospital_id', 'specialty', 'status')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем, в какой ячейке AppointmentStat запись лежала при загрузке
+        # (см. signals.py); при отложенных полях её дочитают перед сохранением
+        state = instance.__dict__
+        if all(field in state for field in cls.STAT_FIELDS):
+            instance._stat_loaded = tuple(state[field] for field in cls.STAT_FIELDS)
+        return instance
+
+
+# Отправляется QueueCounter.renumber(): hospital_id, day,
+# changes — список (id, code, doctor_id, новое queue_position)
+queue_renumbered = Signal()
+
+
+class QueueCounter(models.Model):
+    """
+    Последнее выданное место в очереди больницы на конкретный день.
+    Позволяет выдавать queue_position за O(1) без подсчёта записей дня.
+    """
+    hospital      = models.ForeignKey(
+        Hospital, on_delete=models.CASCADE,
+        related_name='queue_counters', verbose_name="Больница"
+    )
+    day           = models.DateField(verbose_name="День")
+    last_position = models.PositiveIntegerField(default=0, verbose_name="Последнее место")
+
+    class Meta:
+        verbose_name = "Счётчик очереди"
+        verbose_name_plural = "Счётчики очереди"
+        constraints = [
+            models.UniqueConstraint(fields=['hospital', 'day'], name='unique_queue_counter_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.hospital_id} / {self.day}: {self.last_position}"
+
+    @classmethod
+    def next_position(cls, hospital_id, day):
+        """
+        Атомарно увеличивает счётчик и возвращает новое место.
+        Вызывать внутри транзакции, в которой создаётся запись.
+        """
+        counter = cls.objects.filter(hospital_id=hospital_id, day=day)
+        # UPDATE первым запросом сразу берёт блокировку на запись
+        if counter.update(last_position=F('last_position') + 1):
+            return counter.values_list('last_position', flat=True).get()
+
+        # Первая запись на этот день: засеиваем счётчик уже существующими записями
+        position = Appointment.objects.filter(
+            hospital_id=hospital_id, status='confirmed'
+        ).on_days(day).count() + 1
+        try:
+            with transaction.atomic():
+                cls.objects.create(hospital_id=hospital_id, day=day, last_position=position)
+            return position
+        except IntegrityError:
+            # Счётчик успела создать параллельная бронь
+            counter.update(last_position=F('last_position') + 1)
+            return counter.values_list('last_position', flat=True).get()
+
+    @classmethod
+    def renumber(cls, hospital_id, day):
+        """
+        Уплотняет очередь дня после отмены: подтверждённые записи получают
+        места 1..N по времени приёма. Изменённые строки обновляются одним
+        UPDATE, счётчик сдвигается на N. Возвращает N.
+
+        Строка счётчика блокируется до чтения записей: бронь, которая уже
+        увеличила счётчик в своей транзакции, успевает закоммититься и
+        попадает в N, а новые брони ждут конца перенумерации.
+        """
+        with transaction.atomic():
+            counter = cls.objects.select_for_update().filter(hospital_id=hospital_id, day=day)
+            list(counter.values_list('id', flat=True))
+            rows = Appointment.objects.filter(
+                hospital_id=hospital_id, status='confirmed'
+            ).on_days(day).order_by('datetime', 'id').values_list(
+                'id', 'code', 'doctor_id', 'queue_position'
+            )
+
+            changes = [
+                (pk, code, doctor_id, i)
+                for i, (pk, code, doctor_id, position) in enumerate(rows, start=1)
+                if position != i
+            ]
+            if changes:
+                Appointment.objects.bulk_update(
+                    [Appointment(id=pk, queue_position=i) for pk, _, _, i in changes],
+                    ['queue_position'],
+                )
+
+            total = len(rows)
+            counter.update(last_position=total)
+
+        if changes:
+            # bulk_update не шлёт post_save — сообщаем о сдвиге отдельным сигналом
+            queue_renumbered.send(sender=cls, hospital_id=hospital_id, day=day, changes=changes)
+        return total
+
+
+class CodeSequence(models.Model):
+    """Последовательность номеров, из которых appointments.codes строит коды"""
+    name       = models.CharField(max_length=30, unique=True, verbose_name="Пространство кодов")
+    last_value = models.BigIntegerField(default=0, verbose_name="Выдано номеров")
+
+    class Meta:
+        verbose_name = "Последовательность кодов"
+        verbose_name_plural = "Последовательности кодов"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+    @classmethod
+    def reserve(cls, name, size):
+        """Резервирует size номеров подряд одним UPDATE, возвращает (start, end)"""
+        with transaction.atomic():
+            seq = cls.objects.filter(name=name)
+            if not seq.update(last_value=F('last_value') + size):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, last_value=size)
+                    return 0, size
+                except IntegrityError:
+                    seq.update(last_value=F('last_value') + size)
+            end = seq.values_list('last_value', flat=True).get()
+        return end - size, end
+
+
+class SlotTaken(Exception):
+    """Время врача уже занято другой записью или бронью"""
+
+
+class SlotHoldQuerySet(models.QuerySet):
+    def expired(self, now=None):
+        """Просроченные временные брони — их удаляет expiry.sweep()"""
+        return self.filter(appointment__isnull=True, expires_at__lte=now or timezone.now())
+
+
+class SlotHold(models.Model):
+    """
+    Занятое время врача: временная бронь (appointment пуст, expires_at в
+    будущем) или подтверждённая запись. Уникальность (doctor, slot)
+    проверяет сама БД, поэтому параллельные брони одного слота не проходят,
+    а брони разных слотов не ждут друг друга.
+
+    Протокол: POST /api/appointments/hold/ выдаёт token на SLOT_HOLD_SECONDS,
+    POST /api/appointments/ с этим token превращает бронь в запись. Запись
+    без брони занимает слот сразу (SlotHold.take в Appointment.save).
+    Отмена записи освобождает слот (signals.py).
+
+    client — кто взял временную бронь (пользователь или IP): у одного
+    клиента не больше SLOT_HOLDS_PER_CLIENT действующих броней, новая
+    вытесняет его же старые. Просроченные брони удаляет expiry.sweep().
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_holds',
+                               verbose_name="Врач")
+    slot = models.DateTimeField(verbose_name="Время приёма")
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    appointment = models.OneToOneField(
+        'Appointment', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='slot_hold', verbose_name="Запись"
+    )
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Бронь до",
+                                      help_text="Пусто — слот занят записью")
+    client = models.CharField(max_length=64, blank=True, default='', verbose_name="Клиент",
+                              help_text="user:<id> или ip:<адрес> — кто взял временную бронь")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SlotHoldQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Занятое время врача"
+        verbose_name_plural = "Занятое время врачей"
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'slot'], name='unique_doctor_slot'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'expires_at'], name='slothold_client_expires'),
+            models.Index(fields=['expires_at'], name='slothold_expires'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id} @ {self.slot:%Y-%m-%d %H:%M}"
+
+    @classmethod
+    def hold(cls, doctor_id, slot, seconds=None, appointment=None, client='', limit=None):
+        """
+        Занимает слот: вставка строки, конфликт решает уникальный индекс.
+        seconds — срок временной брони; None — до привязки записи.
+        Просроченную чужую бронь того же слота вытесняет. С client и limit
+        снимает старые временные брони клиента сверх limit.
+        """
+        now = timezone.now()
+        expires_at = now + dt.timedelta(seconds=seconds) if seconds else None
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    held = cls.objects.create(doctor_id=doctor_id, slot=slot, expires_at=expires_at,
+                                              appointment=appointment, client=client)
+                    if client and limit:
+                        cls._trim(client, limit, now)
+                    return held
+            except IntegrityError:
+                stale = cls.objects.filter(
+                    doctor_id=doctor_id, slot=slot, appointment__isnull=True, expires_at__lte=now,
+                )
+                if not stale.delete()[0]:
+                    break
+        raise SlotTaken('Это время у врача уже занято')
+
+    @classmethod
+    def _trim(cls, client, limit, now):
+        """Оставляет клиенту limit самых новых действующих временных броней"""
+        live = cls.objects.filter(client=client, appointment__isnull=True, expires_at__gt=now)
+        stale = list(live.order_by('-expires_at', '-id').values_list('id', flat=True)[limit:])
+        if stale:
+            cls.objects.filter(id__in=stale, appointment__isnull=True).delete()
+
+    @classmethod
+    def take(cls, appointment):
+        """
+        Слот под новую запись; возвращает pk строки SlotHold.
+        appointment.hold_token — бронь, полученная заранее.
+        """
+        token = getattr(appointment, 'hold_token', None)
+        if not token:
+            return cls.hold(appointment.doctor_id, appointment.datetime).pk
+        held = cls.objects.filter(
+            token=token, doctor_id=appointment.doctor_id, slot=appointment.datetime,
+            appointment__isnull=True, expires_at__gt=timezone.now(),
+        )
+        # Бронь больше не истекает: её не вытеснят, пока идёт вставка записи
+        pk = held.values_list('pk', flat=True).first()
+        if pk is None or not held.update(expires_at=None):
+            raise SlotTaken('Бронь времени истекла или не найдена')
+        return pk
+
+    @classmethod
+    def release(cls, token):
+        """Снимает временную бронь (запись по ней не создавалась)"""
+        return cls.objects.filter(token=token, appointment__isnull=True).delete()[0]
+
+    @classmethod
+    def occupied(cls, doctor_ids, start, end):
+        """(doctor_id, slot) занятого времени: записи и действующие брони"""
+        return cls.objects.filter(
+            Q(appointment__isnull=False) | Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+            doctor_id__in=doctor_ids, slot__gte=start, slot__lt=end,
+        ).values_list('doctor_id', 'slot')
+
+
+class AppointmentStat(models.Model):
+    """
+    Число записей по дню приёма, больнице, специальности и статусу.
+    Поддерживается сигналами Appointment (signals.py), поэтому статистика
+    админ-панели и графики по дням не сканируют таблицу записей.
+    Пересчитать с нуля: python manage.py rebuild_stats
+    """
+    day       = models.DateField(verbose_name="День приёма")
+    hospital  = models.ForeignKey(
+        Hospital, on_delete=models.CASCADE,
+        related_name='appointment_stats', verbose_name="Больница"
+    )
+    specialty = models.CharField(max_length=50, verbose_name="Специальность")
+    status    = models.CharField(max_length=20, verbose_name="Статус")
+    count     = models.IntegerField(default=0, verbose_name="Записей")
+
+    class Meta:
+        verbose_name = "Статистика записей"
+        verbose_name_plural = "Статистика записей"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'hospital', 'specialty', 'status'], name='unique_appointment_stat_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} / {self.hospital_id} / {self.specialty} / {self.status}: {self.count}"
+
+    @staticmethod
+    def bucket(datetime, hospital_id, specialty, status):
+        """Ячейка статистики для значений полей Appointment.STAT_FIELDS"""
+        day = datetime.date() if timezone.is_naive(datetime) else timezone.localdate(datetime)
+        return day, hospital_id, specialty, status
+
+    @classmethod
+    def add(cls, bucket, delta):
+        """Атомарно прибавляет delta к ячейке, создавая её при первой записи"""
+        day, hospital_id, specialty, status = bucket
+        cell = cls.objects.filter(day=day, hospital_id=hospital_id, specialty=specialty, status=status)
+        if cell.update(count=F('count') + delta) or delta < 0:
+            # уменьшать несуществующую ячейку нечего (её уже удалил каскад)
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(day=day, hospital_id=hospital_id, specialty=specialty,
+                                   status=status, count=delta)
+        except IntegrityError:
+            # Ячейку успел создать параллельный запрос
+            cell.update(count=F('count') + delta)
+
+    @classmethod
+    def move(cls, old, new):
+        """Запись перешла из ячейки old в new (None — создана или удалена)"""
+        if old == new:
+            return
+        with transaction.atomic(savepoint=False):
+            if old is not None:
+                cls.add(old, -1)
+            if new is not None:
+                cls.add(new, 1)
+
+    @classmethod
+    def rebuild(cls):
+        """Пересчитывает всю таблицу по записям. Возвращает число ячеек"""
+        # TruncDate режет по текущему часовому поясу — как queue_day
+        counts = (
+            Appointment.objects.order_by()
+            .annotate(day=TruncDate('datetime'))
+            .values('day', 'hospital_id', 'specialty', 'status')
+            .annotate(count=Count('id'))
+        )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cells = cls.objects.bulk_create([cls(**row) for row in counts], batch_size=1000)
+        return len(cells)
 
 
 class DoctorInviteCode(models.Model):
@@ -208,6 +748,10 @@ class DoctorInviteCode(models.Model):
         verbose_name = "Код приглашения врача"
         verbose_name_plural = "Коды приглашений врачей"
         ordering = ['-created_at']
+        indexes = [
+            # Постраничный список в админ-панели (keyset по created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='invite_created_id'),
+        ]
 
     def __str__(self):
         if self.is_used and self.used_by:
@@ -220,10 +764,13 @@ class DoctorInviteCode(models.Model):
 
     @classmethod
     def generate_code(cls):
-        """Генерирует уникальный код формата MEDQ-XXXXXX"""
-        chars = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # без I, O, 0, 1
+        """
+        Выдаёт уникальный код формата MEDQ-XXXXXX (см. appointments.codes).
+        Номер последовательности может совпасть со старым случайным кодом —
+        такие пропускаем: коды выдаёт админ, лишний запрос не важен.
+        """
         while True:
-            code = 'MEDQ-' + ''.join(random.choices(chars, k=6))
+            code = invite_codes.next_code()
             if not cls.objects.filter(code=code).exists():
                 return code
 
@@ -251,8 +798,44 @@ class UserProfile(models.Model):
         return self.role == 'doctor'
 
 
+class ExpiringCodeQuerySet(models.QuerySet):
+    """
+    Коды со сроком действия: expires_at проставляется при вставке.
+    Строка хранится ещё RETAIN_EXPIRED после истечения кода (у заявки на
+    регистрацию — чтобы «Отправить код снова» работал и после срока кода).
+    """
+
+    def alive(self, now=None):
+        """Действующие коды"""
+        return self.filter(expires_at__gt=now or timezone.now())
+
+    def retained(self, now=None):
+        """Строки, которые ещё хранятся: действующие и недавно истёкшие"""
+        return self.filter(expires_at__gt=(now or timezone.now()) - self.model.RETAIN_EXPIRED)
+
+    def expired(self, now=None):
+        """Строки, срок хранения которых вышел, — их удаляет expiry.sweep()"""
+        return self.filter(expires_at__lte=(now or timezone.now()) - self.model.RETAIN_EXPIRED)
+
+
+def verification_code_expiry():
+    return timezone.now() + VerificationCode.TTL
+
+
+def password_reset_code_expiry():
+    return timezone.now() + PasswordResetCode.TTL
+
+
 class VerificationCode(models.Model):
-    """Коды подтверждения email при регистрации"""
+    """
+    Коды подтверждения email при регистрации. Истёкший код не виден через
+    alive(), но заявка (имя, логин, пароль) хранится ещё RETAIN_EXPIRED —
+    по ней повторно отправляют код. Потом строку удаляет фоновая очистка
+    (expiry.py, manage.py sweep_codes).
+    """
+    TTL = dt.timedelta(minutes=10)
+    RETAIN_EXPIRED = dt.timedelta(days=1)
+
     email       = models.EmailField(verbose_name="Email")
     code        = models.CharField(max_length=6, verbose_name="Код")
     name        = models.CharField(max_length=200, verbose_name="Имя")
@@ -261,14 +844,21 @@ class VerificationCode(models.Model):
     role        = models.CharField(max_length=20, default='patient', verbose_name="Роль")
     doctor_code = models.CharField(max_length=12, blank=True, default='', verbose_name="Код врача")
     created_at  = models.DateTimeField(auto_now_add=True)
+    expires_at  = models.DateTimeField(default=verification_code_expiry, verbose_name="Действует до")
+
+    objects = ExpiringCodeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Код верификации"
         verbose_name_plural = "Коды верификации"
+        indexes = [
+            models.Index(fields=['email', '-created_at'], name='verif_email_created'),
+            models.Index(fields=['expires_at'], name='verif_expires'),
+        ]
 
     def is_expired(self):
         """Истёк ли код (10 минут)"""
-        return (timezone.now() - self.created_at).total_seconds() > 600
+        return self.expires_at <= timezone.now()
 
     def __str__(self):
         return f"{self.email} — {self.code}"
@@ -276,16 +866,79 @@ class VerificationCode(models.Model):
 
 class PasswordResetCode(models.Model):
     """Код сброса пароля (отправляется на email, действует 15 минут)"""
+    TTL = dt.timedelta(minutes=15)
+    RETAIN_EXPIRED = dt.timedelta(0)
+
     email      = models.EmailField(verbose_name="Email")
     code       = models.CharField(max_length=6, verbose_name="Код")
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=password_reset_code_expiry, verbose_name="Действует до")
+
+    objects = ExpiringCodeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Код сброса пароля"
         verbose_name_plural = "Коды сброса пароля"
+        indexes = [
+            models.Index(fields=['email', '-created_at'], name='reset_email_created'),
+            models.Index(fields=['expires_at'], name='reset_expires'),
+        ]
 
     def is_expired(self):
-        return (timezone.now() - self.created_at).total_seconds() > 900  # 15 минут
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return f"{self.email} — {self.code}"
+
+
+class OutboundEmailQuerySet(models.QuerySet):
+    def expired(self, now=None):
+        """
+        Отправленные и брошенные письма старше RETAIN_DONE — их удаляет
+        expiry.sweep(). next_attempt_at у них — время последней попытки.
+        """
+        return self.filter(status__in=('sent', 'failed'),
+                           next_attempt_at__lte=(now or timezone.now()) - self.model.RETAIN_DONE)
+
+
+class OutboundEmail(models.Model):
+    """
+    Очередь исходящих писем (коды подтверждения, сброс пароля).
+    View только пишет строку, отправляет фоновый диспетчер — см. mailer.py.
+    После отправки текст письма стирается; отправленные и брошенные строки
+    хранятся RETAIN_DONE для разбора доставки.
+    """
+    RETAIN_DONE = dt.timedelta(days=7)
+    EXPIRY_FIELD = 'next_attempt_at'  # по нему expiry.sweep() идёт от старых к новым
+
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('sent',    'Отправлено'),
+        ('failed',  'Не отправлено'),
+    ]
+
+    to_email        = models.EmailField(verbose_name="Кому")
+    from_email      = models.CharField(max_length=254, verbose_name="От кого")
+    subject         = models.CharField(max_length=200, verbose_name="Тема")
+    body            = models.TextField(verbose_name="Текст")
+    status          = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts        = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    last_error      = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    claim           = models.CharField(max_length=32, blank=True, default='', editable=False)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    sent_at         = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    objects = OutboundEmailQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next'),
+        ]
 
     def __str__(self):
-        return f"{self.email} — {self.code}"
\ No newline at end of file
+        return f"{self.to_email} — {self.subject} [{self.status}]"
@@ -0,0 +1,108 @@
+"""
+Keyset-пагинация для админских списков.
+
+Вместо OFFSET страница продолжается «после последней строки»: курсор хранит
+значения полей сортировки последней строки, и следующий запрос фильтрует
+WHERE (date_joined, id) < (...) по индексу. Время ответа зависит от размера
+страницы, а не от размера таблицы и номера страницы.
+
+Параметры запроса:
+  limit  — размер страницы (по умолчанию 50, максимум 200)
+  cursor — значение next из предыдущего ответа
+  fields — через запятую, какие поля вернуть (по умолчанию все)
+
+Ответ: {"results": [...], "next": "<курсор>" | null}
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.response import Response
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT     = 200
+
+
+def _cursor_value(value):
+    # Полный isoformat: DjangoJSONEncoder обрезал бы микросекунды, и строки
+    # с одинаковыми миллисекундами терялись бы на границе страниц
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не подходит для курсора')
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=_cursor_value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Некорректный cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Некорректный cursor')
+    return values
+
+
+def after(ordering, values):
+    """Условие «строго после values» для сортировки ordering, например ('-date_joined', '-id')"""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def paginate(request, queryset, ordering, serialize, fields):
+    """
+    Отдаёт страницу queryset. ordering должен однозначно упорядочивать строки
+    (последним полем — id), serialize превращает объект в dict с ключами fields.
+    """
+    params = request.query_params
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit должен быть числом'}, status=400)
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    selected = fields
+    if params.get('fields'):
+        selected = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        unknown = set(selected) - set(fields)
+        if unknown:
+            return Response({'error': f'Неизвестные поля: {", ".join(sorted(unknown))}. '
+                                      f'Доступны: {", ".join(fields)}'}, status=400)
+
+    queryset = queryset.order_by(*ordering)
+    if params.get('cursor'):
+        try:
+            values = decode_cursor(params['cursor'], len(ordering))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        queryset = queryset.filter(after(ordering, values))
+
+    try:
+        rows = list(queryset[:limit + 1])
+    except (ValidationError, ValueError):
+        # значения в курсоре не того типа (подделанный или от другого списка)
+        return Response({'error': 'Некорректный cursor'}, status=400)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+    results = []
+    for row in rows:
+        item = serialize(row)
+        results.append({name: item[name] for name in selected})
+    return Response({'results': results, 'next': next_cursor})
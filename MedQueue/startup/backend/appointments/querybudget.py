@@ -0,0 +1,255 @@
+"""
+Бюджет SQL-запросов на запрос к API: QueryBudgetMiddleware.
+
+На каждый ответ middleware считает запросы к БД, их суммарное время и
+самые медленные из них, пишет строку в лог appointments.querybudget и
+добавляет заголовки X-DB-Queries и Server-Timing (видно во вкладке
+Network браузера). N+1 в сериализаторе или цикле сразу заметен по числу.
+Стриминговые ответы читают БД после middleware: их запросы досчитываются
+до конца потока и попадают только в лог, без заголовков.
+
+Бюджет view — @query_budget(n) (над @api_view или на методе ViewSet) или
+QUERY_BUDGETS = {'doctor_me': n, 'AppointmentViewSet.create': n} в
+настройках, иначе QUERY_BUDGET_DEFAULT. Превышение — WARNING с медленными
+запросами, а при QUERY_BUDGET_ACTION = 'raise' — исключение
+QueryBudgetExceeded (для тестов). В тестах того же добивается
+max_queries(n) вокруг любого блока кода.
+
+Счётчик — execute_wrapper на соединениях, активный запрос берётся из
+ContextVar, поэтому работает и под ASGI, где sync-view выполняются в
+другом потоке. Без QUERY_BUDGET_ENABLED middleware убирает себя из цепочки
+(MiddlewareNotUsed), обёртка на соединения не ставится.
+"""
+
+import heapq
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('query_budget_recorder', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """Число, время и slowest самых медленных запросов"""
+
+    def __init__(self, slowest=3):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []  # min-куча (секунды, номер, sql)
+        self.keep = slowest
+        self.closed = False
+
+    def record(self, sql, seconds):
+        if self.closed:
+            return
+        self.count += 1
+        self.seconds += seconds
+        item = (seconds, self.count, sql)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, item)
+        elif self.slowest and seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    @property
+    def milliseconds(self):
+        return self.seconds * 1000
+
+    def top(self):
+        """[(мс, sql)] по убыванию времени"""
+        return [(seconds * 1000, sql) for seconds, _, sql in sorted(self.slowest, reverse=True)]
+
+    def describe(self, budget, label):
+        lines = [f'{label}: {self.count} SQL-запросов при бюджете {budget} ({self.milliseconds:.1f} мс в БД)']
+        lines += [f'  {ms:7.2f} мс  {sql[:500]}' for ms, sql in self.top()]
+        return '\n'.join(lines)
+
+
+def _execute(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record(sql, time.perf_counter() - started)
+
+
+def _install(connection, **kwargs):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)  # снаружи: чужой execute_wrapper() снимает последний
+
+
+def _install_all(**kwargs):
+    for connection in connections.all():
+        _install(connection)
+
+
+def install():
+    """
+    Ставит счётчик на соединения этого потока и на все новые. request_started
+    под ASGI приходит в том же потоке, где выполняются sync-view, — так
+    счётчик получают и соединения, открытые там до первого запроса.
+    """
+    connection_created.connect(_install, dispatch_uid='appointments.querybudget')
+    request_started.connect(_install_all, dispatch_uid='appointments.querybudget')
+    _install_all()
+
+
+@contextmanager
+def recording(slowest=None):
+    """Считает запросы блока в QueryRecorder (вложенный блок считает только своё)"""
+    install()
+    recorder = QueryRecorder(_slowest() if slowest is None else slowest)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+        recorder.closed = True
+
+
+@contextmanager
+def max_queries(budget, label='Блок'):
+    """
+    Для тестов: QueryBudgetExceeded, если в блоке больше budget запросов.
+    В отличие от assertNumQueries не ломается от уменьшения числа запросов
+    и показывает самые медленные.
+    """
+    with recording() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise QueryBudgetExceeded(recorder.describe(budget, label))
+
+
+def query_budget(budget):
+    """Бюджет запросов view: над @api_view или на методе/action ViewSet"""
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def _slowest():
+    return getattr(settings, 'QUERY_BUDGET_SLOWEST', 3)
+
+
+def view_label(request):
+    """'doctor_me', 'AppointmentViewSet.create' — имя view для логов и QUERY_BUDGETS"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    func = match.func
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if cls is None:
+        return getattr(func, '__name__', request.path)
+    action = (getattr(func, 'actions', None) or {}).get(request.method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+def view_budget(request, label):
+    configured = getattr(settings, 'QUERY_BUDGETS', {})
+    if label in configured:
+        return configured[label]
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        func = match.func
+        if hasattr(func, 'query_budget'):
+            return func.query_budget
+        action = (getattr(func, 'actions', None) or {}).get(request.method.lower())
+        handler = getattr(getattr(func, 'cls', None), action or '', None)
+        if hasattr(handler, 'query_budget'):
+            return handler.query_budget
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        recorder = QueryRecorder(_slowest())
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, recorder)
+
+    async def _acall(self, request):
+        recorder = QueryRecorder(_slowest())
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, recorder)
+
+    def _finish(self, request, response, recorder):
+        label = view_label(request)
+        if not response.streaming or response.is_async:
+            # SSE и прочие async-потоки в БД не ходят — отчитываемся сразу
+            self._report(request, response, recorder, label)
+            response['X-DB-Queries'] = str(recorder.count)
+            response['Server-Timing'] = f'db;dur={recorder.milliseconds:.1f};desc="{recorder.count} queries"'
+            return response
+        # Стриминговый ответ читает БД уже после middleware: считаем до конца
+        # потока и отчитываемся, когда он дочитан
+        response.streaming_content = self._stream(request, response, recorder, label,
+                                                  response.streaming_content)
+        return response
+
+    def _stream(self, request, response, recorder, label, content):
+        token = _current.set(recorder)
+        try:
+            yield from content
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(None)  # генератор дочитали в другом контексте
+            self._report(request, response, recorder, label)
+
+    def _report(self, request, response, recorder, label):
+        recorder.closed = True
+        budget = view_budget(request, label)
+        details = {
+            'view': label, 'method': request.method, 'path': request.path,
+            'status': response.status_code, 'queries': recorder.count,
+            'db_ms': round(recorder.milliseconds, 2), 'budget': budget,
+            'slowest': [{'ms': round(ms, 2), 'sql': sql} for ms, sql in recorder.top()],
+        }
+        if budget is None or recorder.count <= budget:
+            logger.info('%s %s %s: %d запросов, %.1f мс в БД', request.method, label,
+                        response.status_code, recorder.count, recorder.milliseconds,
+                        extra={'query_budget': details})
+            return
+        message = recorder.describe(budget, f'{request.method} {label}')
+        if getattr(settings, 'QUERY_BUDGET_ACTION', 'warn') == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={'query_budget': details})
@@ -0,0 +1,162 @@
+"""
+Проверка Google reCAPTCHA на сервере.
+
+Раньше каждый вход и регистрация открывали новое HTTPS-соединение к Google
+с таймаутом 10 с. RecaptchaVerifier держит пул keep-alive соединений,
+укладывается в бюджет RECAPTCHA_TIMEOUT и при недоступности Google
+решает по политике RECAPTCHA_FAIL_OPEN: пропустить (True) или отказать
+(False, по умолчанию). Токен reCAPTCHA одноразовый, поэтому повторно
+присланный токен отклоняется сразу из кэша, без запроса к Google.
+
+Адрес проверки меняется настройкой RECAPTCHA_VERIFY_URL (например, на
+локальный фейковый сервер в тестах).
+"""
+
+import hashlib
+import http.client
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.parse
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+VERIFY_URL   = 'https://www.google.com/recaptcha/api/siteverify'
+TEST_SECRET  = '6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe'  # тестовый ключ Google: всегда success
+REPLAY_KEY   = 'medqueue:recaptcha:seen'
+
+
+class ConnectionPool:
+    """Пул HTTP(S)-соединений к одному хосту, переиспользуемых между запросами"""
+
+    def __init__(self, url, size=4):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host   = parts.hostname
+        self.port   = parts.port
+        self.path   = parts.path or '/'
+        self._idle  = queue.LifoQueue(maxsize=size)
+
+    def _connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def acquire(self, timeout):
+        """Возвращает (соединение, взято_из_пула)"""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect(timeout), False
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def post_form(self, payload, timeout):
+        """POST x-www-form-urlencoded, возвращает разобранный JSON-ответ"""
+        body = urllib.parse.urlencode(payload)
+        headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Connection': 'keep-alive'}
+        deadline = time.monotonic() + timeout
+
+        connection, reused = self.acquire(timeout)
+        while True:
+            try:
+                connection.request('POST', self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                remaining = deadline - time.monotonic()
+                # Сервер закрыл простаивавшее keep-alive соединение — один повтор на новом
+                if not reused or remaining <= 0:
+                    raise
+                connection, reused = self._connect(remaining), False
+                continue
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+            if response.status != 200:
+                raise http.client.HTTPException(f'HTTP {response.status}')
+            return json.loads(data.decode('utf-8'))
+
+
+class RecaptchaVerifier:
+    def __init__(self, secret=TEST_SECRET, url=VERIFY_URL, timeout=2.0,
+                 fail_open=False, replay_ttl=300, pool_size=4, cache_alias='default'):
+        self.secret      = secret
+        self.timeout     = timeout
+        self.fail_open   = fail_open
+        self.replay_ttl  = replay_ttl
+        self.cache_alias = cache_alias
+        self.pool = ConnectionPool(url, pool_size)
+
+    def _first_use(self, token):
+        """Запоминает токен; False, если он уже приходил"""
+        if not self.replay_ttl:
+            return True
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return caches[self.cache_alias].add(f'{REPLAY_KEY}:{digest}', 1, self.replay_ttl)
+
+    def verify(self, token, remote_ip=None):
+        if not token:
+            metrics.recaptcha_checks.inc(outcome='missing')
+            return False
+        if not self._first_use(token):
+            metrics.recaptcha_checks.inc(outcome='replay')
+            return False
+
+        payload = {'secret': self.secret, 'response': token}
+        if remote_ip:
+            payload['remoteip'] = remote_ip
+
+        started = time.monotonic()
+        try:
+            result = self.pool.post_form(payload, self.timeout)
+        except Exception as e:
+            seconds = time.monotonic() - started
+            metrics.recaptcha_seconds.observe(seconds, outcome='error')
+            metrics.recaptcha_checks.inc(outcome='unavailable')
+            logger.warning('reCAPTCHA недоступна за %.0f мс (%s), политика: %s',
+                           seconds * 1000, e, 'пропустить' if self.fail_open else 'отказать')
+            return self.fail_open
+        metrics.recaptcha_seconds.observe(time.monotonic() - started, outcome='ok')
+        success = bool(result.get('success'))
+        metrics.recaptcha_checks.inc(outcome='success' if success else 'rejected')
+        return success
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = RecaptchaVerifier(
+                    secret=getattr(settings, 'RECAPTCHA_SECRET_KEY', TEST_SECRET),
+                    url=getattr(settings, 'RECAPTCHA_VERIFY_URL', VERIFY_URL),
+                    timeout=getattr(settings, 'RECAPTCHA_TIMEOUT', 2.0),
+                    fail_open=getattr(settings, 'RECAPTCHA_FAIL_OPEN', False),
+                    replay_ttl=getattr(settings, 'RECAPTCHA_REPLAY_TTL', 300),
+                )
+    return _verifier
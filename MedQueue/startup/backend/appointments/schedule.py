@@ -0,0 +1,261 @@
+"""
+Расписание врачей и свободные слоты приёма.
+
+Текстовые Doctor.work_days / work_hours («Пн–Пт», «Пн-Ср-Пт», «08:00–16:00»,
+с разными тире) разбираются в интервалы DoctorSchedule. По ним generate()
+предрасчитывает сетку на каждый день — DoctorSlotDay с битовой маской
+рабочих слотов (12 байт на день при слотах по 30 минут).
+
+availability() отвечает на «какие слоты свободны у врачей с first по last»
+двумя запросами: маски дней и занятое записями и бронями время (SlotHold,
+по уникальному индексу doctor+slot). Недостающие дни досчитываются на лету.
+"""
+
+import datetime as dt
+import re
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Doctor, DoctorSchedule, DoctorSlotDay, SlotHold, day_bounds
+
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+DAY_MINUTES = 24 * 60
+
+_DASHES = re.compile(r'\s*[-‐‑‒–—―]\s*')
+_HOURS = re.compile(r'^(\d{1,2})[:.](\d{2})-(\d{1,2})[:.](\d{2})$')
+
+# Свободные слоты врача на день; slots = None — расписание неизвестно
+FreeDay = namedtuple('FreeDay', 'slot_minutes slots')
+
+
+def default_slot_minutes():
+    return getattr(settings, 'SCHEDULE_SLOT_MINUTES', 30)
+
+
+def horizon(today=None):
+    """
+    (первый, последний) день, на которые можно записаться: сегодня и ещё
+    SCHEDULE_HORIZON_DAYS. Сетка DoctorSlotDay досчитывается и сохраняется
+    только внутри этого окна.
+    """
+    today = today or timezone.localdate()
+    return today, today + dt.timedelta(days=getattr(settings, 'SCHEDULE_HORIZON_DAYS', 28))
+
+
+def parse_work_days(text):
+    """
+    «Пн–Пт» → [0..4], «Пн-Ср-Пт» → [0, 2, 4], «Пн–Пт, Сб» → [0..5].
+    Два дня через тире — диапазон, три и больше — перечисление.
+    """
+    text = _DASHES.sub('-', (text or '').strip().lower())
+    if text.startswith('ежедневно') or 'без выходных' in text:
+        return list(range(7))
+    days = set()
+    for part in re.split(r'[,;/\s]+', text):
+        if not part:
+            continue
+        names = part.split('-')
+        try:
+            numbers = [WEEKDAYS.index(name[:2]) for name in names]
+        except ValueError:
+            raise ValueError(f'Не удалось разобрать рабочие дни: {text!r}')
+        if len(numbers) == 2:
+            first, last = numbers
+            days.update((first + i) % 7 for i in range((last - first) % 7 + 1))
+        else:
+            days.update(numbers)
+    if not days:
+        raise ValueError(f'Не удалось разобрать рабочие дни: {text!r}')
+    return sorted(days)
+
+
+def parse_work_hours(text):
+    """«08:00–16:00» → (time(8, 0), time(16, 0)); конец 24:00 — полночь"""
+    text = _DASHES.sub('-', (text or '').strip().lower())
+    if text.startswith('круглосуточно'):
+        return dt.time(0), dt.time(0)
+    match = _HOURS.match(text)
+    if not match:
+        raise ValueError(f'Не удалось разобрать рабочие часы: {text!r}')
+    h1, m1, h2, m2 = map(int, match.groups())
+    if h1 > 23 or h2 > 24 or m1 > 59 or m2 > 59 or (h2 == 24 and m2):
+        raise ValueError(f'Не удалось разобрать рабочие часы: {text!r}')
+    return dt.time(h1, m1), dt.time(h2 % 24, m2)
+
+
+def intervals_from_text(work_days, work_hours):
+    """[(weekday, start, end)] по тексту; пустой список, если текст не разобран"""
+    try:
+        days = parse_work_days(work_days)
+        start, end = parse_work_hours(work_hours)
+    except ValueError:
+        return []
+    return [(day, start, end) for day in days]
+
+
+def sync_from_text(doctor):
+    """Пересобирает DoctorSchedule врача из work_days/work_hours и сбрасывает сетку"""
+    slot_minutes = default_slot_minutes()
+    with transaction.atomic():
+        DoctorSchedule.objects.filter(doctor=doctor).delete()
+        DoctorSchedule.objects.bulk_create([
+            DoctorSchedule(doctor=doctor, weekday=day, start=start, end=end, slot_minutes=slot_minutes)
+            for day, start, end in intervals_from_text(doctor.work_days, doctor.work_hours)
+        ])
+        reset(doctor.pk)
+
+
+def reset(doctor_id):
+    """Удаляет предрасчитанную сетку врача — её пересчитают при следующем запросе"""
+    DoctorSlotDay.objects.filter(doctor_id=doctor_id).delete()
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def day_mask(intervals, slot_minutes):
+    """Битовая маска слотов, целиком попадающих в интервалы [(start, end)]"""
+    mask = 0
+    for start, end in intervals:
+        first = -(-_minutes(start) // slot_minutes)  # округление вверх
+        last = (_minutes(end) or DAY_MINUTES) // slot_minutes
+        for i in range(first, last):
+            mask |= 1 << i
+    return mask
+
+
+def _pack(mask, slot_minutes):
+    return mask.to_bytes(-(-(DAY_MINUTES // slot_minutes) // 8), 'little')
+
+
+def _unpack(data):
+    return int.from_bytes(data, 'little')
+
+
+def _days(first, last):
+    return [first + dt.timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def generate(doctor_ids, first, last):
+    """Предрасчитывает DoctorSlotDay врачей doctor_ids на дни с first по last"""
+    doctor_ids = list(doctor_ids)
+    # weekday → [(start, end, slot_minutes)] по каждому врачу
+    weekly = defaultdict(lambda: defaultdict(list))
+    for row in DoctorSchedule.objects.filter(doctor_id__in=doctor_ids).order_by():
+        weekly[row.doctor_id][row.weekday].append((row.start, row.end, row.slot_minutes))
+
+    # Врачи без строк расписания (например, созданные bulk_create) — по тексту
+    unknown = set()
+    missing = [pk for pk in doctor_ids if pk not in weekly]
+    slot_minutes = default_slot_minutes()
+    for pk, work_days, work_hours in Doctor.objects.filter(id__in=missing).values_list(
+            'id', 'work_days', 'work_hours'):
+        intervals = intervals_from_text(work_days, work_hours)
+        if not intervals:
+            unknown.add(pk)
+        for day, start, end in intervals:
+            weekly[pk][day].append((start, end, slot_minutes))
+
+    rows = []
+    for pk in doctor_ids:
+        for day in _days(first, last):
+            intervals = weekly[pk][day.weekday()]
+            minutes = intervals[0][2] if intervals else slot_minutes
+            mask = None
+            if pk not in unknown:
+                mask = _pack(day_mask([(s, e) for s, e, _ in intervals], minutes), minutes)
+            rows.append(DoctorSlotDay(doctor_id=pk, day=day, slot_minutes=minutes, mask=mask))
+    DoctorSlotDay.objects.bulk_create(
+        rows, batch_size=500, update_conflicts=True,
+        unique_fields=['doctor', 'day'], update_fields=['slot_minutes', 'mask'],
+    )
+    return len(rows)
+
+
+def _slot_days(doctor_ids, first, last):
+    """{(doctor_id, day): DoctorSlotDay}, недостающие дни досчитываются"""
+    def load():
+        return {
+            (row.doctor_id, row.day): row
+            for row in DoctorSlotDay.objects.filter(doctor_id__in=doctor_ids, day__gte=first, day__lte=last)
+        }
+
+    rows = load()
+    if len(rows) < len(doctor_ids) * len(_days(first, last)):
+        stale = {pk for pk in doctor_ids for day in _days(first, last) if (pk, day) not in rows}
+        generate(stale, first, last)
+        rows = load()
+    return rows
+
+
+def _slot_start(day, index, slot_minutes):
+    start = dt.datetime.combine(day, dt.time.min) + dt.timedelta(minutes=index * slot_minutes)
+    return timezone.make_aware(start)
+
+
+def availability(doctor_ids, first, last=None, now=None):
+    """
+    Свободные слоты: {doctor_id: {day: FreeDay}} с first по last,
+    FreeDay.slots — список datetime начала слотов.
+    """
+    last = last or first
+    now = now or timezone.now()
+    doctor_ids = list(doctor_ids)
+    rows = _slot_days(doctor_ids, first, last)
+
+    # Занятые записями и бронями минуты дня; время не по сетке (старые
+    # записи) занимает свой слот
+    booked = defaultdict(set)
+    start, end = day_bounds(first, last)
+    for doctor_id, when in SlotHold.occupied(doctor_ids, start, end):
+        local = timezone.localtime(when)
+        booked[(doctor_id, local.date())].add(_minutes(local))
+
+    result = {}
+    for pk in doctor_ids:
+        days = result[pk] = {}
+        for day in _days(first, last):
+            row = rows[(pk, day)]
+            if row.mask is None:
+                days[day] = FreeDay(row.slot_minutes, None)
+                continue
+            taken = {minute // row.slot_minutes for minute in booked[(pk, day)]}
+            mask, slots = _unpack(row.mask), []
+            index = 0
+            while mask:
+                if mask & 1 and index not in taken:
+                    when = _slot_start(day, index, row.slot_minutes)
+                    if when > now:
+                        slots.append(when)
+                mask >>= 1
+                index += 1
+            days[day] = FreeDay(row.slot_minutes, slots)
+    return result
+
+
+def slot_error(doctor_id, when):
+    """
+    Текст ошибки, если врач не принимает в это время, иначе None.
+    Врачей с неизвестным расписанием не проверяем. Дни вне horizon()
+    отклоняются до расчёта сетки, чтобы запросы на любые даты не
+    создавали строки DoctorSlotDay.
+    """
+    local = timezone.localtime(when) if timezone.is_aware(when) else when
+    first, last = horizon()
+    if local.date() < first:
+        return 'Нельзя записаться на прошедшее время'
+    if local.date() > last:
+        return f'Запись открыта не дальше {last:%d.%m.%Y}'
+    row = _slot_days([doctor_id], local.date(), local.date())[(doctor_id, local.date())]
+    if row.mask is None:
+        return None
+    minutes = _minutes(local)
+    if local.second or local.microsecond or minutes % row.slot_minutes:
+        return f'Время приёма должно совпадать с началом слота ({row.slot_minutes} мин)'
+    if not _unpack(row.mask) >> (minutes // row.slot_minutes) & 1:
+        return 'Врач не принимает в это время'
+    return None
@@ -0,0 +1,494 @@
+"""
+Массовая загрузка больниц, врачей и записей: python manage.py bulk_load.
+
+Фикстуры — JSON или CSV. Что в файле, видно по имени (hospitals*.csv,
+doctors*.json, appointments*.csv) или по ключам JSON-объекта
+{"hospitals": [...], "doctors": [...], "appointments": [...]}. Больница
+в строках врачей и записей — hospital (название) или hospital_id, врач в
+записи — doctor (ФИО, ищется в той же больнице по специальности записи),
+пациент — user (username, необязательно).
+
+Больницы и врачи сверяются с таблицей в памяти по естественному ключу
+(больница — name, врач — больница + ФИО + специальность): новые строки
+вставляются bulk_create, изменившиеся — bulk_update, совпадающие не
+трогаются, так что повторная загрузка того же файла ничего не пишет.
+Поля, которых в строке нет, у существующих строк не меняются.
+
+Записи только добавляются и читаются потоком — миллионы строк не лежат
+в памяти. Строка с уже существующим code пропускается; строки без code
+всегда новые, поэтому для повторяемой загрузки коды стоит указывать.
+
+Пишется всё пачками по batch_size строк, каждая в своей транзакции,
+через bulk_create/bulk_update — в обход save() и сигналов. То, что они
+поддерживают, делается здесь же оптом и в той же транзакции: коды записей
+резервируются блоком, места в очереди выдаются по QueueCounter (счётчики
+пачки читаются с блокировкой и только растут, так что параллельные живые
+записи мест не теряют), время врачей занимает SlotHold (если слот уже
+занят — как в миграции 0017, запись остаётся без брони). AppointmentStat
+прибавляется UPSERT'ом по ячейкам — единственный SQL мимо ORM
+(_add_stats). В конце сдвигаются поколения кэшей. SSE-события о
+загруженных записях не публикуются.
+"""
+
+import csv
+import datetime as dt
+import functools
+import json
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import caching, doctor_context, geo
+from .codes import appointment_codes
+from .models import (
+    Appointment, AppointmentStat, Doctor, DoctorSchedule, DoctorSlotDay, Hospital, QueueCounter,
+    SlotHold,
+)
+
+KINDS = ('hospitals', 'doctors', 'appointments')  # в этом порядке и загружаются
+BATCH_SIZE = 2000
+
+HOSPITAL_FIELDS    = ('type', 'address', 'phone', 'description', 'latitude', 'longitude',
+                      'waiting_time', 'is_active')
+DOCTOR_FIELDS      = ('cabinet', 'work_days', 'work_hours', 'is_active')
+APPOINTMENT_FIELDS = ('patient_name', 'specialty', 'datetime', 'status', 'comment')
+
+_TRUE = {'1', 'true', 't', 'yes', 'y', 'да'}
+
+
+class LoadError(ValueError):
+    """Фикстура или её строка не разобрана"""
+
+
+class Report:
+    """Итог загрузки одного файла"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.created = self.updated = self.unchanged = 0
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.unchanged
+
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f'{self.kind}: новых {self.created}, изменено {self.updated}, '
+                f'без изменений {self.unchanged} — {self.rows} строк за {self.seconds:.2f} с '
+                f'({self.rate:,.0f} строк/с)')
+
+
+# ── Чтение фикстур ────────────────────────────────────────────────────────────
+
+def read_fixture(path):
+    """[(kind, rows)] файла; строки CSV читаются лениво"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            unknown = set(data) - set(KINDS)
+            if unknown:
+                raise LoadError(f'{path.name}: неизвестные разделы {", ".join(sorted(unknown))}')
+            return [(kind, data[kind]) for kind in KINDS if kind in data]
+        return [(_kind(path), data)]
+    if suffix == '.csv':
+        return [(_kind(path), _read_csv(path))]
+    raise LoadError(f'{path.name}: поддерживаются только .json и .csv')
+
+
+def _kind(path):
+    for kind in KINDS:
+        if path.stem.lower().startswith(kind):
+            return kind
+    raise LoadError(f'{path.name}: имя файла должно начинаться с {", ".join(KINDS)}')
+
+
+def _read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+@functools.cache
+def _field(model, name):
+    field = model._meta.get_field(name)
+    choices = {value for value, _ in field.flatchoices} if field.choices else None
+    return field, choices
+
+
+def _value(model, name, raw):
+    """Значение поля из фикстуры: пустое — по умолчанию, строки CSV — через to_python поля"""
+    field, choices = _field(model, name)
+    if isinstance(raw, str):
+        raw = raw.strip()
+    if raw is None or raw == '':
+        return field.get_default()
+    if isinstance(field, models.BooleanField) and isinstance(raw, str):
+        return raw.lower() in _TRUE
+    try:
+        value = field.to_python(raw)
+    except ValidationError as e:
+        raise LoadError(f'{name}: {" ".join(e.messages)}')
+    if choices is not None and value not in choices:
+        raise LoadError(f'{name}: недопустимое значение {value!r}')
+    if isinstance(value, dt.datetime) and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def _values(model, fields, row):
+    """Поля, которые в строке есть"""
+    return {name: _value(model, name, row[name]) for name in fields if name in row}
+
+
+def _required(row, name):
+    value = str(row.get(name) or '').strip()
+    if not value:
+        raise LoadError(f'не указано {name}')
+    return value
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class _Hospitals:
+    """Название и id больницы → id; при одинаковых названиях — самая старая"""
+
+    def __init__(self):
+        self.by_name, self.ids = {}, set()
+        for pk, name in Hospital.objects.order_by('-id').values_list('id', 'name'):
+            self.by_name[name] = pk
+            self.ids.add(pk)
+
+    def resolve(self, row):
+        if row.get('hospital_id') not in (None, ''):
+            try:
+                pk = int(row['hospital_id'])
+            except (TypeError, ValueError):
+                raise LoadError(f'hospital_id: не число {row["hospital_id"]!r}')
+            if pk not in self.ids:
+                raise LoadError(f'нет больницы с id {pk}')
+            return pk
+        name = _required(row, 'hospital')
+        if name not in self.by_name:
+            raise LoadError(f'нет больницы {name!r}')
+        return self.by_name[name]
+
+
+def _add_stats(stats):
+    """
+    Прибавляет {(day, hospital_id, specialty, status): число} к AppointmentStat
+    одним INSERT ... ON CONFLICT DO UPDATE (есть и в SQLite, и в PostgreSQL).
+    bulk_create(update_conflicts=True) умеет только перезаписать count.
+    """
+    ops = connection.ops
+    table = ops.quote_name(AppointmentStat._meta.db_table)
+    fields = [AppointmentStat._meta.get_field(name) for name in ('day', 'hospital', 'specialty', 'status', 'count')]
+    columns = [ops.quote_name(field.column) for field in fields]
+    count = columns[-1]
+    sql = (f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+           f'ON CONFLICT ({", ".join(columns[:-1])}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}')
+    day_field = fields[0]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (day_field.get_db_prep_save(day, connection), hospital_id, specialty, status, n)
+            for (day, hospital_id, specialty, status), n in stats.items()
+        ])
+
+
+# ── Справочники: сверка в памяти ──────────────────────────────────────────────
+
+def _parse_all(kind, rows, parse):
+    """{ключ: значения}; при повторе ключа побеждает последняя строка"""
+    parsed = {}
+    for number, row in enumerate(rows, start=1):
+        try:
+            key, values = parse(row)
+        except LoadError as e:
+            raise LoadError(f'{kind}, строка {number}: {e}')
+        parsed[key] = values
+    return parsed
+
+
+def _sync(model, report, parsed, existing, fields, batch_size):
+    """
+    Вставляет новые и обновляет изменившиеся строки.
+    existing — {ключ: (pk, {поле: значение})} по fields.
+    Возвращает [(pk, было, стало)] обновлённых строк.
+    """
+    to_create, to_update, changed = [], [], []
+    for key, values in parsed.items():
+        current = existing.get(key)
+        if current is None:
+            to_create.append(values)
+            continue
+        pk, before = current
+        after = {**before, **{name: values[name] for name in fields if name in values}}
+        if after == before:
+            report.unchanged += 1
+            continue
+        to_update.append(model(pk=pk, **after))
+        changed.append((pk, before, after))
+
+    for batch in _batches(to_create, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create([model(**values) for values in batch])
+    for batch in _batches(to_update, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, list(fields))
+    report.created += len(to_create)
+    report.updated += len(to_update)
+    return changed
+
+
+def _existing(queryset, key_fields, fields):
+    """{ключ: (pk, {поле: значение})}; при повторе ключа — самая старая строка"""
+    existing = {}
+    size = len(key_fields)
+    for pk, *values in queryset.order_by('-id').values_list('id', *key_fields, *fields):
+        key = values[0] if size == 1 else tuple(values[:size])
+        existing[key] = (pk, dict(zip(fields, values[size:])))
+    return existing
+
+
+def load_hospitals(rows, batch_size=BATCH_SIZE):
+    """Больницы по названию: новые создаются, изменившиеся обновляются"""
+    started = time.perf_counter()
+    report = Report('hospitals')
+
+    def parse(row):
+        name = _required(row, 'name')
+        return name, {'name': name, **_values(Hospital, HOSPITAL_FIELDS, row)}
+
+    parsed = _parse_all(report.kind, rows, parse)
+    _sync(Hospital, report, parsed, _existing(Hospital.objects, ['name'], HOSPITAL_FIELDS),
+          HOSPITAL_FIELDS, batch_size)
+    if report.created or report.updated:
+        _bump_generations(directory=True)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def load_doctors(rows, batch_size=BATCH_SIZE):
+    """
+    Врачи по (больница, ФИО, специальность). Новым врачам расписание
+    строится по тексту при расчёте слотов (schedule.generate); у врачей
+    с изменившимися work_days/work_hours старое расписание удаляется.
+    """
+    started = time.perf_counter()
+    report = Report('doctors')
+    hospitals = _Hospitals()
+
+    def parse(row):
+        hospital_id = hospitals.resolve(row)
+        full_name = _required(row, 'full_name')
+        specialty = _value(Doctor, 'specialty', _required(row, 'specialty'))
+        values = _values(Doctor, DOCTOR_FIELDS, row)
+        return (hospital_id, full_name, specialty), {
+            'hospital_id': hospital_id, 'full_name': full_name, 'specialty': specialty, **values,
+        }
+
+    parsed = _parse_all(report.kind, rows, parse)
+    existing = _existing(Doctor.objects, ['hospital_id', 'full_name', 'specialty'], DOCTOR_FIELDS)
+    changed = _sync(Doctor, report, parsed, existing, DOCTOR_FIELDS, batch_size)
+
+    retimed = [
+        pk for pk, before, after in changed
+        if (before['work_days'], before['work_hours']) != (after['work_days'], after['work_hours'])
+    ]
+    for batch in _batches(retimed, batch_size):
+        with transaction.atomic():
+            DoctorSchedule.objects.filter(doctor_id__in=batch).delete()
+            DoctorSlotDay.objects.filter(doctor_id__in=batch).delete()
+
+    if report.created or report.updated:
+        _bump_generations(directory=True)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+# ── Записи: поток пачками ─────────────────────────────────────────────────────
+
+def load_appointments(rows, batch_size=BATCH_SIZE):
+    """Добавляет записи; строки с уже существующим code пропускаются"""
+    started = time.perf_counter()
+    report = Report('appointments')
+    hospitals = _Hospitals()
+    doctors = {
+        (hospital_id, full_name, specialty): pk
+        for pk, hospital_id, full_name, specialty in Doctor.objects.order_by('-id').values_list(
+            'id', 'hospital_id', 'full_name', 'specialty')
+    }
+    users = {}  # username → id, читаются при первой строке с user
+
+    def parse(row):
+        hospital_id = hospitals.resolve(row)
+        values = {'hospital_id': hospital_id, **_values(Appointment, APPOINTMENT_FIELDS, row)}
+        for name in ('patient_name', 'specialty', 'datetime'):
+            if not values.get(name):
+                raise LoadError(f'не указано {name}')
+        doctor = str(row.get('doctor') or '').strip()
+        if doctor:
+            key = (hospital_id, doctor, values['specialty'])
+            if key not in doctors:
+                raise LoadError(f'нет врача {doctor!r} ({values["specialty"]}) в этой больнице')
+            values['doctor_id'] = doctors[key]
+        username = str(row.get('user') or '').strip()
+        if username:
+            if not users:
+                users.update(User.objects.values_list('username', 'id'))
+            if username not in users:
+                raise LoadError(f'нет пользователя {username!r}')
+            values['user_id'] = users[username]
+        code = str(row.get('code') or '').strip()
+        if code:
+            values['code'] = code
+        return values
+
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            batch.append(parse(row))
+        except LoadError as e:
+            raise LoadError(f'{report.kind}, строка {number}: {e}')
+        if len(batch) >= batch_size:
+            _insert_appointments(batch, report)
+            batch = []
+    if batch:
+        _insert_appointments(batch, report)
+
+    if report.created:
+        _bump_generations(directory=False)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _insert_appointments(batch, report):
+    with transaction.atomic():
+        given = {values['code'] for values in batch if 'code' in values}
+        known = set(Appointment.objects.filter(code__in=given).values_list('code', flat=True)) if given else set()
+        fresh = []
+        for values in batch:
+            code = values.get('code')
+            if code in known:
+                report.unchanged += 1
+                continue
+            if code:
+                known.add(code)  # повтор кода внутри файла
+            values.setdefault('status', 'confirmed')
+            fresh.append(values)
+        if not fresh:
+            return
+
+        codes = _new_codes(sum(1 for values in fresh if 'code' not in values))
+        tz = timezone.get_current_timezone()  # день очереди — как Appointment.queue_day
+        days = [(values['hospital_id'], values['datetime'].astimezone(tz).date()) for values in fresh]
+        queue = _load_queue(days)
+        for values, key in zip(fresh, days):
+            if 'code' not in values:
+                values['code'] = next(codes)
+            queue[key] += 1
+            values['queue_position'] = queue[key]
+
+        appointments = Appointment.objects.bulk_create([Appointment(**values) for values in fresh])
+
+        # Время врача; слот уже занят (двойная запись в фикстуре) —
+        # запись остаётся без брони
+        SlotHold.objects.bulk_create([
+            SlotHold(doctor_id=appointment.doctor_id, slot=appointment.datetime, appointment_id=appointment.pk)
+            for appointment in appointments if appointment.doctor_id and appointment.status == 'confirmed'
+        ], ignore_conflicts=True)
+
+        _save_queue(queue)
+        _add_stats(Counter((day, hospital_id, values['specialty'], values['status'])
+                           for values, (hospital_id, day) in zip(fresh, days)))
+    report.created += len(fresh)
+
+
+def _new_codes(count):
+    """Итератор count свободных кодов: одно резервирование и одна проверка на старые случайные коды"""
+    codes = []
+    while len(codes) < count:
+        block = appointment_codes.take(count - len(codes))
+        taken = set(Appointment.objects.filter(code__in=block).values_list('code', flat=True))
+        codes.extend(code for code in block if code not in taken)
+    return iter(codes)
+
+
+def _load_queue(keys):
+    """
+    {(hospital_id, день): последнее выданное место} для ключей пачки: из
+    счётчика QueueCounter, а без него — число подтверждённых записей дня
+    (как next_position). Счётчики блокируются до конца транзакции пачки,
+    поэтому живые записи на те же дни ждут её, а не получают те же места.
+    """
+    queue = {}
+    missing = defaultdict(set)  # день → больницы
+    for hospital_id, day in keys:
+        missing[day].add(hospital_id)
+    # По дню на запрос: фильтр hospital_id__in × day__in вернул бы все пары
+    for day, hospital_ids in missing.items():
+        counters = QueueCounter.objects.select_for_update().filter(day=day, hospital_id__in=hospital_ids)
+        for hospital_id, last in counters.values_list('hospital_id', 'last_position'):
+            queue[(hospital_id, day)] = last
+        rest = {hospital_id for hospital_id in hospital_ids if (hospital_id, day) not in queue}
+        if rest:
+            counts = (
+                Appointment.objects.filter(hospital_id__in=rest, status='confirmed').on_days(day)
+                .order_by().values_list('hospital_id').annotate(count=Count('id'))
+            )
+            for hospital_id, count in counts:
+                queue[(hospital_id, day)] = count
+            for hospital_id in rest:
+                queue.setdefault((hospital_id, day), 0)
+    return queue
+
+
+def _save_queue(queue):
+    """
+    Записывает queue в QueueCounter: недостающие счётчики создаются, у
+    остальных last_position только растёт (GREATEST, в SQLite — MAX), чтобы
+    не откатить места, выданные живыми записями.
+    """
+    QueueCounter.objects.bulk_create([
+        QueueCounter(hospital_id=hospital_id, day=day, last_position=last)
+        for (hospital_id, day), last in queue.items()
+    ], ignore_conflicts=True)
+    by_day = defaultdict(dict)
+    for (hospital_id, day), last in queue.items():
+        by_day[day][hospital_id] = last
+    for day, positions in by_day.items():
+        QueueCounter.objects.filter(day=day, hospital_id__in=positions).update(last_position=Greatest(
+            'last_position',
+            Case(*[When(hospital_id=hospital_id, then=Value(last)) for hospital_id, last in positions.items()],
+                 output_field=models.PositiveIntegerField()),
+        ))
+
+
+def _bump_generations(directory):
+    """То, что сделали бы сигналы post_save: directory — менялись больницы или врачи"""
+    caching.bump_generation()
+    if directory:
+        geo.bump_generation()
+        doctor_context.bump_generation()
+
+
+LOADERS = {
+    'hospitals':    load_hospitals,
+    'doctors':      load_doctors,
+    'appointments': load_appointments,
+}
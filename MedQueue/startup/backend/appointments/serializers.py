@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.utils import timezone
+from . import schedule
 from .models import Hospital, Appointment, Doctor
 
 
@@ -66,6 +67,13 @@ class HospitalDetailSerializer(serializers.ModelSerializer):
 
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания новой записи"""
+    # Только колонки для проверки и ответа AppointmentStatusSerializer
+    hospital = serializers.PrimaryKeyRelatedField(
+        queryset=Hospital.objects.only('name', 'address', 'type'))
+    doctor = serializers.PrimaryKeyRelatedField(
+        queryset=Doctor.objects.only('hospital', 'specialty', 'full_name', 'cabinet'),
+        required=False, allow_null=True)
+    hold = serializers.UUIDField(required=False, write_only=True)
 
     class Meta:
         model = Appointment
@@ -76,9 +84,9 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
             'specialty',
             'datetime',
             'comment',
+            'hold',
         ]
         extra_kwargs = {
-            'doctor': {'required': False, 'allow_null': True},
             'comment': {'required': False, 'allow_blank': True},
         }
 
@@ -97,8 +105,22 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
                 )
             # Автоматически берём специальность от врача
             data['specialty'] = doctor.specialty
+            # Время должно попадать в рабочий слот по расписанию врача
+            error = schedule.slot_error(doctor.id, data['datetime'])
+            if error:
+                raise serializers.ValidationError({'datetime': error})
+        elif data.get('hold'):
+            raise serializers.ValidationError({'hold': 'Бронь времени возможна только к врачу'})
         return data
 
+    def create(self, validated_data):
+        # Бронь времени (POST /api/appointments/hold/) подтверждается в Appointment.save
+        hold_token = validated_data.pop('hold', None)
+        appointment = Appointment(**validated_data)
+        appointment.hold_token = hold_token
+        appointment.save()
+        return appointment
+
 
 class AppointmentStatusSerializer(serializers.ModelSerializer):
     """Детальный сериализатор для проверки статуса записи"""
@@ -0,0 +1,120 @@
+"""Обработчики сигналов моделей appointments (подключаются в apps.py)"""
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import caching, doctor_context, events, geo, schedule
+from .models import (
+    Hospital, Doctor, DoctorInviteCode, DoctorSchedule, Appointment, AppointmentStat, SlotHold,
+    queue_renumbered,
+)
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_hospital_cache(sender, **kwargs):
+    """Изменились больницы, врачи или очередь — сбрасываем кэш ответов API больниц"""
+    # После коммита: иначе параллельный запрос успеет закэшировать старые данные
+    transaction.on_commit(caching.bump_generation)
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_geo_index(sender, **kwargs):
+    """Координаты, активность больниц или специальности врачей — перестроить индекс поиска рядом"""
+    transaction.on_commit(geo.bump_generation)
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=DoctorInviteCode)
+@receiver(post_delete, sender=DoctorInviteCode)
+def invalidate_doctor_context(sender, **kwargs):
+    """Изменились инвайт-коды, врачи или больницы — сбрасываем кэш контекстов портала врача"""
+    transaction.on_commit(doctor_context.bump_generation)
+
+
+@receiver(post_save, sender=Appointment)
+def publish_appointment_event(sender, instance, created, update_fields=None, **kwargs):
+    """Живые обновления очереди: новая запись или смена статуса"""
+    if update_fields is not None and 'status' not in update_fields:
+        return  # например, правка комментария — очередь не меняется
+    event = 'created' if created else instance.status
+    transaction.on_commit(lambda: events.publish_appointment_change(instance, event))
+
+
+@receiver(post_save, sender=Appointment)
+def release_cancelled_slot(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Отменённая запись освобождает время врача"""
+    if raw or created or instance.status != 'cancelled' or not instance.doctor_id:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    SlotHold.objects.filter(appointment=instance).delete()
+
+
+@receiver(queue_renumbered)
+def publish_queue_renumbered(sender, hospital_id, day, changes, **kwargs):
+    transaction.on_commit(lambda: events.publish_renumbered(hospital_id, day, changes))
+
+
+def _stat_bucket(values):
+    return AppointmentStat.bucket(*values) if values else None
+
+
+def _current_stat_values(instance):
+    return tuple(getattr(instance, field) for field in Appointment.STAT_FIELDS)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_stat_bucket(sender, instance, **kwargs):
+    """Запись загружена без нужных полей (only/defer) — дочитываем их, чтобы знать старую ячейку"""
+    if instance._state.adding or hasattr(instance, '_stat_loaded'):
+        return
+    instance._stat_loaded = (
+        Appointment.objects.filter(pk=instance.pk).values_list(*Appointment.STAT_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Appointment)
+def count_appointment_stats(sender, instance, created, raw=False, **kwargs):
+    """Счётчики AppointmentStat: новая запись, смена статуса, дня, больницы или специальности"""
+    if raw:
+        return  # loaddata — после загрузки фикстур выполните rebuild_stats
+    current = _current_stat_values(instance)
+    old = None if created else _stat_bucket(instance._stat_loaded)
+    AppointmentStat.move(old, _stat_bucket(current))
+    instance._stat_loaded = current
+
+
+@receiver(post_delete, sender=Appointment)
+def uncount_appointment_stats(sender, instance, **kwargs):
+    values = getattr(instance, '_stat_loaded', None) or _current_stat_values(instance)
+    AppointmentStat.move(_stat_bucket(values), None)
+
+
+@receiver(post_save, sender=Doctor)
+def sync_doctor_schedule(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Новый врач или изменился текст work_days/work_hours — пересобираем DoctorSchedule"""
+    if raw or (update_fields is not None and not {'work_days', 'work_hours'} & set(update_fields)):
+        return
+    text = (instance.work_days, instance.work_hours)
+    if created or getattr(instance, '_schedule_text', None) != text:
+        schedule.sync_from_text(instance)
+        instance._schedule_text = text
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def reset_doctor_slots(sender, instance, **kwargs):
+    """Расписание поправили вручную — сетку слотов пересчитают при следующем запросе"""
+    schedule.reset(instance.doctor_id)
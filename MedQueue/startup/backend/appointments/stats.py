@@ -0,0 +1,101 @@
+"""
+Статистика админ-панели.
+
+Итоги дашборда собираются одним SQL-запросом из скалярных подзапросов.
+Число записей берётся из AppointmentStat (сотни строк), а не из таблицы
+записей, поэтому дашборд не сканирует её при каждом обновлении.
+"""
+
+import datetime as dt
+
+from django.db import connection
+from django.db.models import Sum, Q
+from django.utils import timezone
+
+from .models import AppointmentStat, Doctor, DoctorInviteCode, Hospital, UserProfile
+
+HISTORY_GROUPS = ('day', 'hospital', 'specialty')
+MAX_HISTORY_DAYS = 366
+
+
+def _subquery(queryset, expression):
+    """(SQL, params) скалярного подзапроса над queryset, например COUNT(*)"""
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    return f'(SELECT {expression} FROM ({sql}) AS sub)', params
+
+
+def dashboard_totals():
+    """Все числа дашборда за один запрос к базе"""
+    stats = AppointmentStat.objects.all()
+    parts = {
+        'hospitals':    (Hospital.objects.all(), 'COUNT(*)'),
+        'doctors':      (Doctor.objects.filter(is_active=True), 'COUNT(*)'),
+        'users':        (UserProfile.objects.filter(role='patient'), 'COUNT(*)'),
+        'invite_codes': (DoctorInviteCode.objects.filter(is_used=False), 'COUNT(*)'),
+    }
+    columns, params = [], []
+    for name, (queryset, expression) in parts.items():
+        sql, sub_params = _subquery(queryset, expression)
+        columns.append(sql)
+        params.extend(sub_params)
+
+    # Суммы по AppointmentStat: values('pk') не подходит, нужен столбец count
+    for name, queryset in (('appointments', stats), ('confirmed', stats.filter(status='confirmed'))):
+        sql, sub_params = queryset.order_by().values('count').query.sql_with_params()
+        columns.append(f'(SELECT COALESCE(SUM(sub.count), 0) FROM ({sql}) AS sub)')
+        params.extend(sub_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columns), params)
+        row = cursor.fetchone()
+    names = [*parts, 'appointments', 'confirmed']
+    return dict(zip(names, row))
+
+
+def history(days=14, group='day', hospital_id=None, specialty=None):
+    """
+    Записи по дням приёма за последние days дней (включая сегодня),
+    сгруппированные по day, hospital или specialty, с разбивкой по статусам.
+    """
+    last = timezone.localdate()
+    first = last - dt.timedelta(days=days - 1)
+    qs = AppointmentStat.objects.filter(day__gte=first, day__lte=last)
+    if hospital_id:
+        qs = qs.filter(hospital_id=hospital_id)
+    if specialty:
+        qs = qs.filter(specialty=specialty)
+
+    key = {'day': 'day', 'hospital': 'hospital_id', 'specialty': 'specialty'}[group]
+    columns = [key, 'hospital__name'] if group == 'hospital' else [key]
+    rows = qs.values(*columns).annotate(
+        total=Sum('count'),
+        confirmed=Sum('count', filter=Q(status='confirmed')),
+        cancelled=Sum('count', filter=Q(status='cancelled')),
+        completed=Sum('count', filter=Q(status='completed')),
+    ).order_by(key)
+
+    result = []
+    for row in rows:
+        item = {
+            'total':     row['total'] or 0,
+            'confirmed': row['confirmed'] or 0,
+            'cancelled': row['cancelled'] or 0,
+            'completed': row['completed'] or 0,
+        }
+        if group == 'day':
+            item = {'day': row['day'].isoformat(), **item}
+        elif group == 'hospital':
+            item = {'hospital': {'id': row['hospital_id'], 'name': row['hospital__name']}, **item}
+        else:
+            item = {'specialty': row['specialty'], **item}
+        result.append(item)
+
+    if group == 'day':
+        # Дни без записей — нулями, чтобы на графике не было пропусков
+        known = {item['day']: item for item in result}
+        result = [
+            known.get(day.isoformat(), {'day': day.isoformat(), 'total': 0, 'confirmed': 0,
+                                        'cancelled': 0, 'completed': 0})
+            for day in (first + dt.timedelta(days=i) for i in range(days))
+        ]
+    return result
@@ -1 +1,1826 @@
 # Тесты приложения appointments
+import asyncio
+import http.server
+import json
+import queue
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as clock, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import assistant, events, expiry, geo, mailer, metrics, querybudget
+from .recaptcha import RecaptchaVerifier
+from .codes import CODE_SPACE, CodeAllocator, encode, permute, round_keys
+from .fallback import FALLBACK_RULES, DEFAULT_REPLY, fallback_reply, match_rule
+from .models import (
+    Hospital, Doctor, Appointment, DoctorInviteCode, QueueCounter,
+    VerificationCode, PasswordResetCode, OutboundEmail, UserProfile, AppointmentStat,
+    DoctorSchedule, DoctorSlotDay, SlotHold, SlotTaken, SPECIALTIES_CHOICES,
+)
+from .schedule import availability, generate, parse_work_days, parse_work_hours
+
+
+def make_hospital(name='Городская поликлиника №1', **kwargs):
+    kwargs.setdefault('type', 'Поликлиника')
+    kwargs.setdefault('address', 'ул. Абая, 1')
+    return Hospital.objects.create(name=name, **kwargs)
+
+
+def make_appointment(hospital, doctor=None, days=1, **kwargs):
+    kwargs.setdefault('patient_name', 'Иван Иванов')
+    kwargs.setdefault('specialty', doctor.specialty if doctor else 'Терапевт')
+    kwargs.setdefault('datetime', timezone.now() + timedelta(days=days))
+    return Appointment.objects.create(hospital=hospital, doctor=doctor, **kwargs)
+
+
+def next_monday_at(hour, minute=0):
+    """Ближайший будущий понедельник в hour:minute по местному времени"""
+    today = timezone.localdate()
+    monday = today + timedelta(days=7 - today.weekday())
+    return timezone.make_aware(datetime.combine(monday, clock(hour, minute)))
+
+
+class HospitalListQueriesTest(TestCase):
+    """GET /api/hospitals/ не должен делать COUNT на каждую больницу"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_is_constant_in_queries(self):
+        for i in range(10):
+            h = make_hospital(f'Больница {i}')
+            make_appointment(h)
+            make_appointment(h, status='cancelled')
+            make_appointment(h, days=-1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/hospitals/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()), 10)
+        self.assertTrue(all(h['current_queue'] == 1 for h in res.json()))
+
+
+class DoctorRosterQueriesTest(TestCase):
+    """Карточка больницы и список врачей — фиксированное число запросов"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.hospital = make_hospital()
+        specialties = ['Терапевт', 'Хирург', 'Кардиолог']
+        for i in range(30):
+            doctor = Doctor.objects.create(
+                hospital=self.hospital,
+                full_name=f'Врач {i:02d}',
+                specialty=specialties[i % 3],
+            )
+            make_appointment(self.hospital, doctor)
+        Doctor.objects.create(
+            hospital=self.hospital, full_name='Уволен', specialty='Хирург', is_active=False,
+        )
+
+    def test_doctors_roster(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(f'/api/hospitals/{self.hospital.id}/doctors/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([g['specialty'] for g in res.json()], ['Кардиолог', 'Терапевт', 'Хирург'])
+        self.assertEqual(sum(len(g['doctors']) for g in res.json()), 30)
+        self.assertTrue(all(d['current_queue'] == 1 for g in res.json() for d in g['doctors']))
+
+    def test_hospital_detail(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(f'/api/hospitals/{self.hospital.id}/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['current_queue'], 30)
+        self.assertEqual(len(res.json()['doctors']), 31)
+
+
+class QueuePositionTest(TransactionTestCase):
+    """Места в очереди выдаются счётчиком и не дублируются под нагрузкой"""
+
+    def test_sequential_positions(self):
+        hospital = make_hospital()
+        positions = [make_appointment(hospital).queue_position for _ in range(3)]
+        self.assertEqual(positions, [1, 2, 3])
+        other_day = make_appointment(hospital, days=2)
+        self.assertEqual(other_day.queue_position, 1)
+
+    def test_counter_seeds_from_existing_rows(self):
+        hospital = make_hospital()
+        make_appointment(hospital)
+        make_appointment(hospital)
+        QueueCounter.objects.all().delete()
+        self.assertEqual(make_appointment(hospital).queue_position, 3)
+
+    def test_cancel_keeps_positions_dense(self):
+        hospital = make_hospital()
+        first, second, third = (make_appointment(hospital) for _ in range(3))
+        res = APIClient().post('/api/appointments/cancel/', {'code': second.code}, format='json')
+        self.assertEqual(res.status_code, 200)
+        first.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.queue_position, third.queue_position), (1, 2))
+        self.assertEqual(make_appointment(hospital).queue_position, 3)
+
+    def test_cancel_renumbers_in_constant_queries(self):
+        hospital = make_hospital()
+        appointments = [make_appointment(hospital) for _ in range(50)]
+        # вкл. BEGIN/SAVEPOINT/COMMIT, блокировку счётчика и 5 запросов статистики
+        # (UPDATE ячейки confirmed, новая ячейка cancelled: UPDATE, SAVEPOINT, INSERT, RELEASE)
+        with self.assertNumQueries(15):
+            res = APIClient().post('/api/appointments/cancel/', {'code': appointments[0].code}, format='json')
+        self.assertEqual(res.status_code, 200)
+        positions = Appointment.objects.filter(status='confirmed').values_list('queue_position', flat=True)
+        self.assertEqual(sorted(positions), list(range(1, 50)))
+
+    def test_renumber_locks_counter_before_reading_queue(self):
+        hospital = make_hospital()
+        appointment = make_appointment(hospital)
+        with CaptureQueriesContext(connection) as queries:
+            QueueCounter.renumber(hospital.id, appointment.queue_day)
+        tables = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertIn('appointments_queuecounter', tables[0])
+        self.assertIn('appointments_appointment', tables[1])
+
+    def test_concurrent_bookings(self):
+        hospital = make_hospital()
+        when = timezone.now() + timedelta(days=1)
+
+        def book(i):
+            try:
+                return Appointment.objects.create(
+                    hospital=hospital, patient_name=f'Пациент {i}',
+                    specialty='Терапевт', datetime=when,
+                ).queue_position
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            positions = list(pool.map(book, range(200)))
+
+        self.assertEqual(sorted(positions), list(range(1, 201)))
+
+
+class CodeAllocatorTest(TransactionTestCase):
+    """Коды строятся из последовательности и не требуют проверок exists()"""
+
+    def test_permutation_is_bijective(self):
+        keys = round_keys('test')
+        sample = list(range(0, 200_000)) + list(range(CODE_SPACE - 1000, CODE_SPACE))
+        images = {permute(v, keys) for v in sample}
+        self.assertEqual(len(images), len(sample))
+        self.assertTrue(all(0 <= v < CODE_SPACE for v in images))
+
+    def test_codes_are_unique_and_well_formed(self):
+        allocator = CodeAllocator('test-unique', block_size=50)
+        codes = [allocator.next_code() for _ in range(500)]
+        self.assertEqual(len(set(codes)), 500)
+        self.assertTrue(all(len(c) == 6 and not set(c) & set('IO01') for c in codes))
+        self.assertRegex(DoctorInviteCode.generate_code(), r'^MEDQ-[A-Z2-9]{6}$')
+
+    def test_invite_code_skips_legacy_random_codes(self):
+        DoctorInviteCode.objects.create(code='MEDQ-LEGACY')
+        with mock.patch('appointments.models.invite_codes.next_code', side_effect=['MEDQ-LEGACY', 'MEDQ-FRESH2']):
+            self.assertEqual(DoctorInviteCode.generate_code(), 'MEDQ-FRESH2')
+
+    def test_booking_skips_exists_checks(self):
+        hospital = make_hospital()
+        make_appointment(hospital)  # резервирует блок кодов
+        # BEGIN, счётчик очереди (UPDATE + SELECT), SAVEPOINT, INSERT, RELEASE,
+        # UPDATE статистики, COMMIT
+        with self.assertNumQueries(8):
+            make_appointment(hospital)
+
+    def test_collision_with_legacy_code(self):
+        hospital = make_hospital()
+        allocator = CodeAllocator('test-legacy', block_size=10)
+        upcoming = encode(permute(0, round_keys('test-legacy')))
+        make_appointment(hospital, code=upcoming)
+        with mock.patch('appointments.models.appointment_codes', allocator):
+            appointment = make_appointment(hospital)
+        self.assertNotEqual(appointment.code, upcoming)
+
+
+class HotPathIndexTest(TestCase):
+    """EXPLAIN горячих запросов должен показывать использование индексов"""
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # На маленькой тестовой таблице планировщик иначе выберет seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN проверяется только для SQLite и PostgreSQL')
+        self.hospital = make_hospital()
+        self.doctor = Doctor.objects.create(hospital=self.hospital, full_name='Врач', specialty='Терапевт')
+        make_appointment(self.hospital, self.doctor)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'Индекс {index_name} не используется:\n{plan}')
+
+    def test_hospital_day_queue(self):
+        today = timezone.localdate()
+        qs = Appointment.objects.filter(hospital=self.hospital, status='confirmed').on_days(today)
+        self.assertUsesIndex(qs.order_by('datetime', 'id'), 'appt_hospital_status_dt')
+
+    def test_doctor_queue(self):
+        qs = Appointment.objects.filter(
+            doctor=self.doctor, status='confirmed', datetime__gte=timezone.now()
+        )
+        self.assertUsesIndex(qs, 'appt_doctor_status_dt')
+
+    def test_my_appointments(self):
+        qs = Appointment.objects.filter(user_id=1).order_by('-created_at')
+        self.assertUsesIndex(qs, 'appt_user_created')
+
+    def test_latest_codes_by_email(self):
+        for model, index in ((VerificationCode, 'verif_email_created'),
+                             (PasswordResetCode, 'reset_email_created')):
+            qs = model.objects.filter(email='a@b.kz').order_by('-created_at')[:1]
+            self.assertUsesIndex(qs, index)
+
+    def test_expired_codes_by_expiry(self):
+        for model, index in ((VerificationCode, 'verif_expires'), (PasswordResetCode, 'reset_expires')):
+            qs = model.objects.expired().order_by('expires_at').values_list('id', flat=True)[:100]
+            self.assertUsesIndex(qs, index)
+
+    def test_on_days_matches_local_date(self):
+        today = timezone.localdate()
+        ids = set(Appointment.objects.on_days(today, today + timedelta(days=1)).values_list('id', flat=True))
+        expected = set(Appointment.objects.filter(
+            datetime__date__gte=today, datetime__date__lte=today + timedelta(days=1),
+        ).values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertTrue(ids)
+
+
+class HospitalResponseCacheTest(TestCase):
+    """Ответы API больниц кэшируются, отдаются с ETag и сбрасываются сигналами"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.hospital = make_hospital()
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/hospitals/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/hospitals/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_unused_query_params_share_one_entry(self):
+        first = self.client.get('/api/hospitals/', {'x': 1})
+        with self.assertNumQueries(0):
+            for value in range(2, 5):
+                res = self.client.get('/api/hospitals/', {'x': value, 'y': 'z'})
+                self.assertEqual(res.content, first.content)
+            self.client.get('/api/hospitals/')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(f'/api/hospitals/{self.hospital.id}/')['ETag']
+        res = self.client.get(f'/api/hospitals/{self.hospital.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_booking_invalidates_cached_queue(self):
+        url = f'/api/hospitals/{self.hospital.id}/doctors/'
+        doctor = Doctor.objects.create(hospital=self.hospital, full_name='Врач', specialty='Терапевт')
+        with self.captureOnCommitCallbacks(execute=True):
+            pass
+        before = self.client.get(url)
+        self.assertEqual(before.json()[0]['doctors'][0]['current_queue'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_appointment(self.hospital, doctor)
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()[0]['doctors'][0]['current_queue'], 1)
+
+    def test_missing_hospital_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/hospitals/999999/').status_code, 404)
+
+    def test_file_based_backend(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                       'LOCATION': location}
+            with self.settings(CACHES={'default': backend}):
+                first = self.client.get('/api/hospitals/')
+                with self.assertNumQueries(0):
+                    second = self.client.get('/api/hospitals/', HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(second.status_code, 304)
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event):
+        self.published.append((channel, event))
+
+
+class QueueEventsTest(TestCase):
+    """Изменения записей публикуются в каналы очереди после коммита"""
+
+    def setUp(self):
+        self.broker = RecordingBroker()
+        patcher = mock.patch('appointments.events.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hospital = make_hospital()
+        self.doctor = Doctor.objects.create(hospital=self.hospital, full_name='Врач', specialty='Терапевт')
+
+    def channels(self):
+        return [channel for channel, _ in self.broker.published]
+
+    def test_booking_publishes_to_all_channels(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = make_appointment(self.hospital, self.doctor)
+        day = appointment.queue_day
+        self.assertEqual(self.channels(), [
+            events.appointment_channel(appointment.code),
+            events.hospital_channel(self.hospital.id, day),
+            events.doctor_channel(self.doctor.id, day),
+        ])
+        self.assertEqual(self.broker.published[0][1]['event'], 'created')
+        self.assertEqual(self.broker.published[0][1]['queue_position'], 1)
+
+    def test_cancel_publishes_moved_positions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = make_appointment(self.hospital), make_appointment(self.hospital)
+        self.broker.published.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().post('/api/appointments/cancel/', {'code': first.code}, format='json')
+        self.assertIn((events.appointment_channel(second.code),
+                       {'event': 'moved', 'id': second.id, 'queue_position': 1, 'estimated_wait_time': 5}),
+                      self.broker.published)
+        self.assertEqual(
+            [e['event'] for c, e in self.broker.published if c == events.appointment_channel(first.code)],
+            ['cancelled'],
+        )
+
+    def test_comment_edit_is_silent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = make_appointment(self.hospital)
+        self.broker.published.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().patch('/api/appointments/update_comment/',
+                              {'code': appointment.code, 'comment': 'Опоздаю'}, format='json')
+        self.assertEqual(self.broker.published, [])
+
+
+class QueueEventStreamTest(SimpleTestCase):
+    """In-memory брокер и SSE-поток"""
+
+    def test_publish_from_another_thread(self):
+        broker = events.InMemoryBroker()
+
+        async def scenario():
+            subscription = broker.subscribe('hospital:1:2026-01-01')
+            thread = threading.Thread(
+                target=broker.publish, args=('hospital:1:2026-01-01', {'event': 'created'}),
+            )
+            thread.start()
+            event = await asyncio.wait_for(subscription.get(), 1)
+            thread.join()
+            subscription.close()
+            return event
+
+        self.assertEqual(asyncio.run(scenario()), {'event': 'created'})
+        self.assertEqual(broker.subscriber_count('hospital:1:2026-01-01'), 0)
+
+    def test_slow_subscriber_keeps_latest_events(self):
+        broker = events.InMemoryBroker(max_pending=2)
+
+        async def scenario():
+            subscription = broker.subscribe('c')
+            for i in range(5):
+                broker.publish('c', i)
+            await asyncio.sleep(0)
+            return [await subscription.get(), await subscription.get()]
+
+        self.assertEqual(asyncio.run(scenario()), [3, 4])
+
+    @override_settings(QUEUE_EVENTS_SSE=True)
+    async def test_sse_stream_delivers_events(self):
+        broker = events.InMemoryBroker()
+        with mock.patch('appointments.events.get_broker', return_value=broker):
+            response = await self.async_client.get('/api/events/appointments/abc234/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = aiter(response.streaming_content)
+            self.assertIn(b'subscribed appointment:ABC234', await anext(stream))
+
+            broker.publish('appointment:ABC234', {'event': 'moved', 'queue_position': 2})
+            chunk = await asyncio.wait_for(anext(stream), 1)
+            self.assertEqual(json.loads(chunk.decode()[len('data: '):]), {'event': 'moved', 'queue_position': 2})
+            await stream.aclose()
+
+    @override_settings(QUEUE_EVENTS_SSE=True)
+    async def test_bad_day_is_rejected(self):
+        response = await self.async_client.get('/api/events/hospitals/1/?day=завтра')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_disabled_without_setting(self):
+        response = await self.async_client.get('/api/events/appointments/abc234/')
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(QUEUE_EVENTS_SSE=True)
+    def test_rejected_under_wsgi(self):
+        # Под WSGI поток занял бы рабочий поток сервера до таймаута
+        response = self.client.get('/api/events/appointments/abc234/')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('ASGI', response.json()['error'])
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает всё и запоминает письма"""
+
+    def handle(self):
+        self.server.connections += 1
+        self.wfile.write(b'220 localhost ESMTP\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().split(b' ', 1)[0].upper()
+            if command == b'DATA':
+                self.wfile.write(b'354 go ahead\r\n')
+                data = []
+                for chunk in iter(self.rfile.readline, b''):
+                    if chunk.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(chunk)
+                self.server.messages.append(b''.join(data))
+                self.wfile.write(b'250 queued\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 ok\r\n')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.connections = 0
+        self.messages = []
+
+
+@override_settings(EMAIL_OUTBOX_WORKER='command', EMAIL_HOST_USER='noreply@medqueue.test')
+class OutboundEmailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_register_queues_email_instead_of_sending(self):
+        client = APIClient()
+        with mock.patch('appointments.auth_views.verify_recaptcha_token', return_value=True), \
+                self.captureOnCommitCallbacks(execute=True):
+            res = client.post('/api/auth/register/', {
+                'name': 'Айгерим', 'email': 'aigerim@example.com',
+                'password': 'secret123', 'username': 'aigerim',
+            }, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.to_email, 'aigerim@example.com')
+        self.assertEqual(queued.status, 'pending')
+        self.assertIn(VerificationCode.objects.get().code, queued.body)
+
+        self.assertEqual(mailer.dispatch_all(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'sent')
+        # Код остаётся только в отправленном письме, не в таблице
+        self.assertEqual(queued.body, '')
+
+    def test_sweep_deletes_old_sent_and_failed(self):
+        old = timezone.now() - OutboundEmail.RETAIN_DONE - timedelta(seconds=1)
+        for status in ('pending', 'sending', 'sent', 'failed'):
+            mailer.enqueue(f'{status}@example.com', 'Код', 'Ваш код: 1')
+            OutboundEmail.objects.filter(to_email=f'{status}@example.com').update(
+                status=status, next_attempt_at=old)
+        recent = mailer.enqueue('recent@example.com', 'Код', 'Ваш код: 2')
+        OutboundEmail.objects.filter(pk=recent.pk).update(status='sent')
+
+        self.assertEqual(expiry.sweep()['outboundemail'], 2)
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('to_email', flat=True)),
+                         ['pending@example.com', 'recent@example.com', 'sending@example.com'])
+
+    def test_batch_reuses_one_smtp_connection(self):
+        server = FakeSMTPServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        for i in range(5):
+            mailer.enqueue(f'user{i}@example.com', 'Код', f'Ваш код: {i}', 'noreply@medqueue.test')
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1],
+            EMAIL_HOST_PASSWORD='', EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+        ):
+            self.assertEqual(mailer.dispatch_pending(), 5)
+
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.messages), 5)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+
+    def test_interleaved_claims_do_not_share_a_message(self):
+        stuck = mailer.enqueue('stuck@example.com', 'Код', 'Ваш код: 1')
+        OutboundEmail.objects.filter(pk=stuck.pk).update(
+            status='sending', next_attempt_at=timezone.now() - mailer.SENDING_LEASE - timedelta(seconds=1),
+        )
+        mailer.enqueue('fresh@example.com', 'Код', 'Ваш код: 2')
+        claimed = {'a': None}
+
+        def interleave(execute, sql, params, many, context):
+            # Диспетчер A забирает пачку между SELECT и UPDATE диспетчера B
+            if sql.startswith('UPDATE') and claimed['a'] is None:
+                claimed['a'] = []
+                claimed['a'] = mailer._claim_batch(10)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(interleave):
+            claimed['b'] = mailer._claim_batch(10)
+        self.assertEqual(len(claimed['a']), 2)
+        self.assertEqual(claimed['b'], [])
+
+    def test_failed_send_backs_off_and_gives_up(self):
+        queued = mailer.enqueue('user@example.com', 'Код', 'Ваш код: 1')
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('connection refused')):
+            self.assertEqual(mailer.dispatch_pending(), 0)
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+            self.assertGreater(queued.next_attempt_at, timezone.now() + timedelta(seconds=20))
+            # Отложенное письмо не берётся повторно раньше срока
+            self.assertEqual(mailer.dispatch_pending(), 0)
+            self.assertEqual(OutboundEmail.objects.get().attempts, 1)
+
+            for _ in range(mailer.MAX_ATTEMPTS - 1):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now())
+                mailer.dispatch_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', mailer.MAX_ATTEMPTS))
+        self.assertIn('connection refused', queued.last_error)
+
+
+class _SiteVerifyHandler(http.server.BaseHTTPRequestHandler):
+    """Фейковый siteverify: success для любого токена, кроме 'bad'"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        body = json.dumps({'success': form['response'][0] != 'bad'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RecaptchaVerifierTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _SiteVerifyHandler)
+        self.server.daemon_threads = True
+        self.server.connections = self.server.requests = 0
+        self.server.delay = 0
+        self.server.handle_error = lambda request, address: None  # клиент ушёл по таймауту
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/recaptcha/api/siteverify' % self.server.server_address[1]
+
+    def test_keep_alive_connection_is_reused(self):
+        verifier = RecaptchaVerifier(url=self.url)
+        self.assertTrue(all(verifier.verify(f'token-{i}') for i in range(5)))
+        self.assertFalse(verifier.verify('bad'))
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_replayed_token_is_rejected_without_round_trip(self):
+        verifier = RecaptchaVerifier(url=self.url)
+        self.assertTrue(verifier.verify('once'))
+        self.assertFalse(verifier.verify('once'))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_slow_provider_respects_budget_and_policy(self):
+        self.server.delay = 0.5
+        for fail_open in (False, True):
+            verifier = RecaptchaVerifier(url=self.url, timeout=0.1, fail_open=fail_open)
+            started = time.monotonic()
+            self.assertIs(verifier.verify(f'slow-{fail_open}'), fail_open)
+            self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_unreachable_provider_fails_closed_by_default(self):
+        self.server.shutdown()
+        self.server.server_close()
+        verifier = RecaptchaVerifier(url=self.url, timeout=0.2)
+        self.assertFalse(verifier.verify('token'))
+
+
+class _MockLLMHandler(http.server.BaseHTTPRequestHandler):
+    """OpenAI-совместимый /v1/chat/completions со стримингом (chunked SSE)"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(request)
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for word in self.server.reply.split(' '):
+            event = {
+                'id': 'chatcmpl-1', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'mock',
+                'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}],
+            }
+            self._chunk(f'data: {json.dumps(event)}\n\n'.encode())
+            self.wfile.flush()
+        self._chunk(b'data: [DONE]\n\n')
+        self._chunk(b'')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_llm(test, reply, delay=0.0):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _MockLLMHandler)
+    server.daemon_threads = True
+    server.connections, server.requests = 0, []
+    server.reply, server.delay = reply, delay
+    server.handle_error = lambda request, address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+
+def mock_provider(name, server):
+    return {
+        'name': name, 'model': 'mock', 'api_key': 'test',
+        'base_url': 'http://127.0.0.1:%d/v1' % server.server_address[1],
+    }
+
+
+@override_settings(AI_HEDGE_DELAY=0.1, AI_FIRST_TOKEN_DEADLINE=0.5, AI_STREAM_DEADLINE=5)
+class AssistantTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def ask(self, message, **extra):
+        return self.client.post('/api/ai/chat/', {'message': message, **extra}, format='json')
+
+    def test_streams_tokens_as_sse(self):
+        server = start_mock_llm(self, 'Обратитесь к терапевту.')
+        with override_settings(AI_PROVIDERS=[mock_provider('kimi-k2', server)]):
+            res = self.ask('Болит горло', stream=True)
+            self.assertEqual(res['Content-Type'], 'text/event-stream')
+            events_ = [json.loads(line[len('data: '):]) for line in
+                       b''.join(res.streaming_content).decode().split('\n\n') if line]
+        self.assertEqual(''.join(e.get('delta', '') for e in events_).strip(), 'Обратитесь к терапевту.')
+        self.assertEqual(events_[-1], {'done': True, 'model': 'kimi-k2'})
+        # Текущий вопрос из history не дублируется в промпте
+        self.assertEqual([m['role'] for m in server.requests[0]['messages']], ['system', 'user'])
+
+    def test_form_stream_false_is_not_streamed(self):
+        for value in ('false', '0', ''):
+            res = self.client.post('/api/ai/chat/', {'message': 'Привет', 'stream': value})
+            self.assertEqual(res['Content-Type'], 'application/json', value)
+            self.assertEqual(res.json()['model'], 'fallback')
+        res = self.client.post('/api/ai/chat/', {'message': 'Привет', 'stream': 'true'})
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        b''.join(res.streaming_content)
+
+    def test_stalled_provider_gives_up_after_its_timeout(self):
+        stalled = start_mock_llm(self, 'поздно', delay=2.0)
+        events_ = queue.Queue()
+        started = time.monotonic()
+        assistant._run_provider({**mock_provider('kimi-k2', stalled), 'timeout': 0.2},
+                                [{'role': 'user', 'content': 'Привет'}], events_, threading.Event())
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(events_.get_nowait()[0], 'error')
+
+    def test_slow_provider_is_hedged(self):
+        slow = start_mock_llm(self, 'медленный ответ', delay=1.0)
+        fast = start_mock_llm(self, 'быстрый ответ')
+        with override_settings(AI_PROVIDERS=[mock_provider('kimi-k2', slow), mock_provider('gemini', fast)]):
+            started = time.monotonic()
+            res = self.ask('Какой врач лечит спину?')
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(res.json(), {'reply': 'быстрый ответ ', 'model': 'gemini'})
+
+    def test_falls_back_to_rules_after_deadline(self):
+        slow = start_mock_llm(self, 'поздно', delay=1.0)
+        with override_settings(AI_PROVIDERS=[mock_provider('kimi-k2', slow)]):
+            res = self.ask('Привет')
+        self.assertEqual(res.json()['model'], 'fallback')
+        self.assertIn('МедAi', res.json()['reply'])
+
+    def test_repeated_question_is_cached_and_client_pooled(self):
+        server = start_mock_llm(self, 'К неврологу.')
+        with override_settings(AI_PROVIDERS=[mock_provider('kimi-k2', server)]):
+            first = self.ask('Болит голова!')
+            second = self.ask('  болит   ГОЛОВА ')
+            self.ask('Болит спина', history=[{'role': 'user', 'content': 'Болит спина'}])
+            self.ask('А ещё?', history=[{'role': 'assistant', 'content': 'К неврологу.'}])
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(server.requests), 3)  # второй вопрос — из кэша
+        self.assertEqual(server.connections, 1)   # keep-alive клиент на процесс
+
+
+class FallbackRulesTest(SimpleTestCase):
+    def test_matches_legacy_chain_on_corpus(self):
+        from .management.commands.bench_ai_fallback import CORPUS, legacy_fallback
+        for message in CORPUS:
+            self.assertEqual(fallback_reply(message), legacy_fallback(message), message)
+
+    def test_higher_rule_wins_regardless_of_position(self):
+        # «голова» (правило 2) раньше в тексте, но «температура» (правило 1) приоритетнее
+        self.assertEqual(match_rule('Болит голова, и поднялась температура'), 1)
+        # слова перекрываются: «боль в груди» начинается внутри «головная боль»
+        self.assertEqual(match_rule('головная боль в груди'), 2)
+        self.assertEqual(match_rule('ЗУБЫ'), 9)
+        self.assertIn('стоматолог', FALLBACK_RULES[9][1])
+
+    def test_unknown_message_gets_default_reply(self):
+        self.assertIsNone(match_rule('Мне нужна справка'))
+        self.assertEqual(fallback_reply('Мне нужна справка'), {'reply': DEFAULT_REPLY})
+
+
+def make_admin_client():
+    admin = User.objects.create_user('admin', 'admin@medqueue.kz', 'x', is_staff=True)
+    UserProfile.objects.create(user=admin, role='admin')
+    client = APIClient()
+    client.force_authenticate(admin)
+    return client, admin
+
+
+class AdminListPaginationTest(TestCase):
+    def setUp(self):
+        self.client, self.admin = make_admin_client()
+
+    def walk(self, url, **params):
+        """Проходит все страницы, возвращает список страниц"""
+        pages, cursor = [], None
+        while True:
+            res = self.client.get(url, {**params, 'cursor': cursor} if cursor else params)
+            self.assertEqual(res.status_code, 200)
+            pages.append(res.json()['results'])
+            cursor = res.json()['next']
+            if not cursor:
+                return pages
+
+    def test_users_are_paged_newest_first_without_gaps(self):
+        joined = timezone.now() - timedelta(days=1)
+        for i in range(6):
+            # у половины одинаковое время регистрации — порядок решает id
+            User.objects.create_user(f'user{i}', f'user{i}@example.com', 'x',
+                                     date_joined=joined + timedelta(microseconds=i // 2))
+        pages = self.walk('/api/admin/users/', limit=3)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        emails = [u['email'] for page in pages for u in page]
+        self.assertEqual(emails[0], 'admin@medqueue.kz')
+        self.assertEqual(emails[1:], [f'user{i}@example.com' for i in (5, 4, 3, 2, 1, 0)])
+
+    def test_page_cost_does_not_depend_on_table_size(self):
+        User.objects.bulk_create([User(username=f'bulk{i}', email=f'bulk{i}@example.com') for i in range(300)])
+        first = self.client.get('/api/admin/users/', {'limit': 20}).json()
+        with self.assertNumQueries(1):  # одна выборка страницы с профилями
+            res = self.client.get('/api/admin/users/', {'limit': 20, 'cursor': first['next']})
+        self.assertEqual(len(res.json()['results']), 20)
+
+    def test_non_numeric_hospital_id_is_rejected(self):
+        for url in ('/api/admin/doctors/', '/api/admin/invite-codes/', '/api/admin/stats/history/'):
+            res = self.client.get(url, {'hospital_id': 'abc'})
+            self.assertEqual(res.status_code, 400, url)
+        res = self.client.post('/api/admin/invite-codes/', {'hospital_id': 'abc'}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_filters_and_fields(self):
+        hospital = make_hospital()
+        other = make_hospital('ГКБ №7')
+        Doctor.objects.create(hospital=hospital, full_name='Ахметова Дана', specialty='Терапевт')
+        Doctor.objects.create(hospital=other, full_name='Ахметов Ерлан', specialty='Хирург')
+        Doctor.objects.create(hospital=hospital, full_name='Сидоров Пётр', specialty='Хирург', is_active=False)
+
+        res = self.client.get('/api/admin/doctors/', {'q': 'Ахмет', 'hospital_id': hospital.id})
+        self.assertEqual([d['full_name'] for d in res.json()['results']], ['Ахметова Дана'])
+
+        res = self.client.get('/api/admin/doctors/', {'specialty': 'Хирург', 'is_active': 'false',
+                                                      'fields': 'id,full_name'})
+        self.assertEqual(res.json()['results'], [{'id': res.json()['results'][0]['id'],
+                                                  'full_name': 'Сидоров Пётр'}])
+
+        DoctorInviteCode.objects.create(code='MEDQ-AAAAAA')
+        DoctorInviteCode.objects.create(code='MEDQ-BBBBBB', is_used=True)
+        res = self.client.get('/api/admin/invite-codes/', {'is_used': 'false', 'fields': 'code'})
+        self.assertEqual(res.json(), {'results': [{'code': 'MEDQ-AAAAAA'}], 'next': None})
+
+        res = self.client.get('/api/admin/users/', {'role': 'admin', 'fields': 'email,role'})
+        self.assertEqual(res.json()['results'], [{'email': 'admin@medqueue.kz', 'role': 'admin'}])
+
+    def test_bad_parameters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/admin/users/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/users/', {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/users/', {'limit': 'all'}).status_code, 400)
+
+
+class AppointmentStatTest(TestCase):
+    def setUp(self):
+        self.client, _ = make_admin_client()
+        self.hospital = make_hospital()
+
+    def cells(self):
+        return {
+            (cell.day, cell.hospital_id, cell.specialty, cell.status): cell.count
+            for cell in AppointmentStat.objects.exclude(count=0)
+        }
+
+    def test_counters_follow_appointment_changes(self):
+        today = timezone.localdate()
+        first = make_appointment(self.hospital, days=0)
+        second = make_appointment(self.hospital, days=0, specialty='Хирург')
+        make_appointment(self.hospital, days=1)
+
+        APIClient().post('/api/appointments/cancel/', {'code': first.code}, format='json')
+        # загрузка без статуса: старая ячейка дочитывается перед сохранением
+        second = Appointment.objects.only('id').get(pk=second.pk)
+        second.status = 'completed'
+        second.save()
+        Appointment.objects.get(pk=second.pk).delete()
+
+        cells = self.cells()
+        self.assertEqual(cells, {
+            (today, self.hospital.id, 'Терапевт', 'cancelled'): 1,
+            (today + timedelta(days=1), self.hospital.id, 'Терапевт', 'confirmed'): 1,
+        })
+        AppointmentStat.rebuild()
+        self.assertEqual(self.cells(), cells)
+
+    def test_dashboard_is_one_query(self):
+        for days in range(3):
+            make_appointment(self.hospital, days=days)
+        Doctor.objects.create(hospital=self.hospital, full_name='Иванов', specialty='Терапевт')
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/admin/stats/')
+        self.assertEqual(res.json(), {
+            'hospitals': 1, 'doctors': 1, 'users': 0, 'invite_codes': 0,
+            'appointments': 3, 'confirmed': 3,
+        })
+
+    def test_history_by_day_and_hospital(self):
+        other = make_hospital('ГКБ №7')
+        make_appointment(self.hospital, days=0)
+        make_appointment(self.hospital, days=-1)
+        cancelled = make_appointment(other, days=0)
+        cancelled.status = 'cancelled'
+        cancelled.save()
+
+        by_day = self.client.get('/api/admin/stats/history/', {'days': 3}).json()
+        self.assertEqual([row['total'] for row in by_day], [0, 1, 2])
+        self.assertEqual(by_day[-1]['cancelled'], 1)
+
+        by_hospital = self.client.get('/api/admin/stats/history/', {'days': 3, 'group': 'hospital'}).json()
+        self.assertEqual(
+            [(row['hospital']['name'], row['confirmed'], row['cancelled']) for row in by_hospital],
+            [('Городская поликлиника №1', 2, 0), ('ГКБ №7', 0, 1)],
+        )
+        self.assertEqual(self.client.get('/api/admin/stats/history/', {'group': 'doctor'}).status_code, 400)
+
+
+class AdminHospitalsTest(TestCase):
+    def setUp(self):
+        self.client, _ = make_admin_client()
+
+    def test_aggregates_per_hospital(self):
+        hospital = make_hospital()
+        empty = make_hospital('ГКБ №7')
+        therapist = Doctor.objects.create(hospital=hospital, full_name='Ахметова Дана', specialty='Терапевт')
+        Doctor.objects.create(hospital=hospital, full_name='Ким Алия', specialty='Терапевт')
+        Doctor.objects.create(hospital=hospital, full_name='Сидоров Пётр', specialty='Хирург')
+        Doctor.objects.create(hospital=hospital, full_name='Орлов Иван', specialty='ЛОР', is_active=False)
+        make_appointment(hospital, therapist, days=0.01)
+        make_appointment(hospital, therapist, days=2)
+        make_appointment(hospital, therapist, days=3, status='cancelled')
+
+        rows = {h['name']: h for h in self.client.get('/api/admin/hospitals/').json()}
+        row = rows[hospital.name]
+        self.assertEqual(row['doctor_count'], 3)
+        self.assertEqual(row['specialty_count'], 2)
+        self.assertEqual(row['specialty_coverage'], round(2 * 100 / len(SPECIALTIES_CHOICES)))
+        self.assertEqual(row['queue_count'], 2)
+        self.assertEqual(row['appointment_count'], 3)
+        self.assertEqual(rows[empty.name]['doctor_count'], 0)
+        self.assertEqual(rows[empty.name]['appointment_count'], 0)
+
+    def test_query_count_does_not_depend_on_hospitals(self):
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(name=f'Поликлиника №{i}', type='Поликлиника', address=f'ул. Абая, {i}')
+            for i in range(500)
+        ])
+        Doctor.objects.bulk_create([
+            Doctor(hospital=h, full_name=f'Врач {h.id}', specialty='Терапевт') for h in hospitals
+        ])
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/admin/hospitals/')
+        self.assertEqual(len(res.json()), 500)
+        self.assertTrue(all(h['doctor_count'] == 1 for h in res.json()))
+
+
+class AppointmentReadPathTest(TestCase):
+    """Ответы с больницей и врачом читаются одним JOIN, без запросов на запись"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.hospital = make_hospital()
+        self.doctor = Doctor.objects.create(hospital=self.hospital, full_name='Ахметова Дана',
+                                            specialty='Терапевт', cabinet='12')
+
+    def test_my_appointments_in_one_query(self):
+        for i in range(50):
+            make_appointment(self.hospital, self.doctor if i % 2 else None, days=-i, user=self.user)
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/appointments/my_appointments/')
+        self.assertEqual(len(res.json()), 50)
+        self.assertEqual([a['doctor_cabinet'] for a in res.json()[:2]], ['12', None])
+        self.assertEqual(res.json()[1]['hospital_name'], self.hospital.name)
+
+    def test_my_appointments_history_is_paged(self):
+        codes = [make_appointment(self.hospital, user=self.user).code for _ in range(5)]
+        make_appointment(self.hospital)  # чужая запись
+        first = self.client.get('/api/appointments/my_appointments/', {'limit': 3}).json()
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/appointments/my_appointments/',
+                                     {'limit': 3, 'cursor': first['next']}).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual([a['code'] for a in first['results'] + second['results']], codes[::-1])
+
+    def test_check_and_update_comment(self):
+        appointment = make_appointment(self.hospital, self.doctor, user=self.user)
+        with self.assertNumQueries(1):
+            res = APIClient().get(f'/api/appointments/check/{appointment.code}/')
+        self.assertEqual(res.json()['doctor_name'], 'Ахметова Дана')
+
+        with self.assertNumQueries(2):  # SELECT с JOIN и UPDATE комментария
+            res = self.client.patch('/api/appointments/update_comment/',
+                                    {'code': appointment.code, 'comment': ' аллергия '}, format='json')
+        self.assertEqual(res.json()['comment'], 'аллергия')
+        self.assertEqual(res.json()['hospital_address'], self.hospital.address)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', 'other@example.com', 'x'))
+        res = other.patch('/api/appointments/update_comment/',
+                          {'code': appointment.code, 'comment': 'чужой'}, format='json')
+        self.assertEqual(res.status_code, 403)
+
+    def test_create_response_reuses_validated_objects(self):
+        payload = {'patient_name': 'Иван Иванов', 'hospital': self.hospital.id, 'doctor': self.doctor.id,
+                   'specialty': 'Терапевт', 'datetime': next_monday_at(10).isoformat()}
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post('/api/appointments/', payload, format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json()['doctor_cabinet'], '12')
+        # больница и врач читаются один раз — при валидации
+        lookups = [q['sql'] for q in queries
+                   if 'FROM "appointments_hospital" ' in q['sql'] or 'FROM "appointments_doctor" ' in q['sql']]
+        self.assertEqual(len(lookups), 2)
+
+
+class DoctorPortalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        self.user = User.objects.create_user('doctor', 'doctor@medqueue.kz', 'x', first_name='Дана')
+        DoctorInviteCode.objects.create(code='MEDQ-AAAAAA', hospital=self.hospital,
+                                        specialty='Терапевт', is_used=True, used_by=self.user)
+        self.doctor = Doctor.objects.create(hospital=self.hospital, user=self.user,
+                                            full_name='Ахметова Дана', specialty='Терапевт')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def appointments(self, **params):
+        res = self.client.get('/api/doctor/appointments/', params)
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(res.streaming)  # ошибка БД должна стать 500, а не обрезанным массивом
+        return res.json()
+
+    def test_appointments_in_one_query_after_context_is_cached(self):
+        patients = User.objects.bulk_create([User(username=f'p{i}', email=f'p{i}@example.com') for i in range(30)])
+        for i, patient in enumerate(patients):
+            make_appointment(self.hospital, self.doctor, days=i % 7, user=patient if i % 3 else None)
+        make_appointment(self.hospital)  # запись без врача — не его
+
+        rows = self.appointments(filter='all')  # контекст врача: один запрос, затем кэш
+        self.assertEqual(len(rows), 30)
+        with self.assertNumQueries(1):
+            rows = self.appointments(filter='all')
+        # сначала сегодняшние: №0 без аккаунта, затем №7
+        self.assertIsNone(rows[0]['user_email'])
+        self.assertEqual(rows[1]['user_email'], 'p7@example.com')
+
+    def test_context_is_loaded_with_one_query(self):
+        with self.assertNumQueries(2):  # контекст с JOIN и агрегат счётчиков
+            res = self.client.get('/api/doctor/me/')
+        self.assertEqual(res.json()['doctor_id'], self.doctor.id)
+        self.assertEqual(res.json()['hospital']['name'], self.hospital.name)
+
+    def test_cached_context_holds_no_model_instances(self):
+        from . import doctor_context
+        context = doctor_context.load(self.user)
+        self.assertEqual(context.hospital.name, self.hospital.name)
+        self.assertEqual(context.doctor.id, self.doctor.id)
+
+        def scalars(value):
+            if isinstance(value, tuple):
+                return all(scalars(item) for item in value)
+            return value is None or isinstance(value, (int, str))
+        # В общий кэш не попадают User с хэшем пароля и прочие экземпляры моделей
+        self.assertTrue(scalars(context), context)
+
+    def test_legacy_account_without_doctor_entry(self):
+        self.doctor.user = None
+        self.doctor.save()
+        cache.clear()
+        make_appointment(self.hospital, days=0.01, specialty='Терапевт')
+        make_appointment(self.hospital, days=0.01, specialty='Хирург')
+        self.assertEqual([a['specialty'] for a in self.appointments()], ['Терапевт'])
+        self.assertIsNone(self.client.get('/api/doctor/me/').json()['doctor_id'])
+
+    def test_update_only_own_appointments(self):
+        own = make_appointment(self.hospital, self.doctor)
+        other = Doctor.objects.create(hospital=self.hospital, full_name='Ким Алия', specialty='Хирург')
+        foreign = make_appointment(self.hospital, other)
+        url = '/api/doctor/appointments/{}/'
+        self.assertEqual(self.client.patch(url.format(own.id), {'status': 'completed'}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(url.format(foreign.id), {'status': 'completed'}, format='json').status_code, 404)
+
+    def test_patient_account_is_rejected(self):
+        patient = APIClient()
+        patient.force_authenticate(User.objects.create_user('patient', 'patient@example.com', 'x'))
+        self.assertEqual(patient.get('/api/doctor/me/').status_code, 403)
+
+
+class ScheduleParsingTest(SimpleTestCase):
+    def test_work_days(self):
+        self.assertEqual(parse_work_days('Пн–Пт'), [0, 1, 2, 3, 4])
+        self.assertEqual(parse_work_days('Вт-Сб'), [1, 2, 3, 4, 5])
+        self.assertEqual(parse_work_days('Пн-Ср-Пт'), [0, 2, 4])
+        self.assertEqual(parse_work_days('Пн — Чт, Сб'), [0, 1, 2, 3, 5])
+        self.assertEqual(parse_work_days('Ежедневно'), list(range(7)))
+        with self.assertRaises(ValueError):
+            parse_work_days('по записи')
+
+    def test_work_hours(self):
+        self.assertEqual(parse_work_hours('08:00–16:00'), (clock(8), clock(16)))
+        self.assertEqual(parse_work_hours('9.00 - 17.30'), (clock(9), clock(17, 30)))
+        self.assertEqual(parse_work_hours('10:00-24:00'), (clock(10), clock(0)))
+        with self.assertRaises(ValueError):
+            parse_work_hours('утро')
+
+
+class DoctorScheduleTest(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        self.doctor = Doctor.objects.create(hospital=self.hospital, full_name='Ахметова Дана',
+                                            specialty='Терапевт', work_days='Пн–Пт', work_hours='08:00–12:00')
+        self.monday = next_monday_at(0).date()
+
+    def free(self, day=None):
+        return availability([self.doctor.id], day or self.monday)[self.doctor.id][day or self.monday]
+
+    def test_schedule_follows_text_fields(self):
+        self.assertEqual(sorted(self.doctor.schedule.values_list('weekday', flat=True)), [0, 1, 2, 3, 4])
+        self.assertEqual(len(self.free().slots), 8)  # 08:00–12:00 по 30 минут
+
+        self.doctor.work_days = 'Сб'
+        self.doctor.save()
+        self.assertEqual(list(self.doctor.schedule.values_list('weekday', flat=True)), [5])
+        self.assertEqual(self.free().slots, [])
+
+    def test_booked_and_unknown_schedules(self):
+        make_appointment(self.hospital, self.doctor, datetime=next_monday_at(8, 30))
+        slots = [timezone.localtime(s).strftime('%H:%M') for s in self.free().slots]
+        self.assertEqual(slots[:3], ['08:00', '09:00', '09:30'])
+
+        legacy = Doctor.objects.create(hospital=self.hospital, full_name='Ким Алия',
+                                       specialty='Хирург', work_days='по записи')
+        self.assertIsNone(availability([legacy.id], self.monday)[legacy.id][self.monday].slots)
+
+    def test_slots_endpoint_reads_precomputed_bitmaps(self):
+        generate([self.doctor.id], self.monday, self.monday + timedelta(days=6))
+        with self.assertNumQueries(3):  # врач, маски дней, занятые записи
+            res = APIClient().get(f'/api/doctors/{self.doctor.id}/slots/',
+                                  {'date': self.monday.isoformat(), 'days': 7})
+        days = res.json()['days']
+        self.assertEqual(len(days), 7)
+        self.assertEqual(days[0]['slots'][:2], ['08:00', '08:30'])
+        self.assertEqual(days[5]['slots'], [])  # суббота
+        self.assertEqual(DoctorSlotDay.objects.filter(doctor=self.doctor).count(), 7)
+
+    def test_slots_endpoint_is_bounded_by_horizon(self):
+        url = f'/api/doctors/{self.doctor.id}/slots/'
+        today = timezone.localdate()
+        for date in ['9999-12-31', (today - timedelta(days=1)).isoformat(),
+                     (today + timedelta(days=settings.SCHEDULE_HORIZON_DAYS + 1)).isoformat()]:
+            self.assertEqual(APIClient().get(url, {'date': date}).status_code, 400, date)
+        self.assertFalse(DoctorSlotDay.objects.exists())
+
+        last = today + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+        res = APIClient().get(url, {'date': last.isoformat(), 'days': 7})
+        self.assertEqual([day['date'] for day in res.json()['days']], [last.isoformat()])
+
+    def test_manual_schedule_edit_resets_bitmaps(self):
+        self.free()
+        DoctorSchedule.objects.create(doctor=self.doctor, weekday=5, start=clock(10), end=clock(11))
+        self.assertFalse(DoctorSlotDay.objects.filter(doctor=self.doctor).exists())
+        saturday = self.monday + timedelta(days=5)
+        self.assertEqual(len(self.free(saturday).slots), 2)
+
+    def test_booking_must_match_a_working_slot(self):
+        payload = {'patient_name': 'Иван Иванов', 'hospital': self.hospital.id, 'doctor': self.doctor.id,
+                   'specialty': 'Терапевт'}
+
+        def book(when):
+            return APIClient().post('/api/appointments/', {**payload, 'datetime': when.isoformat()}, format='json')
+
+        self.assertEqual(book(next_monday_at(9, 10)).status_code, 400)  # не по сетке
+        self.assertEqual(book(next_monday_at(13)).status_code, 400)     # после приёма
+        self.assertEqual(book(next_monday_at(9, 30)).status_code, 201)
+
+    def test_rejected_far_booking_creates_no_slot_days(self):
+        payload = {'patient_name': 'Иван Иванов', 'hospital': self.hospital.id, 'doctor': self.doctor.id,
+                   'specialty': 'Терапевт'}
+        DoctorSlotDay.objects.all().delete()
+        for year in range(2100, 2105):
+            when = timezone.make_aware(datetime(year, 3, 1, 9))
+            res = APIClient().post('/api/appointments/', {**payload, 'datetime': when.isoformat()}, format='json')
+            self.assertEqual(res.status_code, 400)
+            self.assertIn('datetime', res.json())
+            res = APIClient().post('/api/appointments/hold/', {'doctor': self.doctor.id,
+                                                                'datetime': when.isoformat()}, format='json')
+            self.assertEqual(res.status_code, 400)
+        self.assertFalse(DoctorSlotDay.objects.exists())
+
+
+class SlotReservationTest(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        self.doctor = Doctor.objects.create(hospital=self.hospital, full_name='Ахметова Дана',
+                                            specialty='Терапевт', work_days='Пн–Пт', work_hours='08:00–12:00')
+        self.when = next_monday_at(9)
+        self.client = APIClient()
+        cache.clear()  # счётчики throttle
+
+    def book(self, **extra):
+        return self.client.post('/api/appointments/', {
+            'patient_name': 'Иван Иванов', 'hospital': self.hospital.id, 'doctor': self.doctor.id,
+            'specialty': 'Терапевт', 'datetime': self.when.isoformat(), **extra,
+        }, format='json')
+
+    def hold(self, when=None, client=None):
+        return (client or self.client).post('/api/appointments/hold/', {
+            'doctor': self.doctor.id, 'datetime': (when or self.when).isoformat(),
+        }, format='json')
+
+    def test_second_booking_of_a_slot_conflicts(self):
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(self.book().status_code, 409)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(QueueCounter.objects.get().last_position, 1)  # откат не сдвинул очередь
+
+    def test_hold_then_confirm(self):
+        res = self.hold()
+        self.assertEqual(res.status_code, 201)
+        token = res.json()['hold']
+        self.assertEqual(self.hold().status_code, 409)
+        self.assertEqual(self.book().status_code, 409)  # без брони слот занят
+
+        res = self.book(hold=token)
+        self.assertEqual(res.status_code, 201)
+        held = SlotHold.objects.get()
+        self.assertEqual(held.appointment.code, res.json()['code'])
+        self.assertIsNone(held.expires_at)
+        self.assertEqual(self.book(hold=token).status_code, 409)  # бронь уже использована
+
+    def test_expired_hold_is_taken_over(self):
+        token = self.hold().json()['hold']
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(self.book(hold=token).status_code, 409)
+
+    def test_released_hold_and_cancellation_free_the_slot(self):
+        token = self.hold().json()['hold']
+        res = self.client.delete('/api/appointments/hold/', {'hold': token}, format='json')
+        self.assertEqual(res.json(), {'released': True})
+
+        code = self.book().json()['code']
+        free = availability([self.doctor.id], self.when.date())[self.doctor.id][self.when.date()].slots
+        self.assertNotIn(self.when, free)
+        self.client.post('/api/appointments/cancel/', {'code': code}, format='json')
+        free = availability([self.doctor.id], self.when.date())[self.doctor.id][self.when.date()].slots
+        self.assertIn(self.when, free)
+        self.assertEqual(self.book().status_code, 201)
+
+    def test_doctor_cannot_restore_into_a_taken_slot(self):
+        user = User.objects.create_user('doctor', 'doctor@medqueue.kz', 'x')
+        DoctorInviteCode.objects.create(code='MEDQ-AAAAAA', hospital=self.hospital, is_used=True, used_by=user)
+        self.doctor.user = user
+        self.doctor.save()
+        cache.clear()
+        first = Appointment.objects.get(code=self.book().json()['code'])
+        self.client.post('/api/appointments/cancel/', {'code': first.code}, format='json')
+        self.assertEqual(self.book().status_code, 201)
+
+        doctor_client = APIClient()
+        doctor_client.force_authenticate(user)
+        res = doctor_client.patch(f'/api/doctor/appointments/{first.id}/', {'status': 'confirmed'}, format='json')
+        self.assertEqual(res.status_code, 409)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'cancelled')
+
+    def test_one_live_hold_per_client(self):
+        first = self.hold().json()['hold']
+        second = self.hold(next_monday_at(10)).json()['hold']
+        # Новая бронь того же клиента снимает старую — перебором все слоты не занять
+        self.assertEqual([str(token) for token in SlotHold.objects.values_list('token', flat=True)], [second])
+        self.assertEqual(self.book(hold=first).status_code, 409)
+
+        other = APIClient(REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(self.hold(client=other).status_code, 201)
+        self.assertEqual(SlotHold.objects.count(), 2)
+
+    def test_holds_are_throttled_per_ip(self):
+        from rest_framework.throttling import ScopedRateThrottle
+        # Лимит читается из настроек при импорте DRF — подменяем на классе
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'slot_hold': '3/min'}):
+            statuses = [self.hold(next_monday_at(9 + i % 3)).status_code for i in range(4)]
+            self.assertEqual(statuses, [201, 201, 201, 429])
+            self.assertEqual(self.hold(client=APIClient(REMOTE_ADDR='10.0.0.2')).status_code, 201)
+
+    def test_expired_holds_are_swept(self):
+        self.hold()
+        self.hold(client=APIClient(REMOTE_ADDR='10.0.0.2'), when=next_monday_at(10))
+        self.book(hold=self.hold(client=APIClient(REMOTE_ADDR='10.0.0.3'), when=next_monday_at(11)).json()['hold'])
+        SlotHold.objects.filter(slot=self.when).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(expiry.sweep()['slothold'], 1)
+        self.assertEqual(SlotHold.objects.count(), 2)  # живая бронь и занятое записью время остались
+
+    def test_hold_rejects_invalid_times(self):
+        res = self.client.post('/api/appointments/hold/', {'doctor': self.doctor.id,
+                                                           'datetime': next_monday_at(9, 10).isoformat()}, format='json')
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post('/api/appointments/hold/', {'doctor': 'x', 'datetime': 'завтра'}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+
+class ConcurrentSlotBookingTest(TransactionTestCase):
+    """Параллельные брони: один слот достаётся одному, разные слоты не мешают друг другу"""
+
+    def test_stress(self):
+        hospital = make_hospital()
+        doctor = Doctor.objects.create(hospital=hospital, full_name='Ахметова Дана', specialty='Терапевт',
+                                       work_days='Пн–Пт', work_hours='08:00–18:00')
+        contested = next_monday_at(9)
+
+        def book(i):
+            # половина потоков бьётся за 09:00, остальные берут разные слоты после обеда
+            when = contested if i % 2 else next_monday_at(13) + timedelta(minutes=10 * (i // 2))
+            try:
+                Appointment.objects.create(hospital=hospital, doctor=doctor, patient_name=f'Пациент {i}',
+                                           specialty='Терапевт', datetime=when)
+                return when
+            except SlotTaken:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(book, range(60)))
+
+        self.assertEqual(results.count(contested), 1)
+        self.assertEqual(results.count(None), 29)
+        self.assertEqual(Appointment.objects.filter(datetime=contested).count(), 1)
+        self.assertEqual(SlotHold.objects.filter(appointment__isnull=False).count(), 31)
+        self.assertFalse(SlotHold.objects.filter(appointment__isnull=True).exists())
+
+
+class NearbyHospitalsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Алматы: центр, ~3 км и ~20 км; больница без координат
+            self.center = make_hospital('Центр', latitude=43.238, longitude=76.945)
+            self.near = make_hospital('Рядом', latitude=43.260, longitude=76.960)
+            self.far = make_hospital('Далеко', latitude=43.400, longitude=77.050)
+            make_hospital('Без координат')
+            Doctor.objects.create(hospital=self.near, full_name='Ким Алия', specialty='Хирург')
+            Doctor.objects.create(hospital=self.far, full_name='Орлов Иван', specialty='Хирург')
+
+    def nearby(self, **params):
+        res = APIClient().get('/api/hospitals/nearby/', {'lat': 43.238, 'lng': 76.945, **params})
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    def test_nearest_first_within_radius(self):
+        rows = self.nearby()
+        self.assertEqual([h['name'] for h in rows], ['Центр', 'Рядом'])
+        self.assertEqual(rows[0]['distance_km'], 0)
+        self.assertEqual([h['name'] for h in self.nearby(radius=30)], ['Центр', 'Рядом', 'Далеко'])
+        self.assertEqual([h['name'] for h in self.nearby(radius=30, limit=1)], ['Центр'])
+
+    def test_specialty_and_queue(self):
+        make_appointment(self.far)
+        rows = self.nearby(radius=30, specialty='Хирург')
+        self.assertEqual([h['name'] for h in rows], ['Рядом', 'Далеко'])
+        self.assertEqual([h['current_queue'] for h in rows], [0, 1])
+
+    def test_index_follows_hospital_changes(self):
+        self.nearby()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.is_active = False
+            self.near.save()
+        with self.assertNumQueries(3):  # перестройка индекса (2) и очередь
+            self.assertEqual([h['name'] for h in self.nearby()], ['Центр'])
+        with self.assertNumQueries(1):
+            self.nearby()
+
+    def test_bad_parameters(self):
+        self.assertEqual(APIClient().get('/api/hospitals/nearby/', {'lat': 43}).status_code, 400)
+        self.assertEqual(APIClient().get('/api/hospitals/nearby/', {'lat': 'x', 'lng': 1}).status_code, 400)
+        self.assertEqual(APIClient().get('/api/hospitals/nearby/', {'lat': 91, 'lng': 1}).status_code, 400)
+
+    def test_grid_matches_brute_force(self):
+        rng = random.Random(1)
+        places = [geo.Place(i, rng.uniform(42.5, 44), rng.uniform(76, 78), frozenset()) for i in range(3000)]
+        index = geo.GridIndex(places, cell_deg=0.05)
+        for _ in range(50):
+            lat, lng = rng.uniform(42.5, 44), rng.uniform(76, 78)
+            expected = sorted((geo.haversine_km(lat, lng, p.lat, p.lng), p.id) for p in places)
+            expected = [pk for d, pk in expected if d <= 15][:7]
+            self.assertEqual([p.id for _, p in index.nearest(lat, lng, k=7, radius_km=15)], expected)
+
+
+class BulkLoadTest(TestCase):
+    """python manage.py bulk_load: сверка справочников и потоковая загрузка записей"""
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def fixture(self, name, content):
+        path = f'{self.tmp.name}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(content, ensure_ascii=False) if name.endswith('.json') else content)
+        return path
+
+    def load(self, *paths):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('bulk_load', *paths, '--batch', '2', stdout=out)
+        return out.getvalue()
+
+    def test_directory_is_diffed_in_memory(self):
+        path = self.fixture('seed.json', {
+            'hospitals': [{'name': 'ГП №1', 'type': 'Поликлиника', 'address': 'ул. Абая, 1', 'latitude': 43.2},
+                          {'name': 'ГП №2', 'type': 'Поликлиника', 'address': 'ул. Абая, 2'}],
+            'doctors': [{'hospital': 'ГП №1', 'full_name': 'Ким Алия', 'specialty': 'Хирург',
+                         'work_days': 'Пн–Пт', 'work_hours': '08:00–12:00'},
+                        {'hospital': 'ГП №2', 'full_name': 'Ким Алия', 'specialty': 'Хирург'}],
+        })
+        out = self.load(path)
+        self.assertIn('hospitals: новых 2', out)
+        self.assertIn('doctors: новых 2', out)
+        self.assertEqual(Hospital.objects.get(name='ГП №1').latitude, 43.2)
+
+        with self.assertNumQueries(3):  # больницы, их названия для врачей, врачи; ничего не пишется
+            out = self.load(path)
+        self.assertIn('hospitals: новых 0, изменено 0, без изменений 2', out)
+        self.assertIn('doctors: новых 0, изменено 0, без изменений 2', out)
+
+        # В CSV нет latitude — у существующей больницы координаты остаются
+        out = self.load(self.fixture('hospitals.csv', 'name,type,address\nГП №1,Поликлиника,"ул. Абая, 10"\n'))
+        self.assertIn('изменено 1', out)
+        hospital = Hospital.objects.get(name='ГП №1')
+        self.assertEqual((hospital.address, hospital.latitude), ('ул. Абая, 10', 43.2))
+
+    def test_changed_hours_reset_schedule(self):
+        hospital = make_hospital('ГП №1')
+        doctor = Doctor.objects.create(hospital=hospital, full_name='Ким Алия', specialty='Хирург',
+                                       work_days='Пн–Пт', work_hours='08:00–12:00')
+        self.assertEqual(DoctorSchedule.objects.filter(doctor=doctor).count(), 5)
+        generate([doctor.pk], timezone.localdate(), timezone.localdate())
+
+        self.load(self.fixture('doctors.csv',
+                               'hospital,full_name,specialty,work_hours\nГП №1,Ким Алия,Хирург,14:00-16:00\n'))
+        self.assertFalse(DoctorSchedule.objects.filter(doctor=doctor).exists())
+        self.assertFalse(DoctorSlotDay.objects.filter(doctor=doctor).exists())
+        monday = next_monday_at(0).date()
+        slots = availability([doctor.pk], monday)[doctor.pk][monday].slots
+        self.assertEqual([timezone.localtime(s).hour for s in slots], [14, 14, 15, 15])
+
+    def test_appointments_keep_queue_slots_and_stats(self):
+        hospital = make_hospital('ГП №1')
+        doctor = Doctor.objects.create(hospital=hospital, full_name='Ким Алия', specialty='Хирург')
+        nine = next_monday_at(9)
+        first = make_appointment(hospital, doctor, datetime=nine)
+        self.assertEqual(first.queue_position, 1)
+
+        day = timezone.localtime(nine).strftime('%Y-%m-%d')
+        path = self.fixture('appointments.csv', '\n'.join([
+            'hospital,doctor,specialty,patient_name,datetime,status,code',
+            f'ГП №1,Ким Алия,Хирург,Пациент 1,{day} 09:30,confirmed,',
+            f'ГП №1,Ким Алия,Хирург,Пациент 2,{day} 09:30,confirmed,',  # тот же слот
+            f'ГП №1,,Терапевт,Пациент 3,{day} 10:00,cancelled,',
+            f'ГП №1,,Терапевт,Пациент 4,{day} 11:00,confirmed,{first.code}',  # уже есть
+        ]) + '\n')
+        out = self.load(path)
+        self.assertIn('appointments: новых 3, изменено 0, без изменений 1', out)
+
+        loaded = Appointment.objects.exclude(pk=first.pk).order_by('queue_position')
+        self.assertEqual([a.queue_position for a in loaded], [2, 3, 4])
+        self.assertEqual(len({a.code for a in loaded} | {first.code}), 4)
+        self.assertTrue(all(len(a.code) == 6 for a in loaded))
+        # Слот 9:30 занимает первая из двух записей, 9:00 — запись из ORM
+        self.assertEqual(SlotHold.objects.filter(doctor=doctor).count(), 2)
+        self.assertEqual(SlotHold.objects.get(slot=nine + timedelta(minutes=30)).appointment.patient_name,
+                         'Пациент 1')
+
+        stats = set(AppointmentStat.objects.values_list('day', 'hospital_id', 'specialty', 'status', 'count'))
+        AppointmentStat.rebuild()
+        self.assertEqual(stats, set(AppointmentStat.objects.values_list(
+            'day', 'hospital_id', 'specialty', 'status', 'count')))
+
+        # Счётчик очереди продолжает загруженные места
+        self.assertEqual(make_appointment(hospital, datetime=nine + timedelta(hours=3)).queue_position, 5)
+
+    def test_live_booking_between_batches_keeps_its_place(self):
+        from .seeding import load_appointments
+        hospital = make_hospital('ГП №1')
+        nine = next_monday_at(9)
+
+        def rows():
+            for i in range(4):
+                if i == 2:  # пока загрузка идёт, пациент записывается через сайт
+                    live.append(make_appointment(hospital, datetime=nine + timedelta(hours=2)))
+                yield {'hospital_id': hospital.pk, 'specialty': 'Терапевт', 'patient_name': f'Пациент {i}',
+                       'datetime': (nine + timedelta(minutes=10 * i)).isoformat()}
+
+        live = []
+        self.assertEqual(load_appointments(rows(), batch_size=2).created, 4)
+        positions = sorted(Appointment.objects.values_list('queue_position', flat=True))
+        self.assertEqual(positions, [1, 2, 3, 4, 5])
+        self.assertEqual(live[0].queue_position, 3)
+        self.assertEqual(QueueCounter.objects.get(hospital=hospital).last_position, 5)
+
+    def test_bad_row_is_reported_with_its_number(self):
+        from django.core.management.base import CommandError
+        make_hospital('ГП №1')
+        path = self.fixture('doctors.csv', 'hospital,full_name,specialty\n'
+                                           'ГП №1,Ким Алия,Хирург\nГП №9,Орлов Иван,Хирург\n')
+        with self.assertRaisesMessage(CommandError, "doctors, строка 2: нет больницы 'ГП №9'"):
+            self.load(path)
+        with self.assertRaisesMessage(CommandError, 'имя файла должно начинаться'):
+            self.load(self.fixture('staff.csv', 'hospital\n'))
+
+
+class ApiBenchmarkTest(TransactionTestCase):
+    """Генератор данных и прогон сценариев bench_api на крошечном масштабе"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_generated_data_drives_every_scenario(self):
+        from .benchmark import data, runner
+        data.generate(data.SCALES['tiny'], seed=1)
+        self.assertEqual(Hospital.objects.count(), 3)
+        self.assertEqual(Doctor.objects.filter(user__doctor_invite__isnull=False).count(), 12)
+        self.assertEqual(Appointment.objects.count(), 200)
+        self.assertTrue(Appointment.objects.filter(user__profile__role='patient').exists())
+
+        workload = runner.Workload.load(seed=1)
+        results = runner.run(workload, requests=6, concurrency=2, warmup=1, seed=1)
+        self.assertEqual(list(results), list(runner.SCENARIOS))
+        for name, report in results.items():
+            self.assertEqual(report['requests'], 6, name)
+            self.assertEqual(report['errors'], 0, (name, report['status']))
+            self.assertGreater(report['throughput_rps'], 0)
+            self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['p99'])
+        self.assertEqual(results['appointment_check']['queries']['mean'], 1)
+        self.assertEqual(results['appointment_cancel']['status'], {'200': 6})
+
+    def test_compare_flags_regressions_past_threshold(self):
+        from .benchmark.runner import compare, percentile
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([7], 99), 7)
+
+        def report(p95, queries, rps):
+            return {'scenarios': {'check': {
+                'latency_ms': {'p50': 1.0, 'p95': p95, 'p99': p95}, 'queries': {'mean': queries},
+                'throughput_rps': rps,
+            }}}
+
+        changes = {c.metric: c for c in compare(report(10.0, 1, 100.0), report(12.0, 1, 85.0), threshold=10)}
+        self.assertTrue(changes['latency_ms.p95'].worse)
+        self.assertAlmostEqual(changes['latency_ms.p95'].percent, 20.0)
+        self.assertTrue(changes['throughput_rps'].worse)
+        self.assertFalse(changes['queries.mean'].worse)
+        self.assertFalse(changes['latency_ms.p50'].worse)
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_ACTION='raise', QUERY_BUDGETS={})
+class QueryBudgetTest(TestCase):
+    """Счётчик SQL-запросов на ответ и бюджеты view"""
+
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        self.appointment = make_appointment(self.hospital)
+        self.client = APIClient()
+
+    def check(self):
+        return self.client.get(f'/api/appointments/check/{self.appointment.code}/')
+
+    def test_response_reports_queries_and_logs_them(self):
+        with self.assertLogs('appointments.querybudget', 'INFO') as logs:
+            res = self.check()
+        self.assertEqual(res['X-DB-Queries'], '1')
+        self.assertTrue(res['Server-Timing'].startswith('db;dur='))
+        record = logs.records[0]
+        self.assertEqual(record.query_budget['view'], 'AppointmentViewSet.check_status')
+        self.assertEqual(record.query_budget['budget'], 2)
+        self.assertIn('appointments_appointment', record.query_budget['slowest'][0]['sql'])
+
+    async def test_async_handler_counts_sync_views(self):
+        from django.test import AsyncClient
+        res = await AsyncClient().get(f'/api/appointments/check/{self.appointment.code}/')
+        self.assertEqual(res['X-DB-Queries'], '1')
+
+    @override_settings(AI_PROVIDERS=[])
+    def test_streaming_response_is_counted_to_the_end(self):
+        with self.assertLogs('appointments.querybudget', 'INFO') as logs:
+            res = self.client.post('/api/ai/chat/', {'message': 'Привет', 'stream': True}, format='json')
+            self.assertEqual(logs.records, [])  # поток ещё не прочитан
+            b''.join(res.streaming_content)
+        self.assertEqual(logs.records[0].query_budget['view'], 'ai_chat')
+        self.assertEqual(logs.records[0].query_budget['queries'], 0)
+
+    def test_exceeded_budget_raises_or_warns(self):
+        with self.settings(QUERY_BUDGETS={'AppointmentViewSet.check_status': 0}):
+            with self.assertRaisesMessage(querybudget.QueryBudgetExceeded,
+                                          'GET AppointmentViewSet.check_status: 1 SQL-запросов при бюджете 0'):
+                self.check()
+            with self.settings(QUERY_BUDGET_ACTION='warn'), \
+                    self.assertLogs('appointments.querybudget', 'WARNING') as logs:
+                self.assertEqual(self.check().status_code, 200)
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_hot_endpoints_fit_their_budgets(self):
+        doctor = Doctor.objects.create(hospital=self.hospital, full_name='Ким Алия', specialty='Хирург')
+        for _ in range(2):  # второй раз — из кэша и с готовой сеткой слотов
+            self.assertEqual(self.client.get('/api/hospitals/').status_code, 200)
+        for hour in (9, 10):
+            res = self.client.post('/api/appointments/', {
+                'patient_name': 'Пациент', 'hospital': self.hospital.id, 'specialty': 'Хирург',
+                'doctor': doctor.id, 'datetime': next_monday_at(hour).isoformat(),
+            }, format='json')
+            self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.client.post('/api/appointments/cancel/', {'code': res.json()['code']},
+                                          format='json').status_code, 200)
+
+    def test_max_queries_helper(self):
+        with querybudget.max_queries(1) as recorder:
+            Hospital.objects.count()
+        self.assertEqual(recorder.count, 1)
+        with self.assertRaisesMessage(querybudget.QueryBudgetExceeded, 'Блок: 2 SQL-запросов при бюджете 1'):
+            with querybudget.max_queries(1):
+                Hospital.objects.count()
+                Appointment.objects.count()
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_disabled_middleware_is_not_in_the_chain(self):
+        self.assertNotIn('X-DB-Queries', self.check())
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_exposition_format(self):
+        registry = metrics.Registry()
+        hits = registry.counter('test_hits_total', 'Попадания', ['path'])
+        latency = registry.histogram('test_seconds', 'Время', buckets=(0.1, 1))
+        hits.inc(path='/a"b')
+        hits.inc(2, path='/a"b')
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value)
+        self.assertEqual(registry.expose().splitlines(), [
+            '# HELP test_hits_total Попадания',
+            '# TYPE test_hits_total counter',
+            'test_hits_total{path="/a\\"b"} 3',
+            '# HELP test_seconds Время',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 2',
+            'test_seconds_bucket{le="1"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 3.65',
+            'test_seconds_count 4',
+        ])
+        with self.assertRaises(ValueError):
+            hits.inc(route='/a')
+
+    def test_threads_write_their_own_shards_and_retire_them(self):
+        import gc
+        counter = metrics.Counter('test_total', 'Тест', ['kind'])
+        histogram = metrics.Histogram('test_seconds', 'Тест', buckets=(1,))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(kind='a')
+                histogram.observe(0.5)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del threads
+        gc.collect()
+        self.assertEqual(counter.collect(), {('a',): 8000})
+        self.assertEqual(histogram.collect()[()][-1], 8000)
+        self.assertEqual(counter._live, {})  # шарды завершившихся потоков слиты в итог
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def sample(self, line_prefix):
+        for line in self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode().splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_booking_and_cancel_are_counted(self):
+        hospital = make_hospital()
+        created = self.sample('medqueue_bookings_total{outcome="created"}')
+        cancelled = self.sample('medqueue_cancellations_total{by="patient"}')
+
+        res = self.client.post('/api/appointments/', {
+            'patient_name': 'Пациент', 'hospital': hospital.id, 'specialty': 'Терапевт',
+            'datetime': (timezone.now() + timedelta(minutes=1)).isoformat(),  # сегодня — в очереди
+        }, format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.sample('medqueue_bookings_total{outcome="created"}'), created + 1)
+        self.assertEqual(self.sample(f'medqueue_queue_depth{{hospital="{hospital.id}"}}'), 1)
+
+        self.client.post('/api/appointments/cancel/', {'code': res.json()['code']}, format='json')
+        self.assertEqual(self.sample('medqueue_cancellations_total{by="patient"}'), cancelled + 1)
+        self.assertEqual(self.sample(f'medqueue_queue_depth{{hospital="{hospital.id}"}}'), 0)
+
+    def test_smtp_and_recaptcha_are_timed(self):
+        sent = self.sample('medqueue_emails_total{outcome="sent"}')
+        sends = self.sample('medqueue_smtp_seconds_count{operation="send",outcome="ok"}')
+        with self.captureOnCommitCallbacks():
+            mailer.enqueue('user@example.com', 'Код', '123456', from_email='noreply@medqueue.kz')
+        mailer.dispatch_all()
+        self.assertEqual(self.sample('medqueue_emails_total{outcome="sent"}'), sent + 1)
+        self.assertEqual(self.sample('medqueue_smtp_seconds_count{operation="send",outcome="ok"}'), sends + 1)
+
+        unavailable = self.sample('medqueue_recaptcha_checks_total{outcome="unavailable"}')
+        verifier = RecaptchaVerifier(url='http://127.0.0.1:9/', timeout=0.2, replay_ttl=0)
+        self.assertFalse(verifier.verify('token'))
+        self.assertEqual(self.sample('medqueue_recaptcha_checks_total{outcome="unavailable"}'), unavailable + 1)
+
+    def test_content_type_and_token(self):
+        res = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('# TYPE medqueue_smtp_seconds histogram', res.content.decode())
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_only_in_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class CodeExpiryTest(TestCase):
+    def make_codes(self, model, alive, expired, **kwargs):
+        for i in range(alive):
+            model.objects.create(email=f'alive{i}@example.com', code='111111', **kwargs)
+        for i in range(expired):
+            model.objects.create(email=f'old{i}@example.com', code='222222',
+                                 expires_at=timezone.now() - model.RETAIN_EXPIRED - timedelta(seconds=1),
+                                 **kwargs)
+
+    def test_expiry_is_set_on_insert(self):
+        code = PasswordResetCode.objects.create(email='a@example.com', code='123456')
+        self.assertAlmostEqual(code.expires_at - code.created_at, PasswordResetCode.TTL,
+                               delta=timedelta(seconds=1))
+        self.assertFalse(code.is_expired())
+
+    def test_expired_code_is_not_returned(self):
+        self.make_codes(VerificationCode, 0, 1, name='Айгерим', password='secret123')
+        self.assertFalse(VerificationCode.objects.alive().exists())
+        res = APIClient().post('/api/auth/verify/', {'email': 'old0@example.com', 'code': '222222'},
+                               format='json')
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(User.objects.exists())
+
+        User.objects.create_user('user', 'old0@example.com', 'old-password')
+        self.make_codes(PasswordResetCode, 0, 1)
+        res = APIClient().post('/api/auth/password-reset/confirm/', {
+            'email': 'old0@example.com', 'code': '222222', 'new_password': 'new-password',
+        }, format='json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_sweep_deletes_only_expired_in_batches(self):
+        self.make_codes(VerificationCode, 2, 5, name='Иван', password='secret123')
+        self.make_codes(PasswordResetCode, 1, 3)
+        with CaptureQueriesContext(connection) as queries:
+            deleted = expiry.sweep(batch_size=2)
+        self.assertEqual(deleted, {'verificationcode': 5, 'passwordresetcode': 3, 'slothold': 0,
+                                   'outboundemail': 0})
+        self.assertEqual(VerificationCode.objects.count(), 2)
+        self.assertEqual(PasswordResetCode.objects.count(), 1)
+        self.assertFalse(VerificationCode.objects.expired().exists())
+        # Каждая пачка — отдельный короткий DELETE по id
+        deletes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3 + 2)
+
+    @override_settings(EMAIL_OUTBOX_WORKER='command', EMAIL_HOST_USER='noreply@medqueue.test',
+                       CODE_SWEEPER='command')
+    def test_registration_outlives_code_for_resend(self):
+        VerificationCode.objects.create(email='late@example.com', code='333333', name='Айгерим',
+                                        password='secret123', username='aigerim',
+                                        expires_at=timezone.now() - timedelta(minutes=30))
+        # Код истёк, но заявку фоновая очистка ещё не трогает
+        self.assertFalse(VerificationCode.objects.alive().exists())
+        self.assertEqual(expiry.sweep()['verificationcode'], 0)
+
+        res = APIClient().post('/api/auth/resend/', {'email': 'late@example.com'}, format='json')
+        self.assertEqual(res.status_code, 200)
+        verification = VerificationCode.objects.alive().get(email='late@example.com')
+        self.assertEqual((verification.name, verification.username), ('Айгерим', 'aigerim'))
+        self.assertNotEqual(verification.code, '333333')
+
+        # Устаревшую заявку повторно не отправляют
+        VerificationCode.objects.update(expires_at=timezone.now() - VerificationCode.RETAIN_EXPIRED)
+        res = APIClient().post('/api/auth/resend/', {'email': 'late@example.com'}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.make_codes(PasswordResetCode, 1, 2)
+        out = StringIO()
+        call_command('sweep_codes', '--batch', '1', stdout=out)
+        self.assertIn('passwordresetcode: 2', out.getvalue())
+        self.assertEqual(PasswordResetCode.objects.count(), 1)
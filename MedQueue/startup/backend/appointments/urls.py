@@ -2,12 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
-    HospitalViewSet, AppointmentViewSet,
+    HospitalViewSet, AppointmentViewSet, doctor_slots,
     doctor_me, doctor_appointments, doctor_update_appointment,
-    admin_stats, admin_hospitals, admin_doctors, admin_doctor_detail,
+    admin_stats, admin_stats_history, admin_hospitals, admin_doctors, admin_doctor_detail,
     admin_invite_codes, admin_invite_code_detail, admin_users,
 )
-from . import auth_views
+from . import auth_views, event_views
 
 router = DefaultRouter()
 router.register(r'hospitals', HospitalViewSet, basename='hospital')
@@ -24,12 +24,19 @@ urlpatterns = [
     path('auth/password-reset/confirm/', auth_views.password_reset_confirm),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('ai/chat/', auth_views.ai_chat),
+    # Живые обновления очереди (SSE)
+    path('events/appointments/<str:code>/', event_views.appointment_events),
+    path('events/hospitals/<int:hospital_id>/', event_views.hospital_events),
+    path('events/doctors/<int:doctor_id>/', event_views.doctor_events),
+    # Свободные слоты врача
+    path('doctors/<int:doctor_id>/slots/', doctor_slots),
     # Doctor portal
     path('doctor/me/', doctor_me),
     path('doctor/appointments/', doctor_appointments),
     path('doctor/appointments/<int:appointment_id>/', doctor_update_appointment),
     # Admin panel
     path('admin/stats/', admin_stats),
+    path('admin/stats/history/', admin_stats_history),
     path('admin/hospitals/', admin_hospitals),
     path('admin/doctors/', admin_doctors),
     path('admin/doctors/<int:doctor_id>/', admin_doctor_detail),
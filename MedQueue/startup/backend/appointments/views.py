@@ -1,12 +1,26 @@
+import datetime as dt
+import uuid
 from collections import defaultdict
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.throttling import ScopedRateThrottle
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.models import User
-from .models import Hospital, Appointment, Doctor, DoctorInviteCode, UserProfile, SPECIALTIES_CHOICES
+from . import doctor_context, expiry, geo, metrics, schedule, stats
+from .caching import cached_response
+from .pagination import paginate
+from .querybudget import query_budget
+from .models import (
+    Hospital, Appointment, Doctor, DoctorInviteCode, UserProfile, QueueCounter, SPECIALTIES_CHOICES,
+    SlotHold, SlotTaken, day_bounds,
+)
 from .serializers import (
     HospitalSerializer,
     HospitalDetailSerializer,
@@ -15,6 +29,9 @@ from .serializers import (
     DoctorSerializer,
 )
 
+MAX_NEARBY_RADIUS_KM = 100
+MAX_NEARBY_LIMIT     = 50
+
 
 class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -23,13 +40,22 @@ class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
     GET /api/hospitals/        — список всех активных больниц (без пагинации)
     GET /api/hospitals/{id}/   — детальная карточка больницы
     GET /api/hospitals/{id}/doctors/ — врачи больницы, сгруппированные по специальностям
+    GET /api/hospitals/nearby/ — ближайшие больницы к точке (см. geo.py)
+
+    Ответы кэшируются и отдаются с ETag (см. caching.py).
     """
     permission_classes = [AllowAny]
     pagination_class = None  # возвращаем полный список без пагинации
 
     def get_queryset(self):
-        """Возвращаем только активные больницы"""
-        return Hospital.objects.filter(is_active=True)
+        """Возвращаем только активные больницы (очередь считается одним запросом)"""
+        qs = Hospital.objects.filter(is_active=True).with_queue_counts()
+        if self.action == 'retrieve':
+            # Врачи карточки подгружаются одним запросом вместе с их очередями
+            qs = qs.prefetch_related(
+                Prefetch('doctors', queryset=Doctor.objects.with_queue_counts())
+            )
+        return qs
 
     def get_serializer_class(self):
         """Для детального запроса используем расширенный сериализатор"""
@@ -37,7 +63,17 @@ class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
             return HospitalDetailSerializer
         return HospitalSerializer
 
+    @query_budget(3)
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['get'], url_path='doctors')
+    @cached_response
     def doctors(self, request, pk=None):
         """
         Врачи больницы, сгруппированные по специальностям.
@@ -46,15 +82,16 @@ class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
         Ответ: [{specialty: "Терапевт", doctors: [{id, full_name, cabinet, ...}]}]
         """
         hospital = get_object_or_404(Hospital, pk=pk, is_active=True)
-        # Выбираем только активных врачей данной больницы
+        # Выбираем только активных врачей данной больницы; очередь к каждому
+        # считается в том же запросе, а не отдельным COUNT на врача
         doctors_qs = Doctor.objects.filter(
             hospital=hospital, is_active=True
-        ).order_by('specialty', 'full_name')
+        ).with_queue_counts().order_by('specialty', 'full_name')
 
         # Группируем по специальности
         grouped = defaultdict(list)
-        for doc in doctors_qs:
-            grouped[doc.specialty].append(DoctorSerializer(doc).data)
+        for doc in DoctorSerializer(doctors_qs, many=True).data:
+            grouped[doc['specialty']].append(doc)
 
         result = [
             {'specialty': spec, 'doctors': docs}
@@ -62,6 +99,48 @@ class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
         ]
         return Response(result)
 
+    @action(detail=False, methods=['get'], url_path='nearby')
+    def nearby(self, request):
+        """
+        Ближайшие активные больницы с врачами нужной специальности.
+
+        GET /api/hospitals/nearby/?lat=43.24&lng=76.91&radius=10&specialty=Терапевт&limit=10
+        radius — км (до 100), limit — до 50.
+        Ответ: [{id, name, type, address, latitude, longitude, distance_km, current_queue}]
+        """
+        params = request.query_params
+        try:
+            lat, lng = float(params['lat']), float(params['lng'])
+            radius = float(params.get('radius', 10))
+            limit = int(params.get('limit', 10))
+        except (KeyError, ValueError):
+            return Response({'error': 'Укажите lat и lng числами; radius и limit — числа'}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response({'error': 'Координаты вне диапазона'}, status=400)
+        radius = max(0.1, min(radius, MAX_NEARBY_RADIUS_KM))
+        limit = max(1, min(limit, MAX_NEARBY_LIMIT))
+
+        found = geo.get_index().nearest(lat, lng, k=limit, radius_km=radius,
+                                        specialty=params.get('specialty') or None)
+        # Очередь найденных больниц — одним GROUP BY
+        hospitals = Hospital.objects.filter(id__in=[place.id for _, place in found]).with_queue_counts().in_bulk()
+        data = []
+        for distance, place in found:
+            hospital = hospitals.get(place.id)
+            if hospital is None:
+                continue  # удалена после построения индекса
+            data.append({
+                'id': hospital.id,
+                'name': hospital.name,
+                'type': hospital.type,
+                'address': hospital.address,
+                'latitude': hospital.latitude,
+                'longitude': hospital.longitude,
+                'distance_km': round(distance, 2),
+                'current_queue': hospital.current_queue,
+            })
+        return Response(data)
+
 
 class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     """
@@ -76,6 +155,7 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = AppointmentStatusSerializer
     # Создание, проверка и отмена — публичные; my_appointments переопределяет
     permission_classes = [AllowAny]
+    throttle_scope = None  # ScopedRateThrottle: задаётся у action (hold_slot)
 
     def get_serializer_class(self):
         """Выбираем сериализатор в зависимости от действия"""
@@ -83,6 +163,7 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
             return AppointmentCreateSerializer
         return AppointmentStatusSerializer
 
+    @query_budget(32)  # обычно 14–19; первая запись дня создаёт счётчики и сетку слотов
     def create(self, request):
         """
         Создать новую запись (доступно гостям и авторизованным пользователям).
@@ -93,20 +174,32 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
             "hospital": 1,
             "specialty": "Терапевт",
             "datetime": "2025-01-27T10:00:00",
-            "doctor": 3  // необязательно
+            "doctor": 3,  // необязательно
+            "hold": "<token>"  // необязательно, из POST /api/appointments/hold/
         }
+        Занятое время врача — 409.
         """
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        # Привязываем к пользователю только если он авторизован
-        user = request.user if request.user.is_authenticated else None
-        appointment = serializer.save(user=user)
-
-        # Возвращаем полную информацию о созданной записи
+        with metrics.booking_seconds.time():
+            serializer = self.get_serializer(data=request.data)
+            if not serializer.is_valid():
+                metrics.bookings.inc(outcome='invalid')
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            # Привязываем к пользователю только если он авторизован
+            user = request.user if request.user.is_authenticated else None
+            try:
+                appointment = serializer.save(user=user)
+            except SlotTaken as e:
+                metrics.bookings.inc(outcome='slot_taken')
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        metrics.bookings.inc(outcome='created')
+
+        # Возвращаем полную информацию о созданной записи: больница и врач
+        # уже загружены при валидации, повторных запросов нет
         response_serializer = AppointmentStatusSerializer(appointment)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
+    @query_budget(2)
     @action(detail=False, methods=['get'], url_path='check/(?P<code>[A-Z0-9]{6})',
             permission_classes=[AllowAny])
     def check_status(self, request, code=None):
@@ -115,10 +208,66 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
 
         GET /api/appointments/check/{CODE}/
         """
-        appointment = get_object_or_404(Appointment, code=code.upper())
+        appointment = get_object_or_404(Appointment.objects.for_status(), code=code.upper())
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post', 'delete'], url_path='hold',
+            permission_classes=[AllowAny], throttle_classes=[ScopedRateThrottle], throttle_scope='slot_hold')
+    def hold_slot(self, request):
+        """
+        Временная бронь времени врача, пока пациент заполняет форму.
+
+        POST   /api/appointments/hold/  Body: {"doctor": 3, "datetime": "..."}
+               → {"hold": "<token>", "expires_at": "..."}; занято — 409
+        DELETE /api/appointments/hold/  Body: {"hold": "<token>"} — снять бронь
+
+        Частота ограничена (DEFAULT_THROTTLE_RATES['slot_hold'] на пользователя
+        или IP), у клиента не больше SLOT_HOLDS_PER_CLIENT действующих броней —
+        новая снимает его старые, так что занять все слоты перебором нельзя.
+        """
+        if request.method == 'DELETE':
+            try:
+                released = SlotHold.release(uuid.UUID(str(request.data.get('hold', ''))))
+            except ValueError:
+                return Response({'error': 'Некорректная бронь'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'released': bool(released)})
+
+        try:
+            doctor_id = int(request.data.get('doctor'))
+        except (TypeError, ValueError):
+            return Response({'doctor': 'Укажите врача'}, status=status.HTTP_400_BAD_REQUEST)
+        doctor = get_object_or_404(Doctor.objects.only('id'), pk=doctor_id, is_active=True)
+        try:
+            when = parse_datetime(str(request.data.get('datetime', '')))
+        except ValueError:
+            when = None
+        if when is None:
+            return Response({'datetime': 'Укажите время в формате ISO 8601'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        if when < timezone.now():
+            return Response({'datetime': 'Нельзя записаться на прошедшее время'}, status=status.HTTP_400_BAD_REQUEST)
+        error = schedule.slot_error(doctor.id, when)
+        if error:
+            return Response({'datetime': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        seconds = getattr(settings, 'SLOT_HOLD_SECONDS', 300)
+        try:
+            hold = SlotHold.hold(doctor.id, when, seconds=seconds, client=self._hold_client(request),
+                                 limit=getattr(settings, 'SLOT_HOLDS_PER_CLIENT', 1))
+        except SlotTaken as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        expiry.start_sweeper()  # просроченные брони удаляет фоновая очистка
+        return Response({'hold': str(hold.token), 'expires_at': hold.expires_at}, status=status.HTTP_201_CREATED)
+
+    def _hold_client(self, request):
+        """Ключ клиента для лимита броней: пользователь, а для гостя — IP (как у throttle)"""
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_throttles()[0].get_ident(request)}'[:64]
+
+    @query_budget(16)  # с пересчётом мест оставшихся в очереди
     @action(detail=False, methods=['post'], url_path='cancel',
             permission_classes=[AllowAny])
     def cancel_appointment(self, request):
@@ -144,19 +293,12 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        appointment.status = 'cancelled'
-        appointment.save()
-
-        # Пересчитываем позиции оставшихся в очереди на тот же день
-        same_day = Appointment.objects.filter(
-            hospital=appointment.hospital,
-            datetime__date=appointment.datetime.date(),
-            status='confirmed'
-        ).order_by('datetime')
-        for i, appt in enumerate(same_day, start=1):
-            if appt.queue_position != i:
-                appt.queue_position = i
-                appt.save(update_fields=['queue_position'])
+        with transaction.atomic():
+            appointment.status = 'cancelled'
+            appointment.save(update_fields=['status', 'updated_at'])
+            # Пересчитываем позиции оставшихся в очереди на тот же день
+            QueueCounter.renumber(appointment.hospital_id, appointment.queue_day)
+        metrics.cancellations.inc(by='patient')
 
         return Response({
             'message': 'Запись успешно отменена',
@@ -181,11 +323,11 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        appointment = get_object_or_404(Appointment, code=code)
+        appointment = get_object_or_404(Appointment.objects.for_status(), code=code)
 
         # Проверяем права: авторизованный пользователь может менять только свои записи
         if request.user.is_authenticated:
-            if appointment.user and appointment.user != request.user:
+            if appointment.user_id and appointment.user_id != request.user.id:
                 return Response(
                     {'error': 'Нет доступа'},
                     status=status.HTTP_403_FORBIDDEN
@@ -202,38 +344,96 @@ class AppointmentViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         """
         Записи текущего авторизованного пользователя.
 
-        GET /api/appointments/my_appointments/
+        GET /api/appointments/my_appointments/[?limit=20&cursor=...]
         Требует: Authorization: Bearer <access_token>
+
+        Без limit/cursor — весь список (профиль считает по нему итоги),
+        с ними — страница истории {results, next} по индексу appt_user_created.
         """
-        appointments = Appointment.objects.filter(
-            user=request.user
-        ).order_by('-created_at')
-        serializer = AppointmentStatusSerializer(appointments, many=True)
+        appointments = Appointment.objects.filter(user=request.user).for_status()
+        ordering = ('-created_at', '-id')
+        if 'limit' in request.query_params or 'cursor' in request.query_params:
+            return paginate(request, appointments, ordering,
+                            lambda a: AppointmentStatusSerializer(a).data,
+                            AppointmentStatusSerializer.Meta.fields)
+        serializer = AppointmentStatusSerializer(appointments.order_by(*ordering), many=True)
         return Response(serializer.data)
 
 
+# ─────────────────────────────────────────────
+#  РАСПИСАНИЕ  —  /api/doctors/<id>/slots/
+# ─────────────────────────────────────────────
+
+MAX_SLOT_DAYS = 31
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def doctor_slots(request, doctor_id):
+    """
+    GET /api/doctors/<id>/slots/?date=YYYY-MM-DD&days=7
+    Свободные слоты врача с date (по умолчанию сегодня) на days дней.
+    Ответ: {doctor_id, days: [{date, slot_minutes, slots: ["08:00", ...]}]};
+    slots = null — расписание врача не удалось разобрать.
+
+    Сетка дней досчитывается и сохраняется на лету, поэтому date — не
+    раньше сегодня и не дальше SCHEDULE_HORIZON_DAYS, иначе 400.
+    """
+    get_object_or_404(Doctor.objects.only('id'), pk=doctor_id, is_active=True)
+    today, horizon = schedule.horizon()
+    first = today
+    if request.query_params.get('date'):
+        try:
+            first = dt.date.fromisoformat(request.query_params['date'])
+        except ValueError:
+            return Response({'error': 'Параметр date должен быть в формате YYYY-MM-DD'}, status=400)
+        if not today <= first <= horizon:
+            return Response({'error': f'date должен быть между {today} и {horizon}'}, status=400)
+    try:
+        days = int(request.query_params.get('days', 7))
+    except ValueError:
+        return Response({'error': 'days должен быть числом'}, status=400)
+    days = max(1, min(days, MAX_SLOT_DAYS))
+
+    last = min(first + dt.timedelta(days=days - 1), horizon)
+    free = schedule.availability([doctor_id], first, last)[doctor_id]
+    return Response({
+        'doctor_id': doctor_id,
+        'days': [{
+            'date': day.isoformat(),
+            'slot_minutes': item.slot_minutes,
+            'slots': None if item.slots is None else [timezone.localtime(s).strftime('%H:%M') for s in item.slots],
+        } for day, item in free.items()],
+    })
+
+
 # ─────────────────────────────────────────────
 #  DOCTOR PORTAL  —  /api/doctor/...
 # ─────────────────────────────────────────────
 
 def _require_doctor(request):
     """
-    Returns (hospital, doctor_entry, error_response).
-    doctor_entry — запись Doctor, привязанная к аккаунту (может быть None для старых инвайт-кодов).
+    Returns (DoctorContext, error_response).
+    context.doctor — запись Doctor, привязанная к аккаунту (может быть None для старых инвайт-кодов).
     """
     if not request.user.is_authenticated:
-        return None, None, Response({'error': 'Требуется авторизация'}, status=401)
-    try:
-        invite = request.user.doctor_invite  # OneToOne from DoctorInviteCode
-    except Exception:
-        return None, None, Response({'error': 'Аккаунт врача не найден'}, status=403)
-    if not invite.hospital:
-        return None, None, Response({'error': 'Больница не привязана к вашему аккаунту'}, status=403)
-    # Ищем конкретную запись Doctor, привязанную к этому пользователю
-    doctor_entry = Doctor.objects.filter(user=request.user).first()
-    return invite.hospital, doctor_entry, None
+        return None, Response({'error': 'Требуется авторизация'}, status=401)
+    context = doctor_context.get_context(request)
+    if context is None:
+        return None, Response({'error': 'Аккаунт врача не найден'}, status=403)
+    if not context.hospital:
+        return None, Response({'error': 'Больница не привязана к вашему аккаунту'}, status=403)
+    return context, None
 
 
+def _doctor_scope(context):
+    """Записи врача: по его записи Doctor, для старых аккаунтов — по больнице"""
+    if context.doctor:
+        return Q(doctor_id=context.doctor.id)
+    return Q(hospital_id=context.hospital.id)
+
+
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def doctor_me(request):
@@ -241,29 +441,22 @@ def doctor_me(request):
     GET /api/doctor/me/
     Возвращает профиль врача: имя, email, больница, специальность.
     """
-    hospital, doctor_entry, err = _require_doctor(request)
+    context, err = _require_doctor(request)
     if err:
         return err
 
-    invite = request.user.doctor_invite
-    today = timezone.now().date()
-
-    # Если врач привязан к конкретной записи Doctor — считаем только его записи
-    if doctor_entry:
-        today_count = Appointment.objects.filter(
-            doctor=doctor_entry, datetime__date=today, status='confirmed'
-        ).count()
-        total_count = Appointment.objects.filter(doctor=doctor_entry).count()
-    else:
-        today_count = Appointment.objects.filter(
-            hospital=hospital, datetime__date=today, status='confirmed'
-        ).count()
-        total_count = Appointment.objects.filter(hospital=hospital).count()
+    hospital, doctor_entry = context.hospital, context.doctor
+    start, end = day_bounds(timezone.localdate())
+    # Сегодняшние и все записи — одним агрегатом
+    counts = Appointment.objects.filter(_doctor_scope(context)).aggregate(
+        today=Count('id', filter=Q(status='confirmed', datetime__gte=start, datetime__lt=end)),
+        total=Count('id'),
+    )
 
     return Response({
         'name': request.user.get_full_name() or request.user.first_name or request.user.username,
         'email': request.user.email,
-        'specialty': (doctor_entry.specialty if doctor_entry else invite.specialty) or 'Не указана',
+        'specialty': (doctor_entry.specialty if doctor_entry else context.specialty) or 'Не указана',
         'cabinet': doctor_entry.cabinet if doctor_entry else '',
         'work_days': doctor_entry.work_days if doctor_entry else 'Пн-Пт',
         'work_hours': doctor_entry.work_hours if doctor_entry else '08:00-18:00',
@@ -275,62 +468,53 @@ def doctor_me(request):
             'type': hospital.type,
         },
         'stats': {
-            'today': today_count,
-            'total': total_count,
+            'today': counts['today'],
+            'total': counts['total'],
         }
     })
 
 
+DOCTOR_APPOINTMENT_FIELDS = (
+    'id', 'code', 'patient_name', 'specialty', 'datetime', 'queue_position', 'status', 'comment',
+)
+
+
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def doctor_appointments(request):
     """
     GET /api/doctor/appointments/?filter=today|all&status=confirmed|cancelled|completed
-    Записи пациентов к данному врачу.
+    Записи пациентов к данному врачу: одним запросом, email пациента —
+    через JOIN. Список собирается до ответа, чтобы ошибка БД вернула 500,
+    а не обрезанный массив со статусом 200.
     """
-    hospital, doctor_entry, err = _require_doctor(request)
+    context, err = _require_doctor(request)
     if err:
         return err
 
-    invite = request.user.doctor_invite
-
-    # Если есть конкретная Doctor-запись — фильтруем строго по ней
-    if doctor_entry:
-        qs = Appointment.objects.filter(doctor=doctor_entry).order_by('datetime')
-    else:
-        # Fallback: фильтр по больнице + специальности (старые аккаунты без Doctor-записи)
-        qs = Appointment.objects.filter(hospital=hospital).order_by('datetime')
-        if invite.specialty:
-            qs = qs.filter(specialty=invite.specialty)
+    qs = Appointment.objects.filter(_doctor_scope(context)).order_by('datetime')
+    # Fallback: старые аккаунты без Doctor-записи видят записи своей специальности
+    if not context.doctor and context.specialty:
+        qs = qs.filter(specialty=context.specialty)
 
     # Фильтр период
     period = request.GET.get('filter', 'today')
+    today = timezone.localdate()
     if period == 'today':
-        qs = qs.filter(datetime__date=timezone.now().date())
+        qs = qs.on_days(today)
     elif period == 'week':
-        from datetime import timedelta
-        qs = qs.filter(datetime__date__gte=timezone.now().date(),
-                       datetime__date__lte=timezone.now().date() + timedelta(days=7))
+        qs = qs.on_days(today, today + dt.timedelta(days=7))
 
     # Фильтр статус
     status_filter = request.GET.get('status', '')
     if status_filter in ('confirmed', 'cancelled', 'completed'):
         qs = qs.filter(status=status_filter)
 
-    data = []
-    for appt in qs:
-        data.append({
-            'id': appt.id,
-            'code': appt.code,
-            'patient_name': appt.patient_name,
-            'specialty': appt.specialty,
-            'datetime': appt.datetime.isoformat(),
-            'queue_position': appt.queue_position,
-            'status': appt.status,
-            'user_email': appt.user.email if appt.user else None,
-            'comment': appt.comment or '',
-        })
-
+    data = list(qs.values(*DOCTOR_APPOINTMENT_FIELDS, user_email=F('user__email')))
+    for row in data:
+        row['datetime'] = row['datetime'].isoformat()
+        row['comment'] = row['comment'] or ''
     return Response(data)
 
 
@@ -342,20 +526,27 @@ def doctor_update_appointment(request, appointment_id):
     Body: {"status": "completed" | "cancelled" | "confirmed"}
     Врач может менять статус только своих записей.
     """
-    hospital, doctor_entry, err = _require_doctor(request)
+    context, err = _require_doctor(request)
     if err:
         return err
 
-    if doctor_entry:
-        appt = get_object_or_404(Appointment, id=appointment_id, doctor=doctor_entry)
-    else:
-        appt = get_object_or_404(Appointment, id=appointment_id, hospital=hospital)
+    appt = get_object_or_404(Appointment.objects.filter(_doctor_scope(context)), id=appointment_id)
     new_status = request.data.get('status', '')
     if new_status not in ('confirmed', 'cancelled', 'completed'):
         return Response({'error': 'Недопустимый статус'}, status=400)
 
-    appt.status = new_status
-    appt.save(update_fields=['status', 'updated_at'])
+    try:
+        with transaction.atomic():
+            # Отменённую запись вернули — время врача снова нужно занять
+            if new_status == 'confirmed' and appt.status == 'cancelled' and appt.doctor_id:
+                SlotHold.hold(appt.doctor_id, appt.datetime, appointment=appt)
+            cancelled = new_status == 'cancelled' and appt.status != 'cancelled'
+            appt.status = new_status
+            appt.save(update_fields=['status', 'updated_at'])
+    except SlotTaken as e:
+        return Response({'error': str(e)}, status=409)
+    if cancelled:
+        metrics.cancellations.inc(by='doctor')
     return Response({'ok': True, 'id': appt.id, 'status': appt.status})
 
 
@@ -374,41 +565,133 @@ def _require_admin(request):
     return request.user, None
 
 
+def _bool_param(request, name):
+    """?name=true|false → True/False, иначе None (фильтр не задан)"""
+    value = request.query_params.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _int_param(params, name):
+    """(число или None, ответ с ошибкой): пустое значение — None, не число — 400"""
+    value = params.get(name)
+    if value is None or value == '':
+        return None, None
+    try:
+        return int(value), None
+    except (TypeError, ValueError):
+        return None, Response({'error': f'{name} должен быть числом'}, status=400)
+
+
+ADMIN_DOCTOR_FIELDS = (
+    'id', 'full_name', 'specialty', 'cabinet', 'work_days', 'work_hours',
+    'is_active', 'hospital', 'user_id', 'username',
+)
+ADMIN_INVITE_FIELDS = ('id', 'code', 'specialty', 'is_used', 'used_by', 'hospital', 'created_at')
+ADMIN_USER_FIELDS   = ('id', 'name', 'email', 'role', 'joined', 'is_active')
+
+
+def _admin_doctor_row(d):
+    return {
+        'id':         d.id,
+        'full_name':  d.full_name,
+        'specialty':  d.specialty,
+        'cabinet':    d.cabinet,
+        'work_days':  d.work_days,
+        'work_hours': d.work_hours,
+        'is_active':  d.is_active,
+        'hospital':   {'id': d.hospital.id, 'name': d.hospital.name},
+        'user_id':    d.user_id,
+        'username':   d.user.username if d.user else None,
+    }
+
+
+def _admin_invite_row(c):
+    return {
+        'id':        c.id,
+        'code':      c.code,
+        'specialty': c.specialty,
+        'is_used':   c.is_used,
+        'used_by':   c.used_by.get_full_name() or c.used_by.email if c.used_by else None,
+        'hospital':  {'id': c.hospital.id, 'name': c.hospital.name} if c.hospital else None,
+        'created_at': c.created_at.strftime('%d.%m.%Y %H:%M'),
+    }
+
+
+def _admin_user_row(u):
+    return {
+        'id':         u.id,
+        'name':       u.get_full_name() or u.first_name or u.username,
+        'email':      u.email,
+        'role':       getattr(u, 'profile', None) and u.profile.role or 'patient',
+        'joined':     u.date_joined.strftime('%d.%m.%Y'),
+        'is_active':  u.is_active,
+    }
+
+
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def admin_stats(request):
-    """GET /api/admin/stats/ — общая статистика системы."""
+    """GET /api/admin/stats/ — общая статистика системы (один запрос, см. stats.py)."""
     _, err = _require_admin(request)
     if err:
         return err
 
-    return Response({
-        'hospitals':    Hospital.objects.count(),
-        'doctors':      Doctor.objects.filter(is_active=True).count(),
-        'users':        User.objects.filter(profile__role='patient').count(),
-        'appointments': Appointment.objects.count(),
-        'confirmed':    Appointment.objects.filter(status='confirmed').count(),
-        'invite_codes': DoctorInviteCode.objects.filter(is_used=False).count(),
-    })
+    return Response(stats.dashboard_totals())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_stats_history(request):
+    """
+    GET /api/admin/stats/history/?days=14&group=day|hospital|specialty
+    Записи по дням приёма с разбивкой по статусам. Фильтры: hospital_id, specialty.
+    """
+    _, err = _require_admin(request)
+    if err:
+        return err
+
+    group = request.query_params.get('group', 'day')
+    if group not in stats.HISTORY_GROUPS:
+        return Response({'error': f'group: {", ".join(stats.HISTORY_GROUPS)}'}, status=400)
+    try:
+        days = int(request.query_params.get('days', 14))
+    except ValueError:
+        return Response({'error': 'days должен быть числом'}, status=400)
+    days = max(1, min(days, stats.MAX_HISTORY_DAYS))
+    hospital_id, err = _int_param(request.query_params, 'hospital_id')
+    if err:
+        return err
+
+    return Response(stats.history(
+        days=days, group=group,
+        hospital_id=hospital_id,
+        specialty=request.query_params.get('specialty'),
+    ))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def admin_hospitals(request):
-    """GET /api/admin/hospitals/ — список больниц с числом врачей."""
+    """
+    GET /api/admin/hospitals/ — больницы с агрегатами одним запросом:
+    врачи, покрытие специальностей, очередь (всего и на сегодня), записи.
+    """
     _, err = _require_admin(request)
     if err:
         return err
 
-    data = []
-    for h in Hospital.objects.all():
-        data.append({
-            'id':           h.id,
-            'name':         h.name,
-            'type':         h.type,
-            'address':      h.address,
-            'doctor_count': h.doctors.filter(is_active=True).count(),
-        })
+    total_specialties = len(SPECIALTIES_CHOICES)
+    hospitals = Hospital.objects.with_admin_stats().order_by('name').values(
+        'id', 'name', 'type', 'address', 'doctor_count', 'specialty_count',
+        'queue_count', 'queue_today', 'appointment_count',
+    )
+    data = [{
+        **h,
+        'specialty_coverage': round(h['specialty_count'] * 100 / total_specialties),
+    } for h in hospitals]
     return Response(data)
 
 
@@ -416,7 +699,8 @@ def admin_hospitals(request):
 @permission_classes([IsAuthenticated])
 def admin_doctors(request):
     """
-    GET  /api/admin/doctors/  — все врачи
+    GET  /api/admin/doctors/  — врачи постранично (см. pagination.py)
+      Фильтры: q (ФИО, специальность), hospital_id, specialty, is_active
     POST /api/admin/doctors/  — создать врача
       Body: {hospital_id, full_name, specialty, cabinet, work_days, work_hours}
     """
@@ -425,23 +709,29 @@ def admin_doctors(request):
         return err
 
     if request.method == 'GET':
-        qs = Doctor.objects.select_related('hospital', 'user').all()
-        data = [{
-            'id':         d.id,
-            'full_name':  d.full_name,
-            'specialty':  d.specialty,
-            'cabinet':    d.cabinet,
-            'work_days':  d.work_days,
-            'work_hours': d.work_hours,
-            'is_active':  d.is_active,
-            'hospital':   {'id': d.hospital.id, 'name': d.hospital.name},
-            'user_id':    d.user_id,
-            'username':   d.user.username if d.user else None,
-        } for d in qs]
-        return Response(data)
+        qs = Doctor.objects.select_related('hospital', 'user').only(
+            'id', 'full_name', 'specialty', 'cabinet', 'work_days', 'work_hours', 'is_active',
+            'user', 'user__username', 'hospital', 'hospital__name',
+        )
+        q = (request.query_params.get('q') or '').strip()
+        if q:
+            qs = qs.filter(Q(full_name__icontains=q) | Q(specialty__icontains=q))
+        hospital_id, err = _int_param(request.query_params, 'hospital_id')
+        if err:
+            return err
+        if hospital_id is not None:
+            qs = qs.filter(hospital_id=hospital_id)
+        if request.query_params.get('specialty'):
+            qs = qs.filter(specialty=request.query_params['specialty'])
+        is_active = _bool_param(request, 'is_active')
+        if is_active is not None:
+            qs = qs.filter(is_active=is_active)
+        return paginate(request, qs, ('id',), _admin_doctor_row, ADMIN_DOCTOR_FIELDS)
 
     # POST — создать врача
-    hid = request.data.get('hospital_id')
+    hid, err = _int_param(request.data, 'hospital_id')
+    if err:
+        return err
     full_name = (request.data.get('full_name') or '').strip()
     specialty = (request.data.get('specialty') or '').strip()
     if not hid or not full_name or not specialty:
@@ -492,7 +782,10 @@ def admin_doctor_detail(request, doctor_id):
         if field in request.data:
             setattr(doctor, field, request.data[field])
     if 'hospital_id' in request.data:
-        doctor.hospital = get_object_or_404(Hospital, pk=request.data['hospital_id'])
+        hid, err = _int_param(request.data, 'hospital_id')
+        if err:
+            return err
+        doctor.hospital = get_object_or_404(Hospital, pk=hid)
     doctor.save()
     return Response({'ok': True, 'id': doctor.id, 'full_name': doctor.full_name})
 
@@ -501,7 +794,8 @@ def admin_doctor_detail(request, doctor_id):
 @permission_classes([IsAuthenticated])
 def admin_invite_codes(request):
     """
-    GET  /api/admin/invite-codes/ — все коды приглашений
+    GET  /api/admin/invite-codes/ — коды приглашений, новые первыми (постранично)
+      Фильтры: q (код, специальность), hospital_id, is_used
     POST /api/admin/invite-codes/ — сгенерировать новый код
       Body: {hospital_id, specialty}
     """
@@ -510,20 +804,24 @@ def admin_invite_codes(request):
         return err
 
     if request.method == 'GET':
-        qs = DoctorInviteCode.objects.select_related('hospital', 'used_by').all()
-        data = [{
-            'id':        c.id,
-            'code':      c.code,
-            'specialty': c.specialty,
-            'is_used':   c.is_used,
-            'used_by':   c.used_by.get_full_name() or c.used_by.email if c.used_by else None,
-            'hospital':  {'id': c.hospital.id, 'name': c.hospital.name} if c.hospital else None,
-            'created_at': c.created_at.strftime('%d.%m.%Y %H:%M'),
-        } for c in qs]
-        return Response(data)
+        qs = DoctorInviteCode.objects.select_related('hospital', 'used_by')
+        q = (request.query_params.get('q') or '').strip()
+        if q:
+            qs = qs.filter(Q(code__icontains=q) | Q(specialty__icontains=q))
+        hospital_id, err = _int_param(request.query_params, 'hospital_id')
+        if err:
+            return err
+        if hospital_id is not None:
+            qs = qs.filter(hospital_id=hospital_id)
+        is_used = _bool_param(request, 'is_used')
+        if is_used is not None:
+            qs = qs.filter(is_used=is_used)
+        return paginate(request, qs, ('-created_at', '-id'), _admin_invite_row, ADMIN_INVITE_FIELDS)
 
     # POST — создать код
-    hid       = request.data.get('hospital_id')
+    hid, err  = _int_param(request.data, 'hospital_id')
+    if err:
+        return err
     specialty = (request.data.get('specialty') or '').strip()
     hospital  = get_object_or_404(Hospital, pk=hid) if hid else None
 
@@ -559,18 +857,29 @@ def admin_invite_code_detail(request, code_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def admin_users(request):
-    """GET /api/admin/users/ — список всех пользователей."""
+    """
+    GET /api/admin/users/ — пользователи, новые первыми (постранично, см. pagination.py).
+    Фильтры: q (имя, логин, email), role, is_active.
+    """
     _, err = _require_admin(request)
     if err:
         return err
 
-    users = User.objects.select_related('profile').all().order_by('-date_joined')
-    data = [{
-        'id':         u.id,
-        'name':       u.get_full_name() or u.first_name or u.username,
-        'email':      u.email,
-        'role':       getattr(u, 'profile', None) and u.profile.role or 'patient',
-        'joined':     u.date_joined.strftime('%d.%m.%Y'),
-        'is_active':  u.is_active,
-    } for u in users]
-    return Response(data)
+    users = User.objects.select_related('profile').only(
+        'id', 'username', 'first_name', 'last_name', 'email', 'date_joined', 'is_active', 'profile__role',
+    )
+    q = (request.query_params.get('q') or '').strip()
+    if q:
+        users = users.filter(
+            Q(username__icontains=q) | Q(email__icontains=q)
+            | Q(first_name__icontains=q) | Q(last_name__icontains=q)
+        )
+    role = request.query_params.get('role')
+    if role == 'patient':
+        users = users.filter(Q(profile__role='patient') | Q(profile__isnull=True))
+    elif role:
+        users = users.filter(profile__role=role)
+    is_active = _bool_param(request, 'is_active')
+    if is_active is not None:
+        users = users.filter(is_active=is_active)
+    return paginate(request, users, ('-date_joined', '-id'), _admin_user_row, ADMIN_USER_FIELDS)
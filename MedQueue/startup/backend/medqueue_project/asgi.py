@@ -3,6 +3,17 @@ ASGI config for medqueue_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Потоки событий очереди (/api/events/...) — асинхронные view и требуют
+ASGI-сервера. Под WSGI (manage.py runserver) они отвечают 503. Включение:
+
+    pip install -r requirements.txt   # uvicorn
+    QUEUE_EVENTS_SSE=True uvicorn medqueue_project.asgi:application --workers 1
+
+а во фронтенде — localStorage.medqueue_queue_events = 'sse' (иначе живых
+обновлений на страницах статуса записи и врача нет).
+
+Встроенный InMemoryBroker рассылает события только внутри процесса.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
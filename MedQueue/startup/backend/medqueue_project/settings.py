@@ -27,6 +27,10 @@ FRONTEND_DIR = BASE_DIR.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-change-me-in-production')
 
+# Ключ перестановки кодов записей (appointments.codes); по умолчанию — SECRET_KEY.
+# После смены ключа новые коды могут совпасть со старыми — это ловит save().
+CODE_PERMUTATION_KEY = os.getenv('CODE_PERMUTATION_KEY', '')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -49,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым — чтобы в счёт попали и запросы остальных middleware
+    'appointments.querybudget.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -87,9 +93,68 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Параллельные брони ждут блокировку записи, а не падают с "database is locked"
+        'OPTIONS': {'timeout': 20},
+        # Файловая тестовая БД: in-memory SQLite не умеет ждать блокировок между потоками
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Кэш. По умолчанию — в памяти процесса; для нескольких воркеров укажите
+# общий бэкенд, например CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/var/tmp/medqueue_cache
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'medqueue'),
     }
 }
 
+# Сколько секунд живут закэшированные ответы /api/hospitals/ (очередь зависит от времени)
+HOSPITAL_CACHE_TIMEOUT = int(os.getenv('HOSPITAL_CACHE_TIMEOUT', '60'))
+
+# Сколько секунд живёт контекст врача (инвайт, больница, Doctor) для /api/doctor/...
+DOCTOR_CONTEXT_CACHE_TIMEOUT = int(os.getenv('DOCTOR_CONTEXT_CACHE_TIMEOUT', '300'))
+
+# Расписание врачей (appointments/schedule.py): длина слота приёма по умолчанию
+# и на сколько дней вперёд generate_slots предрасчитывает сетку
+SCHEDULE_SLOT_MINUTES = 30
+SCHEDULE_HORIZON_DAYS = 28
+# Сколько секунд держится бронь времени врача (POST /api/appointments/hold/)
+SLOT_HOLD_SECONDS = 300
+# Сколько действующих броней может держать один пользователь или IP
+SLOT_HOLDS_PER_CLIENT = 1
+
+# Поиск ближайших больниц (appointments/geo.py): размер клетки сетки в градусах
+# (0.05° ≈ 5.5 км по широте)
+GEO_CELL_DEGREES = 0.05
+
+# Бюджет SQL-запросов на запрос к API (appointments/querybudget.py): заголовки
+# X-DB-Queries и Server-Timing, строка в лог appointments.querybudget и WARNING,
+# если view превысила бюджет (@query_budget, QUERY_BUDGETS или QUERY_BUDGET_DEFAULT).
+# QUERY_BUDGET_ACTION=raise — исключение вместо предупреждения, для тестов
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_ACTION  = os.getenv('QUERY_BUDGET_ACTION', 'warn')
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', '30'))
+QUERY_BUDGET_SLOWEST = 3   # сколько самых медленных запросов показывать
+QUERY_BUDGETS = {}         # {'doctor_me': 5, 'AppointmentViewSet.create': 12}
+
+# Метрики Prometheus на /metrics (appointments/metrics.py). Prometheus
+# присылает Authorization: Bearer <METRICS_TOKEN>; без токена /metrics
+# открыт только при DEBUG, в продакшене отвечает 404
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+
+# Живые обновления очереди (appointments/events.py). InMemoryBroker — в пределах
+# одного процесса; для нескольких воркеров подключите брокер с общей шиной.
+# SSE-потоки /api/events/... — только под ASGI-сервером (uvicorn medqueue_project.asgi:application).
+# Под WSGI каждый поток занимал бы рабочий поток сервера на QUEUE_EVENTS_STREAM_TIMEOUT секунд
+QUEUE_EVENTS_SSE = os.getenv('QUEUE_EVENTS_SSE', 'False') == 'True'
+QUEUE_EVENTS_BROKER = os.getenv('QUEUE_EVENTS_BROKER', 'appointments.events.InMemoryBroker')
+QUEUE_EVENTS_KEEPALIVE = 15         # секунд между keepalive-комментариями SSE
+QUEUE_EVENTS_STREAM_TIMEOUT = 300   # после этого клиент переподключается
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -138,6 +203,10 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
+    # ScopedRateThrottle: лимиты по пользователю, для гостей — по IP
+    'DEFAULT_THROTTLE_RATES': {
+        'slot_hold': os.getenv('SLOT_HOLD_RATE', '20/min'),
+    },
 }
 
 # SimpleJWT — настройки токенов
@@ -161,6 +230,36 @@ TIME_ZONE = 'Asia/Almaty'
 USE_I18N = True
 USE_TZ = True
 
+# Google reCAPTCHA (appointments/recaptcha.py)
+RECAPTCHA_SECRET_KEY = os.getenv('RECAPTCHA_SECRET_KEY', '6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe')
+RECAPTCHA_VERIFY_URL = os.getenv('RECAPTCHA_VERIFY_URL', 'https://www.google.com/recaptcha/api/siteverify')
+RECAPTCHA_TIMEOUT    = float(os.getenv('RECAPTCHA_TIMEOUT', '2'))  # секунд на проверку
+RECAPTCHA_FAIL_OPEN  = os.getenv('RECAPTCHA_FAIL_OPEN', 'False') == 'True'  # пускать, если Google недоступен
+RECAPTCHA_REPLAY_TTL = 300  # секунд помним использованные токены
+
+# ИИ-ассистент (appointments/assistant.py): провайдеры по приоритету,
+# у всех OpenAI-совместимый API. Провайдер без ключа пропускается.
+AI_PROVIDERS = [
+    {
+        'name': 'kimi-k2',
+        'base_url': 'https://router.huggingface.co/v1',
+        'api_key': os.getenv('HF_TOKEN', '').strip(),
+        'model': 'moonshotai/Kimi-K2-Instruct-0905',
+    },
+    {
+        'name': 'gemini',
+        'base_url': 'https://generativelanguage.googleapis.com/v1beta/openai/',
+        'api_key': os.getenv('GEMINI_API_KEY', '').strip(),
+        'model': 'gemini-1.5-flash',
+    },
+]
+AI_HEDGE_DELAY          = 1.5   # секунд ждём первый токен, прежде чем спросить следующего провайдера
+AI_FIRST_TOKEN_DEADLINE = 8     # дальше — ответ по правилам
+AI_STREAM_DEADLINE      = 30    # предел на весь ответ
+AI_CACHE_TIMEOUT        = 3600  # кэш ответов на одинаковые вопросы
+AI_PROVIDER_TIMEOUT     = float(os.getenv('AI_PROVIDER_TIMEOUT', '10'))  # секунд на соединение и паузу в стриме
+AI_EXECUTOR_WORKERS     = int(os.getenv('AI_EXECUTOR_WORKERS', '16'))    # потоков на запросы к провайдерам
+
 # Email настройки (Yandex Mail)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.yandex.ru')
@@ -169,4 +268,15 @@ EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
-DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER', '')
\ No newline at end of file
+DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER', '')
+
+# Очередь исходящих писем (appointments/mailer.py):
+# 'thread' — фоновый поток в процессе Django, 'command' — manage.py send_outbox --loop
+EMAIL_OUTBOX_WORKER = os.getenv('EMAIL_OUTBOX_WORKER', 'thread')
+EMAIL_OUTBOX_POLL_INTERVAL = 30  # секунд между проверками отложенных писем
+EMAIL_TIMEOUT = 10
+
+# Очистка истёкших кодов подтверждения и сброса пароля (appointments/expiry.py):
+# 'thread' — фоновый поток в процессе Django, 'command' — manage.py sweep_codes --loop или cron
+CODE_SWEEPER = os.getenv('CODE_SWEEPER', 'thread')
+CODE_SWEEP_INTERVAL = int(os.getenv('CODE_SWEEP_INTERVAL', '600'))  # секунд между очистками
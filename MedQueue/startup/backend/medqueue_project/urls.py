@@ -4,6 +4,8 @@ from django.views.generic import RedirectView, TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from appointments.metrics import metrics_view
+
 urlpatterns = [
     path('', RedirectView.as_view(url='/main.html', permanent=False)),
     path('main.html', TemplateView.as_view(template_name='main.html')),
@@ -17,6 +19,7 @@ urlpatterns = [
     path('admin-panel.html', TemplateView.as_view(template_name='admin-panel.html')),
     path('admin/', admin.site.urls),
     path('api/', include('appointments.urls')),
+    path('metrics', metrics_view),
 ]
 
 if settings.DEBUG:
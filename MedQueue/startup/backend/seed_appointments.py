@@ -5,6 +5,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medqueue_project.settings')
 django.setup()
 
 from django.utils import timezone
+from appointments import seeding
 from appointments.models import Doctor, Hospital, Appointment
 from datetime import timedelta
 
@@ -34,24 +35,25 @@ patients = [
     ('Руслан Дюсенов',     'doctor_zarina', 1, 11),
 ]
 
-created = 0
+# Не создаём дубли: уже записанные пары (врач, пациент) — одним запросом
+existing = set(Appointment.objects.filter(doctor__in=doctors.values()).values_list('doctor_id', 'patient_name'))
+
+rows = []
 for patient_name, doc_key, day_offset, hour in patients:
     doc = doctors[doc_key]
-    dt = today.replace(hour=hour) + timedelta(days=day_offset)
-    
-    # Не создаём дубли
-    if Appointment.objects.filter(doctor=doc, patient_name=patient_name).exists():
+    if (doc.id, patient_name) in existing:
         continue
-
-    Appointment.objects.create(
-        doctor=doc,
-        hospital=doc.hospital,
+    rows.append(dict(
+        hospital_id=doc.hospital_id,
+        doctor=doc.full_name,
         specialty=doc.specialty,
         patient_name=patient_name,
-        datetime=dt,
+        datetime=today.replace(hour=hour) + timedelta(days=day_offset),
         status='confirmed',
-    )
-    created += 1
+    ))
+
+# Пачкой: коды, места в очереди, брони слотов и статистика — как при save()
+created = seeding.load_appointments(rows).created
 
 print(f'Создано {created} записей.')
 print()
@@ -4,6 +4,10 @@ const API_BASE = window.location.protocol === 'file:'
   ? (localStorage.getItem('medqueue_api_origin') || DEFAULT_LOCAL_API_ORIGIN)
   : window.location.origin;
 const API_URL = `${API_BASE}/api`;
+// Живые обновления очереди по SSE (/api/events/...) работают только под ASGI-сервером
+// (uvicorn, см. backend/medqueue_project/asgi.py) и включаются вручную:
+// localStorage.medqueue_queue_events = 'sse'. Без них статус обновляется повторной проверкой.
+const QUEUE_EVENTS_SSE = localStorage.getItem('medqueue_queue_events') === 'sse';
 const AUTH_STORAGE_KEY = 'medqueue_current_user';
 
 function getAuthHeaders() {
@@ -16,6 +20,40 @@ function getAuthHeaders() {
   return headers;
 }
 
+// === ИИ-АССИСТЕНТ ===
+// Ответ МедAi приходит потоком (SSE в ответе на POST): текст дописывается в el по мере генерации
+async function streamAiReply(text, history, el) {
+  const res = await fetch(`${API_URL}/ai/chat/`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'ngrok-skip-browser-warning': 'true' },
+    body: JSON.stringify({ message: text, history, stream: true })
+  });
+  if (!res.ok || !res.body) {
+    const data = await res.json();
+    return data.reply || '';
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '', reply = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+    for (const event of events) {
+      if (!event.startsWith('data: ')) continue;
+      const data = JSON.parse(event.slice(6));
+      if (data.delta) {
+        reply += data.delta;
+        el.textContent = reply;
+        if (el.parentElement) el.parentElement.scrollTop = el.parentElement.scrollHeight;
+      }
+    }
+  }
+  return reply;
+}
+
 // Обновляет access-токен через refresh. Возвращает true если успешно.
 async function ensureFreshToken() {
   try {
@@ -649,6 +687,7 @@ async function handleAppointmentSubmit(e) {
         specialty: specialty,
         doctor: doctorId,
         datetime: datetime,
+        hold: doctorId ? window.dtHoldToken : undefined,
         comment: comment || undefined
       })
     });
@@ -736,6 +775,32 @@ async function handleAppointmentSubmit(e) {
 }
 
 // === ПРОВЕРКА СТАТУСА ===
+// Живое место в очереди: один поток событий на открытую запись. Новое место и
+// ожидание приходят в событии и подставляются на странице без запроса статуса;
+// только отмена или завершение записи перерисовывают карточку проверкой
+function subscribeToQueue(code) {
+  if (!QUEUE_EVENTS_SSE || !window.EventSource) return;
+  if (window.queueStream && window.queueStream.code === code) return;
+  if (window.queueStream) window.queueStream.close();
+
+  const stream = new EventSource(`${API_URL}/events/appointments/${code}/`);
+  stream.code = code;
+  stream.onmessage = (message) => {
+    const event = JSON.parse(message.data);
+    if (event.status && event.status !== 'confirmed') {
+      stream.close();
+      window.queueStream = null;
+      document.getElementById('checkForm').dispatchEvent(new Event('submit'));
+      return;
+    }
+    const position = document.getElementById('queuePosition');
+    const wait = document.getElementById('queueWait');
+    if (position && event.queue_position != null) position.textContent = event.queue_position;
+    if (wait && event.estimated_wait_time != null) wait.textContent = `~${event.estimated_wait_time} мин`;
+  };
+  window.queueStream = stream;
+}
+
 function initStatusPage() {
   const checkForm = document.getElementById('checkForm');
   if (!checkForm) return;
@@ -825,9 +890,9 @@ function initStatusPage() {
           <div style="background:#f0fdfa; padding:16px; border-radius:10px; border:1px solid #5eead4; margin-bottom:12px;">
             <div style="text-align:center;">
               <div style="font-size:13px; color:#0f766e; margin-bottom:6px; font-weight:600;">ВАШЕ МЕСТО В ОЧЕРЕДИ</div>
-              <div style="font-size:42px; font-weight:900; color:#0d9488; line-height:1;">${appointment.queue_position}</div>
+              <div id="queuePosition" style="font-size:42px; font-weight:900; color:#0d9488; line-height:1;">${appointment.queue_position}</div>
               <div style="font-size:14px; color:#166534; margin-top:8px;">
-                ⏱️ Примерное ожидание: <strong>~${waitTime} мин</strong>
+                ⏱️ Примерное ожидание: <strong id="queueWait">~${waitTime} мин</strong>
               </div>
             </div>
           </div>
@@ -843,7 +908,9 @@ function initStatusPage() {
           </button>
         </div>
       `;
-      
+
+      subscribeToQueue(appointment.code);
+
     } catch (error) {
       console.error('Ошибка:', error);
       resultDiv.style.display = 'block';